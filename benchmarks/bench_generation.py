@@ -0,0 +1,207 @@
+"""Script-generation benchmarks for every cluster module.
+
+Measures wall time, peak Python memory (tracemalloc) and bytes written for the
+jobArrays / singleJob / setUpPELEFor* generators of mn5, nord4, nord3,
+marenostrum, minotauro, cte_power and local.parallel at increasing job counts.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_generation.py                          # default sizes
+    python benchmarks/bench_generation.py --sizes 1000 10000 --targets mn5
+    python benchmarks/bench_generation.py --save bench.json        # record a baseline
+    python benchmarks/bench_generation.py --compare bench.json     # exit 1 on regression
+
+Generators that write one file per job (setUpPELEFor*) are capped at
+PER_FILE_CAP jobs unless --no-caps is given, and memory is only traced up to
+--memory-max jobs (tracemalloc slows allocation-heavy code several times).
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import core, cte_power, local, marenostrum, minotauro, mn5, nord3, nord4
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+PER_FILE_CAP = 10000
+
+
+def _array_jobs(n):
+    return [f"cd /gpfs/scratch/bsc72/campaign/system_{i:07d} && python run.py --seed {i}\n" for i in range(n)]
+
+
+def _array_batch(n):
+    return core.JobBatch(
+        f"cd /gpfs/scratch/bsc72/campaign/system_{i:07d} && python run.py --seed {i}\n" for i in range(n)
+    )
+
+
+def _pele_jobs(n):
+    return [f"cd pele/system_{i:07d}\npython -m pele_platform.main input.yaml\ncd ../..\n" for i in range(n)]
+
+
+def _single_job(n):
+    return "".join(_array_jobs(n))
+
+
+# name -> (job builder, callable(jobs), writes one file per job)
+TARGETS = {
+    "mn5.jobArrays": (_array_jobs, lambda jobs: mn5.jobArrays(
+        jobs, script_name="run.sh", job_name="bench", partition="gp_bscls", time=1), False),
+    "mn5.jobArrays[JobBatch]": (_array_batch, lambda jobs: mn5.jobArrays(
+        jobs, script_name="run.sh", job_name="bench", partition="gp_bscls", time=1), False),
+    "mn5.singleJob": (_single_job, lambda job: mn5.singleJob(
+        job, script_name="run.sh", job_name="bench", partition="gp_bscls", time=1), False),
+    "mn5.setUpPELEForMarenostrum": (_pele_jobs, lambda jobs: mn5.setUpPELEForMarenostrum(
+        jobs, time=1), True),
+    "nord4.jobArrays": (_array_jobs, lambda jobs: nord4.jobArrays(
+        jobs, script_name="run.sh", job_name="bench"), False),
+    "nord4.singleJob": (_single_job, lambda job: nord4.singleJob(
+        job, script_name="run.sh", job_name="bench", partition="bsc_ls"), False),
+    "nord4.setUpPELEForNord4": (_pele_jobs, lambda jobs: nord4.setUpPELEForNord4(jobs), True),
+    "nord3.jobArrays": (_array_jobs, lambda jobs: nord3.jobArrays(
+        jobs, script_name="run.sh", job_name="bench"), False),
+    "nord3.singleJob": (_single_job, lambda job: nord3.singleJob(
+        job, script_name="run.sh", job_name="bench", partition="bsc_ls"), False),
+    "nord3.setUpPELEForNord3": (_pele_jobs, lambda jobs: nord3.setUpPELEForNord3(jobs), True),
+    "marenostrum.jobArrays": (_array_jobs, lambda jobs: marenostrum.jobArrays(
+        jobs, script_name="run.sh", job_name="bench"), False),
+    "marenostrum.singleJob": (_single_job, lambda job: marenostrum.singleJob(
+        job, script_name="run.sh", job_name="bench", partition="bsc_ls"), False),
+    "marenostrum.setUpPELEForMarenostrum": (_pele_jobs, lambda jobs: marenostrum.setUpPELEForMarenostrum(
+        jobs, partition="bsc_ls"), True),
+    "minotauro.jobArrays": (_array_jobs, lambda jobs: minotauro.jobArrays(
+        jobs, script_name="run.sh", job_name="bench"), False),
+    "minotauro.singleJob": (_single_job, lambda job: minotauro.singleJob(
+        job, script_name="run.sh", job_name="bench", partition="bsc_ls"), False),
+    "cte_power.jobArrays": (_array_jobs, lambda jobs: cte_power.jobArrays(
+        jobs, script_name="run.sh", job_name="bench"), False),
+    "local.parallel": (_array_jobs, lambda jobs: local.parallel(jobs, cpus=10), False),
+}
+
+
+def _output_bytes(folder):
+    total = 0
+    for root, _, files in os.walk(folder):
+        for f in files:
+            total += os.path.getsize(os.path.join(root, f))
+    return total
+
+
+def _run_once(target, size, trace_memory):
+    build, generate, _ = TARGETS[target]
+    jobs = build(size)
+    cwd = os.getcwd()
+    folder = tempfile.mkdtemp(prefix="bsc_bench_")
+    try:
+        os.chdir(folder)
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        generate(jobs)
+        seconds = time.perf_counter() - start
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return seconds, peak, _output_bytes(folder)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def runBenchmarks(targets=None, sizes=None, repeat=3, memory_max=100000, caps=True, verbose=True):
+    """
+    Run the generation benchmarks.
+
+    Returns
+    =======
+    dict
+        ``{"<target>@<size>": {"seconds": best wall time, "peak_bytes": peak
+        traced memory or None, "output_bytes": bytes written}}``.
+    """
+
+    if targets is None:
+        targets = list(TARGETS)
+    if sizes is None:
+        sizes = DEFAULT_SIZES
+
+    results = {}
+    for target in targets:
+        per_file = TARGETS[target][2]
+        for size in sizes:
+            if caps and per_file and size > PER_FILE_CAP:
+                continue
+            timings = []
+            for _ in range(repeat):
+                seconds, _, output_bytes = _run_once(target, size, trace_memory=False)
+                timings.append(seconds)
+            peak = None
+            if size <= memory_max:
+                _, peak, _ = _run_once(target, size, trace_memory=True)
+            key = f"{target}@{size}"
+            results[key] = {"seconds": min(timings), "peak_bytes": peak, "output_bytes": output_bytes}
+            if verbose:
+                peak_txt = f"{peak / 2**20:9.2f} MiB" if peak is not None else "        - MiB"
+                print(f"{key:<48}{min(timings):10.3f} s {peak_txt} {output_bytes / 2**20:10.1f} MiB out")
+    return results
+
+
+def compareResults(results, baseline, tolerance=0.2):
+    """
+    Return the regressions of ``results`` against ``baseline``: entries whose
+    time or peak memory grew by more than ``tolerance`` (fractional), or whose
+    output size changed at all.
+    """
+
+    regressions = []
+    for key, current in results.items():
+        if key not in baseline:
+            continue
+        old = baseline[key]
+        for metric in ("seconds", "peak_bytes"):
+            if old.get(metric) and current.get(metric) and current[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{key} {metric}: {old[metric]:.4g} -> {current[metric]:.4g}")
+        if old.get("output_bytes") != current.get("output_bytes"):
+            regressions.append(f"{key} output_bytes: {old.get('output_bytes')} -> {current.get('output_bytes')}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--targets", nargs="+", default=None,
+                        help="Target names or module prefixes (e.g. mn5 nord4.jobArrays)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--memory-max", type=int, default=100000)
+    parser.add_argument("--no-caps", action="store_true")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    targets = None
+    if args.targets:
+        targets = [t for t in TARGETS if any(t == s or t.startswith(s + ".") for s in args.targets)]
+
+    results = runBenchmarks(targets, args.sizes, args.repeat, args.memory_max, not args.no_caps)
+
+    if args.save:
+        with open(args.save, "w") as bf:
+            json.dump(results, bf, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as bf:
+            regressions = compareResults(results, json.load(bf), args.tolerance)
+        for r in regressions:
+            print("REGRESSION " + r)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Inline job arrays vs compressed job payloads vs the Python dispatcher.
+
+For N no-op jobs, generates the array with mn5.jobArrays inline, with
+job_payload and with dispatcher, and reports generation time, bytes on disk
+(script + payload + index + dispatcher files) and the per-task startup time:
+the wall time of ``bash run.sh`` for a few sampled task ids. For the inline
+layout that includes parsing the whole if-chain, for the payload layout
+reading two index entries and decompressing one frame in bash, and for the
+dispatcher the Python start-up, the frame read and the exec.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_job_payload.py --jobs 100000
+    python benchmarks/bench_job_payload.py --jobs 1000000 --codec zstd --frame 256
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import mn5
+
+
+def _jobs(n):
+    # ':' keeps the tasks no-ops, so only the dispatch is timed
+    return (f': "cd /gpfs/scratch/bsc72/campaign/system_{i:07d} && python run.py --seed {i}"\n' for i in range(n))
+
+
+def _disk_bytes(folder):
+    return sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder))
+
+
+def compareFormats(n, codec="gzip", jobs_per_frame=64, sample_tasks=5, verbose=True):
+    """Return {layout: {"generation_s", "bytes", "task_startup_s"}}."""
+
+    tasks = sorted({max(1, n * k // sample_tasks) for k in range(1, sample_tasks + 1)})
+    results = {}
+    payload = {"job_payload": codec, "payload_jobs_per_frame": jobs_per_frame}
+    layouts = (("inline", {}), ("payload", payload), ("dispatcher", dict(payload, dispatcher=sys.executable)))
+    for layout, options in layouts:
+        cwd = os.getcwd()
+        folder = tempfile.mkdtemp(prefix="bsc_payload_")
+        try:
+            os.chdir(folder)
+            start = time.perf_counter()
+            mn5.jobArrays(list(_jobs(n)), script_name="run.sh", job_name="bench", partition="gp_bscls",
+                          time=1, **options)
+            generation = time.perf_counter() - start
+            startup = []
+            for task in tasks:
+                start = time.perf_counter()
+                subprocess.run(["bash", "run.sh"], check=True,
+                               env=dict(os.environ, SLURM_ARRAY_TASK_ID=str(task)))
+                startup.append(time.perf_counter() - start)
+            results[layout] = {
+                "generation_s": generation,
+                "bytes": _disk_bytes(folder),
+                "task_startup_s": sum(startup) / len(startup),
+            }
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(folder, ignore_errors=True)
+
+    if verbose:
+        for layout, r in results.items():
+            print(f"{layout:<11}{n:9d} jobs {r['generation_s']:8.3f} s generation "
+                  f"{r['bytes'] / 2**20:9.2f} MiB {r['task_startup_s'] * 1000:9.1f} ms/task startup")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=100000)
+    parser.add_argument("--codec", default="gzip", choices=["gzip", "zstd"])
+    parser.add_argument("--frame", type=int, default=64, help="Jobs per compressed frame")
+    parser.add_argument("--tasks", type=int, default=5, help="Task ids sampled for the startup time")
+    args = parser.parse_args(argv)
+    compareFormats(args.jobs, args.codec, args.frame, args.tasks)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""Query batching vs one-query-per-task for the blast/hmmer presets.
+
+Compares the array layouts produced by search_batching.batchQueries for a
+synthetic query set: number of array tasks, per-chunk residue balance, and
+the estimated core-hours and makespan, where every task pays the database
+open/index load once (--db-open seconds) plus a per-residue search cost.
+
+When blastp and makeblastdb are on PATH, --real additionally times both
+layouts against a small random BLAST database, so the per-task overhead
+can be measured on the machine instead of assumed.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_query_batching.py --queries 5000 --chunks 50
+    python benchmarks/bench_query_batching.py --queries 200 --chunks 4 --real
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import search_batching
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def syntheticQueries(n, duplicates=0.1, seed=0):
+    """n queries with log-normal lengths (median ~300 aa), a fraction duplicated."""
+    rng = random.Random(seed)
+    queries = {}
+    for i in range(n):
+        if queries and rng.random() < duplicates:
+            queries[f"q{i:06d}"] = rng.choice(list(queries.values()))
+            continue
+        length = max(30, min(3000, int(rng.lognormvariate(5.7, 0.5))))
+        queries[f"q{i:06d}"] = "".join(rng.choice(AMINO_ACIDS) for _ in range(length))
+    return queries
+
+
+def _layout_cost(loads, db_open, rate, slots):
+    """Core-seconds and makespan (LPT over `slots` concurrent tasks) of a layout."""
+    tasks = sorted((db_open + r * rate for r in loads), reverse=True)
+    finish = [0.0] * slots
+    for t in tasks:
+        finish[finish.index(min(finish))] += t
+    return sum(tasks), max(finish)
+
+
+def compareLayouts(queries, n_chunks, db_open=30.0, rate=0.01, slots=100, verbose=True):
+    """Return {layout: {"tasks", "core_hours", "makespan_h", "imbalance"}}."""
+    folder = tempfile.mkdtemp(prefix="bsc_qbatch_")
+    try:
+        start = time.perf_counter()
+        chunks, members = search_batching.batchQueries(queries, n_chunks=n_chunks,
+                                                       chunk_dir=os.path.join(folder, "chunks"))
+        packing_s = time.perf_counter() - start
+        loads = []
+        for chunk in chunks:
+            loads.append(sum(len(s) for _, s in search_batching.readFasta(chunk)))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    single = [len(s) for s in queries.values()]
+    results = {}
+    for layout, task_loads in (("one_per_task", single), ("batched", loads)):
+        core_s, makespan = _layout_cost(task_loads, db_open, rate, slots)
+        mean = sum(task_loads) / len(task_loads)
+        results[layout] = {
+            "tasks": len(task_loads),
+            "core_hours": core_s / 3600,
+            "makespan_h": makespan / 3600,
+            "imbalance": max(task_loads) / mean,
+        }
+    results["batched"]["unique_queries"] = len(members)
+    results["batched"]["packing_s"] = packing_s
+
+    if verbose:
+        for layout, r in results.items():
+            print(f"{layout:<14}{r['tasks']:8d} tasks {r['core_hours']:10.2f} core-h "
+                  f"{r['makespan_h']:8.2f} h makespan  max/mean load {r['imbalance']:.2f}")
+    return results
+
+
+def realRun(queries, n_chunks):
+    """Time blastp for both layouts against a random database (needs BLAST+)."""
+    if not (shutil.which("blastp") and shutil.which("makeblastdb")):
+        print("blastp/makeblastdb not found: skipping the real run")
+        return None
+    folder = tempfile.mkdtemp(prefix="bsc_qbatch_real_")
+    try:
+        db = os.path.join(folder, "db")
+        with open(db + ".fasta", "w") as df:
+            for name, sequence in syntheticQueries(2000, duplicates=0, seed=1).items():
+                df.write(f">{name}\n{sequence}\n")
+        subprocess.run(["makeblastdb", "-in", db + ".fasta", "-dbtype", "prot", "-out", db],
+                       check=True, capture_output=True)
+
+        singles = []
+        for name, sequence in queries.items():
+            path = os.path.join(folder, name + ".fasta")
+            with open(path, "w") as qf:
+                qf.write(f">{name}\n{sequence}\n")
+            singles.append(path)
+        chunks, _ = search_batching.batchQueries(queries, n_chunks=n_chunks,
+                                                 chunk_dir=os.path.join(folder, "chunks"))
+        timings = {}
+        for layout, files in (("one_per_task", singles), ("batched", chunks)):
+            start = time.perf_counter()
+            for f in files:
+                subprocess.run(["blastp", "-query", f, "-db", db, "-outfmt", "6",
+                                "-out", f + ".tsv"], check=True)
+            timings[layout] = time.perf_counter() - start
+            print(f"{layout:<14}{len(files):8d} blastp runs {timings[layout]:10.2f} s")
+        return timings
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--chunks", type=int, default=50)
+    parser.add_argument("--db-open", type=float, default=30.0,
+                        help="Seconds per task to open/load the database index")
+    parser.add_argument("--rate", type=float, default=0.01, help="Search seconds per query residue")
+    parser.add_argument("--slots", type=int, default=100, help="Array tasks running at once")
+    parser.add_argument("--real", action="store_true", help="Also time blastp if BLAST+ is installed")
+    args = parser.parse_args(argv)
+
+    queries = syntheticQueries(args.queries)
+    compareLayouts(queries, args.chunks, args.db_open, args.rate, args.slots)
+    if args.real:
+        realRun(queries, args.chunks)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,3 +6,18 @@ from . import amd
 from . import nord4
 from . import mn5
 from . import tricks
+from . import packing
+from . import layout
+from . import telemetry
+from . import advisor
+from . import environment
+from . import tables
+from . import msa_cache
+from . import search_batching
+from . import gromacs
+from . import core
+from . import payload
+from . import dispatcher
+from . import workflow
+from . import throttle
+from . import licenses
@@ -0,0 +1,230 @@
+import json
+import math
+
+from . import telemetry
+
+# Memory per core of a standard MN5 GPP node (256 GB / 112 cores) and of a
+# highmem node (1 TB / 112 cores), in MB. Requests above the standard share
+# need --constraint=highmem.
+STANDARD_MEM_PER_CPU = 2000
+HIGHMEM_MEM_PER_CPU = 8000
+
+# Default columns for: sacct --parsable2 --format=<SACCT_FORMAT> -j <ids> > usage.txt
+SACCT_FORMAT = "JobID,JobName,State,Elapsed,Timelimit,AllocCPUS,TotalCPU,MaxRSS,ReqMem"
+
+
+def _seconds(value):
+    """Convert sacct [DD-][HH:]MM:SS[.mmm] durations to seconds."""
+    if not value or value in ("UNLIMITED", "Partition_Limit", "INVALID"):
+        return None
+    days = 0
+    if "-" in value:
+        d, value = value.split("-", 1)
+        days = int(d)
+    parts = [float(p) for p in value.split(":")]
+    while len(parts) < 3:
+        parts.insert(0, 0.0)
+    return days * 86400 + parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+
+def _megabytes(value):
+    """Convert sacct sizes (MaxRSS 1234K, ReqMem 2000Mc / 4G) to MB."""
+    if not value:
+        return None
+    value = value.rstrip("cn")
+    units = {"K": 1 / 1024, "M": 1, "G": 1024, "T": 1024 * 1024}
+    if value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value) / (1024 * 1024)
+
+
+def readSacct(sacct_file):
+    """
+    Read saved ``sacct --parsable2`` output into one record per job/array task.
+
+    Step lines (``<id>.batch``, ``<id>.0``) are merged into their job: the
+    largest MaxRSS of any step is kept, as sacct only reports it per step.
+
+    Returns
+    =======
+    list of dict
+        Keys: job_id, job_name, state, elapsed_s, timelimit_s, cpus,
+        cpu_seconds, max_rss_mb and req_mem_mb (per node, or per cpu when
+        req_mem_per_cpu is True).
+    """
+
+    records = {}
+    with open(sacct_file) as sf:
+        header = sf.readline().strip().split("|")
+        for line in sf:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            row = dict(zip(header, line.split("|")))
+            job_id = row.get("JobID", "")
+            parent = job_id.split(".")[0]
+            record = records.setdefault(parent, {"job_id": parent, "max_rss_mb": None})
+            if job_id == parent:
+                req_mem = row.get("ReqMem", "")
+                record.update({
+                    "job_name": row.get("JobName"),
+                    "state": (row.get("State") or "").split()[0],
+                    "elapsed_s": _seconds(row.get("Elapsed")),
+                    "timelimit_s": _seconds(row.get("Timelimit")),
+                    "cpus": int(row.get("AllocCPUS") or 0) or None,
+                    "cpu_seconds": _seconds(row.get("TotalCPU")),
+                    "req_mem_mb": _megabytes(req_mem),
+                    "req_mem_per_cpu": req_mem.endswith("c"),
+                })
+            rss = _megabytes(row.get("MaxRSS"))
+            if rss is not None and (record["max_rss_mb"] is None or rss > record["max_rss_mb"]):
+                record["max_rss_mb"] = rss
+    return [r for r in records.values() if "job_name" in r]
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    index = min(int(math.ceil(q * len(values))) - 1, len(values) - 1)
+    return values[max(index, 0)]
+
+
+def _walltime(seconds):
+    """Round a duration up to the next quarter hour, as an (hours, minutes) tuple."""
+    minutes = int(math.ceil(seconds / 60 / 15) * 15) or 15
+    return divmod(minutes, 60)
+
+
+def recommendResources(sacct_file=None, telemetry_dir=None, programs=None, headroom=1.2):
+    """
+    Recommend per-preset resources from past usage.
+
+    Parameters
+    ==========
+    sacct_file : str
+        Saved ``sacct --parsable2 --format=SACCT_FORMAT`` output.
+    telemetry_dir : str
+        Directory of per-task telemetry CSVs (mn5.jobArrays(telemetry=...)).
+    programs : dict
+        Maps sacct job names to program presets. Job names not listed are used
+        as the preset name themselves. Telemetry files carry their preset.
+    headroom : float
+        Safety factor applied on top of the observed peaks (default 1.2).
+
+    Returns
+    =======
+    dict
+        ``{program: {"cpus_per_task", "mem_per_cpu", "highmem", "time", "mps",
+        "tasks", "notes"}}``. Values that the data cannot support are None.
+        mem_per_cpu is in MB and time an (hours, minutes) tuple, ready to be
+        passed to mn5.jobArrays (directly or through its advice= argument).
+    """
+
+    if sacct_file is None and telemetry_dir is None:
+        raise ValueError("Give a sacct_file, a telemetry_dir, or both.")
+    if programs is None:
+        programs = {}
+
+    usage = {}
+
+    def entry(program):
+        return usage.setdefault(program, {
+            "cores": [], "rss_per_task": [], "elapsed": [], "timeouts": 0,
+            "timelimits": [], "gpu_util": [], "tasks": 0,
+        })
+
+    if sacct_file is not None:
+        for r in readSacct(sacct_file):
+            e = entry(programs.get(r["job_name"], r["job_name"]))
+            if r["state"] == "TIMEOUT":
+                e["timeouts"] += 1
+                if r["timelimit_s"]:
+                    e["timelimits"].append(r["timelimit_s"])
+                continue
+            if r["state"] != "COMPLETED":
+                continue
+            e["tasks"] += 1
+            if r["elapsed_s"]:
+                e["elapsed"].append(r["elapsed_s"])
+                if r["cpu_seconds"] is not None:
+                    e["cores"].append(r["cpu_seconds"] / r["elapsed_s"])
+            if r["max_rss_mb"] is not None:
+                e["rss_per_task"].append(r["max_rss_mb"])
+
+    if telemetry_dir is not None:
+        for program, summary in telemetry.summarizeTelemetry(telemetry_dir).items():
+            e = entry(program)
+            for task in summary["per_task"]:
+                e["tasks"] += 1
+                e["elapsed"].append(task["elapsed_s"])
+                e["rss_per_task"].append(task["peak_rss_mb"])
+                if task["cpu_efficiency"] is not None:
+                    e["cores"].append(task["cpu_efficiency"] * task["cpus"])
+                if task["gpu_util"] is not None:
+                    e["gpu_util"].append(task["gpu_util"])
+
+    advice = {}
+    for program, e in usage.items():
+        notes = []
+        cpus = None
+        if e["cores"]:
+            cpus = max(int(math.ceil(_percentile(e["cores"], 0.9) * headroom)), 1)
+
+        mem_per_cpu = None
+        highmem = False
+        if e["rss_per_task"]:
+            peak = max(e["rss_per_task"]) * headroom
+            mem_per_cpu = int(math.ceil(peak / (cpus or 1)))
+            if mem_per_cpu > STANDARD_MEM_PER_CPU:
+                highmem = True
+                if mem_per_cpu > HIGHMEM_MEM_PER_CPU:
+                    # Memory bound: ask for more cores to reach the memory.
+                    cpus = int(math.ceil(peak / HIGHMEM_MEM_PER_CPU))
+                    mem_per_cpu = HIGHMEM_MEM_PER_CPU
+                    notes.append(
+                        f"peak RSS {peak / 1024:.0f} GB needs {cpus} cpus on highmem nodes"
+                    )
+
+        time = None
+        if e["elapsed"]:
+            seconds = _percentile(e["elapsed"], 0.95) * headroom
+            if e["timeouts"]:
+                seconds = max(seconds, max(e["timelimits"] or [0]) * 1.5)
+                notes.append(f"{e['timeouts']} task(s) hit their time limit")
+            time = _walltime(seconds)
+        elif e["timeouts"]:
+            notes.append(f"all {e['timeouts']} task(s) timed out; no completed runtime to size on")
+
+        mps = None
+        if e["gpu_util"]:
+            util = sum(e["gpu_util"]) / len(e["gpu_util"])
+            # Pack processes until the GPU is ~80% busy (MPS efficiency knee).
+            mps = max(1, min(8, int(80 // max(util, 1))))
+            if mps > 1:
+                notes.append(f"mean GPU utilisation {util:.0f}%: pack {mps} jobs per GPU")
+
+        advice[program] = {
+            "cpus_per_task": cpus,
+            "mem_per_cpu": mem_per_cpu,
+            "highmem": highmem,
+            "time": time,
+            "mps": mps,
+            "tasks": e["tasks"],
+            "notes": notes,
+        }
+    return advice
+
+
+def saveAdvice(advice, advice_file):
+    """Write recommendResources() output as JSON (for mn5.jobArrays(advice=...))."""
+    with open(advice_file, "w") as af:
+        json.dump(advice, af, indent=2)
+
+
+def loadAdvice(advice_file):
+    """Read advice written by saveAdvice(), restoring walltimes as tuples."""
+    with open(advice_file) as af:
+        advice = json.load(af)
+    for entry in advice.values():
+        if entry.get("time") is not None:
+            entry["time"] = tuple(entry["time"])
+    return advice
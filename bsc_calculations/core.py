@@ -0,0 +1,650 @@
+"""
+Cluster-agnostic pieces of the script generators.
+
+Every cluster module used to repeat the same input checks, walltime clamping
+and array-script writing with small divergences. The shared behaviour lives
+here, driven by one profile per cluster (PROFILES): partitions and walltime
+caps for every cluster, plus the ordered #SBATCH directives and program
+presets of the clusters whose jobArrays is fully table-driven (minotauro,
+cte_power and amd, through jobArrays below).
+
+mn5, nord4, nord3 and marenostrum still write their own headers and
+presets (their presets also rewrite jobs, partitions and walltimes), but
+take the shared steps from here: copyLists, checkModules, groupJobs (with
+the concurrency executor), clampTime, arraySpec (with the throttle), and
+the task layout hooks (taskLayout, taskRange, writeTaskBody: parameter
+tables and compressed job payloads) and checkTelemetry, so every cluster
+gets them. Features tied to MN5 hardware or its software stack (job steps,
+MPS, staged weights, the dispatcher, environment snapshots, conda-pack,
+batched inference) stay in mn5.jobArrays.
+"""
+import os
+import re
+from array import array
+
+from . import packing
+from . import payload
+from . import tables
+from . import telemetry as task_telemetry
+from . import throttle as task_throttle
+
+# ── Cluster profiles ───────────────────────────────────────────────────────────
+# time_limits: partition -> (cap in hours, name used in the clamping message).
+# fixed_hours: partitions whose array jobs always get this walltime.
+# directives: ordered #SBATCH templates of table-driven jobArrays; a line is
+# written only when every field it uses is set (see directives()). A
+# (template, requires) pair is also written only when the fields named in
+# requires are set, e.g. the mail type only with a mail address.
+# presets: program -> modules / pythonpath appended, other keys override.
+PROFILES = {
+    "mn5": {
+        "partitions": ["acc_debug", "acc_bscls", "gp_debug", "gp_bscls"],
+        "time_limits": {
+            "gp_debug": (2, "debug"),
+            "acc_debug": (2, "debug"),
+            "gp_bscls": (48, "bsc_ls"),
+            "acc_bscls": (48, "bsc_ls"),
+        },
+    },
+    "nord4": {
+        "partitions": ["debug", "bsc_ls"],
+        "time_limits": {"debug": (2, "debug"), "bsc_ls": (48, "bsc_ls")},
+    },
+    "nord3": {
+        "partitions": ["debug", "bsc_ls"],
+        "time_limits": {"debug": (2, "debug"), "bsc_ls": (48, "bsc_ls")},
+    },
+    "marenostrum": {
+        "partitions": ["debug", "bsc_ls"],
+        "time_limits": {"debug": (2, "debug"), "bsc_ls": (48, "bsc_ls")},
+        "fixed_hours": {"debug": 2},
+    },
+    "minotauro": {
+        "partitions": ["debug", "bsc_ls"],
+        "time_limits": {"bsc_ls": (48, "bsc_ls")},
+        "fixed_hours": {"debug": 1},
+        "directives": [
+            "--job-name={job_name}",
+            "--qos={partition}",
+            "--time={time}:00:00",
+            "--cpus-per-task={cpus_per_task}",
+            "--nodes={nodes}",
+            "--gres gpu:{gpus}",
+            "--ntasks={ntasks}",
+            "--array={array}",
+            "--constraint={constraint}",
+            "--output={output}_%a_%A.out",
+            "--error={output}_%a_%A.err",
+            "--mail-user={mail}",
+            ("--mail-type=END,FAIL", "mail"),
+        ],
+        "presets": {
+            "openmm": {
+                "modules": ["openmpi/3.0.0", "python/3.6.5"],
+                "pythonpath": ["/home/bsc72/bsc72523/Programs/sbm-openmm/compiled/lib/python3.6/site-packages"],
+            },
+            "alphafold": {
+                "purge": True,
+                "modules": ["singularity", "alphafold"],
+                "cpus_per_task": 16,
+                "constraint": "k80",
+            },
+        },
+    },
+    "cte_power": {
+        "partitions": ["debug", "bsc_ls"],
+        "time_limits": {"bsc_ls": (48, "bsc_ls")},
+        "fixed_hours": {"debug": 2},
+        "directives": [
+            "--job-name={job_name}",
+            "--qos={partition}",
+            "--time={time}:00:00",
+            "--cpus-per-task={cpus_per_task}",
+            "--nodes={nodes}",
+            "--gres gpu:{gpus}",
+            "--ntasks={ntasks}",
+            "--array={array}",
+            "--output={output}_%a_%A.out",
+            "--error={output}_%a_%A.err",
+            "--mail-user={mail}",
+            ("--mail-type=END,FAIL", "mail"),
+        ],
+        "presets": {
+            "openmm": {
+                "modules": ["openmpi/3.0.0", "python/3.6.5"],
+                "pythonpath": ["/gpfs/projects/bsc72/sbmOpenMM/compiled/lib/python3.6/site-packages/"],
+            },
+            "alphafold": {
+                "purge": True,
+                "modules": ["singularity", "alphafold/2.1.0_tf2.6.0"],
+                "pythonpath": ["/opt/conda/lib/python3.7/site-packages"],
+            },
+            "gromacs": {"modules": ["cuda/10.2", "gromacs/2018.4"]},
+            "gromacs2020": {
+                "modules": [
+                    "gcc/7.3.0",
+                    "cuda",
+                    "openmpi",
+                    "plumed/2.7.0",
+                    "fftw/3.3.7",
+                    "gromacs/2020.4-plumed.2.7.0-fftw3.3.7",
+                ]
+            },
+        },
+    },
+    "amd": {
+        "partitions": ["debug", "bsc_ls"],
+        "time_limits": {"bsc_ls": (48, "bsc_ls")},
+        "fixed_hours": {"debug": 2},
+        "directives": [
+            "--job-name={job_name}",
+            "--qos={partition}",
+            "--time={time}:00:00",
+            "--constraint={constraint}",
+            "-n {cpus}",
+            "--mem-per-cpu {mem_per_cpu}",
+            "-c {threads}",
+            "--array={array}",
+            "--output={output}_%a_%A.out",
+            "--error={output}_%a_%A.err",
+            "--mail-user={mail}",
+            ("--mail-type=END,FAIL", "mail"),
+        ],
+        "presets": {
+            "schrodinger": {
+                "constraint": "schrodinger",
+                "exports": [
+                    "PATH=$PATH:/gpfs/projects/bsc72/Programs/schrodinger2024-1",
+                    "SCHRODINGER=/gpfs/projects/bsc72/Programs/schrodinger2024-1",
+                ],
+            },
+        },
+    },
+}
+
+
+def copyLists(*values):
+    """
+    Return the arguments with every list copied, so the presets can extend
+    modules, exports, paths... without touching the caller's lists.
+    """
+    return tuple(list(value) if isinstance(value, list) else value for value in values)
+
+
+def checkModules(modules=None, unload_modules=None, conda_env=None):
+    """The module/conda argument checks shared by every generator."""
+    if modules is not None:
+        if isinstance(modules, str):
+            modules = [modules]
+        if not isinstance(modules, list):
+            raise ValueError(
+                "Modules to load must be given as a list or as a string (for loading one module only)"
+            )
+    if unload_modules is not None:
+        if isinstance(unload_modules, str):
+            unload_modules = [unload_modules]
+        if not isinstance(unload_modules, list):
+            raise ValueError(
+                "Modules to unload must be given as a list or as a string (for unloading one module only)"
+            )
+    if conda_env is not None and not isinstance(conda_env, str):
+        raise ValueError("The conda environment must be given as a string")
+    return modules, unload_modules
+
+
+def groupJobs(jobs, group_jobs_by, concurrency=None):
+    """
+    Bundle consecutive commands into one array task each (one command per
+    line). None returns the jobs unchanged. With ``concurrency`` the commands
+    of a bundle run through the bounded executor of packing.concurrentBlock
+    (whose helpers, packing.concurrentHelpers, the script must define).
+    """
+    if concurrency is not None:
+        if not isinstance(group_jobs_by, int):
+            raise ValueError("concurrency runs the commands bundled by group_jobs_by; set group_jobs_by as well.")
+        packing.checkConcurrency(concurrency)
+        jobs = list(jobs)
+        return [
+            packing.concurrentBlock(jobs[start : start + group_jobs_by], first=start + 1)
+            for start in range(0, len(jobs), group_jobs_by)
+        ]
+    if group_jobs_by is None:
+        return jobs
+    if not isinstance(group_jobs_by, int):
+        raise ValueError("You must give an integer to group jobs by this number.")
+    grouped = []
+    group = []
+    for job in jobs:
+        group.append(job.rstrip("\n") + "\n")
+        if len(group) == group_jobs_by:
+            grouped.append("".join(group))
+            group = []
+    if group:
+        grouped.append("".join(group))
+    return grouped
+
+
+def clampTime(cluster, partition, time):
+    """
+    Return the walltime as (hours, minutes), defaulting to and capped at the
+    partition limit of the cluster profile. time is None, hours or (hours,
+    minutes); minutes beyond 59 are carried into the hours.
+    """
+    if isinstance(time, int) and not isinstance(time, bool):
+        time = (time, 0)
+    if time is not None:
+        if not isinstance(time, (tuple, list)) or len(time) != 2:
+            raise ValueError("time must be None, int (hours), or (hours, minutes)")
+        hours, minutes = divmod(max(int(time[0]), 0) * 60 + max(int(time[1]), 0), 60)
+        time = (hours, minutes)
+    limits = PROFILES[cluster]["time_limits"]
+    if partition not in limits:
+        return time
+    cap, label = limits[partition]
+    if time is None:
+        return (cap, 0)
+    if time[0] * 60 + time[1] > cap * 60:
+        print(f"Setting time at maximum allowed for the {label} partition ({cap} hours).")
+        return (cap, 0)
+    return time
+
+
+def clampHours(cluster, partition, time):
+    """Whole-hour walltime of the array generators that take hours only."""
+    profile = PROFILES[cluster]
+    if partition in profile.get("fixed_hours", {}):
+        return profile["fixed_hours"][partition]
+    cap, label = profile["time_limits"].get(partition, (None, None))
+    if cap is not None and time > cap:
+        print(f"Setting time at maximum allowed for the {label} partition ({cap} hours).")
+        return cap
+    return time
+
+
+# "cd <parent>/" of a job's leading cd, shared by the jobs of a campaign that
+# differ only in the last directory (interned by JobBatch).
+_PREFIX = re.compile(r"cd\s+\S*/(?=[^/\s]+/?(?:\s|$))")
+
+
+class JobBatch:
+    """
+    Compact job list for large campaigns.
+
+    Jobs are stored column-wise: the leading ``cd <dir>/`` of each job is kept
+    once in an interned prefix table and referenced by a 4-byte index, and
+    only the remainder of the job is stored per job. Rewrites (``replace``,
+    ``rewrite``) return a view recording the rewrite instead of copying the
+    list; it is applied once, to each job as it is iterated, i.e. while the
+    script is streamed to disk. Views and slices share the prefix table and
+    the job strings.
+
+    JobBatch works wherever the generators take a job list (it iterates to
+    plain strings), e.g. ``mn5.jobArrays(core.JobBatch(job_generator), ...)``.
+    """
+
+    __slots__ = ("_prefixes", "_prefix_ids", "_prefix_table", "_bodies", "_rewrites")
+
+    def __init__(self, jobs=()):
+        self._prefixes = []
+        self._prefix_table = {}
+        self._prefix_ids = array("I")
+        self._bodies = []
+        self._rewrites = []
+        self.extend(jobs)
+
+    def append(self, job):
+        match = _PREFIX.match(job)
+        prefix = match.group(0) if match else ""
+        index = self._prefix_table.get(prefix)
+        if index is None:
+            index = self._prefix_table[prefix] = len(self._prefixes)
+            self._prefixes.append(prefix)
+        self._prefix_ids.append(index)
+        self._bodies.append(job[len(prefix) :])
+
+    def extend(self, jobs):
+        for job in jobs:
+            self.append(job)
+
+    def _view(self, prefix_ids, bodies, rewrite=None):
+        view = JobBatch.__new__(JobBatch)
+        view._prefixes = self._prefixes
+        view._prefix_table = self._prefix_table
+        view._prefix_ids = prefix_ids
+        view._bodies = bodies
+        view._rewrites = list(self._rewrites)
+        if rewrite is not None:
+            view._rewrites.append(rewrite)
+        return view
+
+    def replace(self, old, new):
+        """
+        Defer ``job.replace(old, new)`` to emission time. Returns a view of the
+        same jobs with the rewrite added; the batch itself is left untouched.
+        """
+        return self._view(self._prefix_ids, self._bodies, (old, new))
+
+    def rewrite(self, function):
+        """Defer ``job = function(job)`` to emission time; returns a view (see replace)."""
+        return self._view(self._prefix_ids, self._bodies, function)
+
+    def _render(self, i):
+        job = self._prefixes[self._prefix_ids[i]] + self._bodies[i]
+        for rewrite in self._rewrites:
+            job = rewrite(job) if callable(rewrite) else job.replace(*rewrite)
+        return job
+
+    def __len__(self):
+        return len(self._bodies)
+
+    def __iter__(self):
+        for i in range(len(self._bodies)):
+            yield self._render(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._view(self._prefix_ids[index], self._bodies[index])
+        if index < 0:
+            index += len(self._bodies)
+        if not 0 <= index < len(self._bodies):
+            raise IndexError("JobBatch index out of range")
+        return self._render(index)
+
+
+def replaceInJobs(jobs, old, new):
+    """
+    ``job.replace(old, new)`` for every job: deferred on a JobBatch (a view
+    is returned), a new list otherwise. The caller's jobs are left untouched.
+    """
+    if isinstance(jobs, JobBatch):
+        return jobs.replace(old, new)
+    return [job.replace(old, new) for job in jobs]
+
+
+def writeArrayTasks(sf, jobs, first=1, buffer_jobs=4096):
+    """Stream the array-task blocks of jobs to an open file, buffer_jobs at a time."""
+    parts = []
+    for i, job in enumerate(jobs):
+        parts.append("if [[ $SLURM_ARRAY_TASK_ID = " + str(i + first) + " ]]; then\n")
+        parts.append(job)
+        parts.append("fi\n\n" if job.endswith("\n") else "\nfi\n\n")
+        if len(parts) >= 3 * buffer_jobs:
+            sf.write("".join(parts))
+            parts = []
+    sf.write("".join(parts))
+
+
+def arrayTasks(jobs, first=1):
+    """The ``if [[ $SLURM_ARRAY_TASK_ID = N ]]`` blocks of an array script."""
+    parts = []
+    for i, job in enumerate(jobs):
+        parts.append("if [[ $SLURM_ARRAY_TASK_ID = " + str(i + first) + " ]]; then\n")
+        parts.append(job)
+        parts.append("fi\n\n" if job.endswith("\n") else "\nfi\n\n")
+    return "".join(parts)
+
+
+def _is_set(value):
+    """None, False and "" leave a directive out; any other value (0 included) is written."""
+    return value is not None and value is not False and value != ""
+
+
+def directives(templates, **fields):
+    """
+    Format the #SBATCH lines whose fields are all set. A template may be a
+    (template, requires) pair: the line is then also left out unless the
+    field(s) named in requires are set.
+    """
+    given = {k: v for k, v in fields.items() if _is_set(v)}
+    lines = []
+    for template in templates:
+        requires = ()
+        if isinstance(template, tuple):
+            template, requires = template
+            requires = (requires,) if isinstance(requires, str) else requires
+        if any(field not in given for field in requires):
+            continue
+        try:
+            line = template.format(**given)
+        except KeyError:
+            continue
+        lines.append("#SBATCH " + line + "\n")
+    return "".join(lines)
+
+
+# Options of jobArrays every cluster generator takes (see featureOptions).
+FEATURES = (
+    "concurrency",
+    "throttle",
+    "throttle_demands",
+    "jobs_range",
+    "parameter_table",
+    "job_payload",
+    "payload_jobs_per_frame",
+    "telemetry",
+    "telemetry_dir",
+)
+
+
+def featureOptions(features):
+    """Check the shared options a cluster wrapper forwards to jobArrays."""
+    unknown = sorted(set(features) - set(FEATURES))
+    if unknown:
+        raise ValueError("Unknown jobArrays option(s): " + ", ".join(unknown) + ". Shared options are: "
+                         + ", ".join(FEATURES))
+    return features
+
+
+def checkTelemetry(telemetry):
+    """The sampling interval of a telemetry option (True is 30 s), or None."""
+    if telemetry is True:
+        return 30
+    if telemetry is None or telemetry is False:
+        return None
+    if not isinstance(telemetry, int) or telemetry < 1:
+        raise ValueError("telemetry must be True or a positive sampling interval in seconds.")
+    return telemetry
+
+
+def taskLayout(jobs, job_name, script_name=None, jobs_range=None, group_jobs_by=None,
+               parameter_table=None, job_payload=None, payload_jobs_per_frame=64):
+    """
+    Resolve how each array task finds its job: one inline block per task
+    (default), row N of a parameter table (tables.prepareParameterTable) or
+    job N of a compressed payload (payload.writeJobPayload). The table
+    (<job_name>_parameters.tsv) and the payload are written next to
+    script_name.
+
+    Returns
+    =======
+    (dict, tuple)
+        The layout for taskRange() and writeTaskBody(), and the jobs_range
+        left for the caller to slice the jobs with (a parameter table takes
+        its rows from jobs_range itself).
+    """
+
+    if job_payload and parameter_table is not None:
+        raise ValueError("job_payload is mutually exclusive with parameter_table.")
+    if (job_payload or parameter_table is not None) and job_name is None:
+        raise ValueError("job_name == None. You need to specify a name for the job")
+    tasks = {"table": None, "range": None, "payload": None, "frame": payload_jobs_per_frame}
+
+    if parameter_table is not None:
+        if len(jobs) != 1:
+            raise ValueError("With parameter_table, give exactly one command template as jobs.")
+        if group_jobs_by is not None:
+            raise ValueError("parameter_table is mutually exclusive with group_jobs_by.")
+        table_file, columns, rows = tables.prepareParameterTable(
+            parameter_table,
+            table_file=os.path.join(os.path.dirname(script_name or ""), f"{job_name}_parameters.tsv"),
+        )
+        if rows == 0:
+            raise ValueError(f"The parameter table {table_file} has no rows.")
+        tasks["table"] = (table_file, columns)
+        tasks["range"] = (1, rows)
+        if jobs_range is not None:
+            tasks["range"] = (jobs_range[0], min(jobs_range[1], rows))
+            jobs_range = None
+
+    if job_payload:
+        codec = "gzip" if job_payload is True else job_payload
+        if codec not in payload.DECOMPRESS:
+            raise ValueError(f"job_payload must be True, 'gzip' or 'zstd', got {job_payload!r}")
+        tasks["payload"] = codec
+
+    return tasks, jobs_range
+
+
+def taskRange(tasks, jobs):
+    """First and last array task of a taskLayout()."""
+    return tasks["range"] or (1, len(jobs))
+
+
+def payloadFile(script_name, job_name, codec):
+    """Path of the job payload of a script: <job_name>_jobs.gz (or .zst) next to it."""
+    return os.path.join(os.path.dirname(script_name), job_name + "_jobs" + payload.EXTENSIONS[codec])
+
+
+def writeTaskBody(sf, jobs, tasks, script_name, job_name):
+    """
+    Write the per-task part of an array script for a taskLayout(): the
+    parameter-table row lookup, the payload frame lookup (the payload is
+    written next to the script) or one block per array task.
+    """
+
+    if tasks["table"] is not None:
+        sf.write(tables.tableTaskBlock(jobs[0], *tasks["table"]))
+        sf.write("\n")
+    elif tasks["payload"] is not None:
+        payload_file = payloadFile(script_name, job_name, tasks["payload"])
+        payload.writeJobPayload(jobs, payload_file, codec=tasks["payload"], jobs_per_frame=tasks["frame"])
+        sf.write(payload.payloadTaskBlock(payload_file, tasks["payload"], tasks["frame"]))
+        sf.write("\n")
+    else:
+        writeArrayTasks(sf, jobs)
+
+
+def arraySpec(first, last, throttle=None, demands=None):
+    """The value of --array for tasks first..last, with the %N of a throttle."""
+    return str(first) + "-" + str(last) + task_throttle.arraySuffix(throttle, last - first + 1, demands)
+
+
+def jobArrays(
+    cluster,
+    jobs,
+    script_name=None,
+    job_name=None,
+    output=None,
+    partition=None,
+    time=48,
+    program=None,
+    modules=None,
+    unload_modules=None,
+    conda_env=None,
+    pythonpath=None,
+    exports=None,
+    purge=False,
+    group_jobs_by=None,
+    concurrency=None,
+    throttle=None,
+    throttle_demands=None,
+    jobs_range=None,
+    parameter_table=None,
+    job_payload=None,
+    payload_jobs_per_frame=64,
+    telemetry=None,
+    telemetry_dir="telemetry",
+    blocks=None,
+    **resources,
+):
+    """
+    Write a job array script from a cluster profile.
+
+    Applies the profile's program preset, checks the arguments, clamps the
+    walltime, writes the profile directives (resources fill their fields),
+    then purge / module unload / load, conda activation, PYTHONPATH and
+    exports, the task bodies and the conda deactivation.
+    concurrency runs the commands of each group_jobs_by bundle concurrently
+    (see groupJobs); throttle adds a %N limit to the array (see
+    throttle.arrayThrottle); jobs_range keeps jobs (or table rows) first to
+    last; parameter_table and job_payload replace the inline task blocks by
+    a table row or a compressed payload lookup (see taskLayout); telemetry
+    samples each task's resource use (see telemetry.samplerBlock); blocks
+    are extra bash blocks (helper functions) written after the exports.
+    """
+
+    profile = PROFILES[cluster]
+    if isinstance(jobs, str):
+        jobs = [jobs]
+    elif not isinstance(jobs, (list, JobBatch)):
+        jobs = list(jobs)
+
+    if job_name is None:
+        raise ValueError("job_name == None. You need to specify a name for the job")
+    if output is None:
+        output = job_name
+
+    telemetry = checkTelemetry(telemetry)
+    tasks, jobs_range = taskLayout(jobs, job_name, script_name, jobs_range, group_jobs_by,
+                                   parameter_table, job_payload, payload_jobs_per_frame)
+    jobs = groupJobs(jobs, group_jobs_by, concurrency)
+    if jobs_range is not None:
+        jobs = jobs[jobs_range[0] - 1 : jobs_range[1]]
+    if concurrency is not None:
+        blocks = [packing.concurrentHelpers(concurrency, output)] + list(blocks or [])
+
+    if partition not in profile["partitions"]:
+        raise ValueError(
+            "Wrong partition set up selected. Available partitions are: " + ", ".join(profile["partitions"])
+        )
+    presets = profile.get("presets", {})
+    if program not in presets and program is not None:
+        raise ValueError("Wrong program set up selected. Available programs are: " + ", ".join(presets))
+
+    for key, value in presets.get(program, {}).items():
+        if key == "modules":
+            modules = (modules or []) + value
+        elif key == "pythonpath":
+            pythonpath = (pythonpath or []) + value
+        elif key == "exports":
+            exports = list(value)
+        elif key == "purge":
+            purge = value
+        else:
+            resources[key] = value
+
+    if script_name is None:
+        script_name = "slurm_array.sh"
+    modules, unload_modules = checkModules(modules, unload_modules, conda_env)
+    time = clampHours(cluster, partition, time)
+
+    parts = ["#!/bin/bash\n"]
+    parts.append(
+        directives(
+            profile["directives"], job_name=job_name, partition=partition, time=time,
+            array=arraySpec(*taskRange(tasks, jobs), throttle, throttle_demands),
+            output=output, **resources,
+        )
+    )
+    parts.append("\n")
+    if purge:
+        parts.append("module purge\n")
+    if unload_modules is not None:
+        parts += ["module unload " + m + "\n" for m in unload_modules] + ["\n"]
+    if modules is not None:
+        parts += ["module load " + m + "\n" for m in modules] + ["\n"]
+    if conda_env is not None:
+        parts.append("source activate " + conda_env + "\n\n")
+    for pp in pythonpath or []:
+        parts.append("export PYTHONPATH=$PYTHONPATH:" + pp + "\n\n")
+    if exports is not None:
+        parts += ["export " + e + "\n" for e in exports] + ["\n"]
+    for block in blocks or []:
+        parts += [block, "\n"]
+    if telemetry is not None:
+        parts += [task_telemetry.samplerBlock(telemetry_dir, telemetry, program), "\n"]
+    with open(script_name, "w") as sf:
+        sf.write("".join(parts))
+        writeTaskBody(sf, jobs, tasks, script_name, job_name)
+        if conda_env is not None:
+            sf.write("conda deactivate \n\n")
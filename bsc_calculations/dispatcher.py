@@ -0,0 +1,166 @@
+"""
+Per-task dispatcher for job arrays (standard library only).
+
+mn5.jobArrays(dispatcher=True) copies this file next to the script, which
+then only holds the #SBATCH header and one ``exec python3 <this file>``
+line. Each array task:
+
+1. reads its command from the compressed job payload (see
+   bsc_calculations.payload), decompressing only its own frame;
+2. loads the environment produced by the module/conda setup from a JSON
+   snapshot, or runs the setup once with bash and writes the snapshot;
+3. appends its dispatch overhead to a timing file;
+4. execs ``bash -c`` on the prelude (exports, helpers such as
+   chemshell_run) and its command, so the job keeps the task's PID and
+   signals.
+
+It must stay importable without the bsc_calculations package.
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+
+_T0 = time.time()
+
+# Width of one index entry; the same format as tables.INDEX_WIDTH.
+INDEX_WIDTH = 13
+
+
+def readJob(payload_file, task, codec="gzip", jobs_per_frame=64):
+    """Return job ``task`` (one-based) of a payload, decompressing only its frame."""
+
+    frame, position = divmod(task - 1, jobs_per_frame)
+    with open(payload_file + ".idx", "rb") as xf:
+        size = int(xf.readline())
+        if size != os.path.getsize(payload_file):
+            raise ValueError(f"{payload_file} changed since its index was built.")
+        xf.seek((frame + 1) * INDEX_WIDTH)
+        start, end = int(xf.readline()), int(xf.readline())
+    with open(payload_file, "rb") as pf:
+        pf.seek(start)
+        data = pf.read(end - start)
+    if codec == "gzip":
+        data = gzip.decompress(data)
+    else:
+        data = subprocess.run(["zstd", "-dcq"], input=data, stdout=subprocess.PIPE, check=True).stdout
+    return data.decode().split("\0")[position]
+
+
+def _bash_environment(setup_file):
+    """Run the setup with bash and return the environment it leaves (functions exported)."""
+
+    script = (
+        f'source "{setup_file}" >&2\n'
+        'for f in $(compgen -A function); do export -f "$f"; done\n'
+        "env -0\n"
+    )
+    out = subprocess.run(["bash", "-c", script], stdout=subprocess.PIPE, check=True).stdout
+    environment = {}
+    for entry in out.decode().split("\0"):
+        if "=" in entry:
+            key, value = entry.split("=", 1)
+            environment[key] = value
+    return environment
+
+
+def loadEnvironment(setup_file, snapshot_file=None, skip=None):
+    """
+    Apply the environment of ``setup_file`` to this process.
+
+    With ``snapshot_file``, the changes (variables set and unset) are read
+    from it when it is newer than the setup; otherwise the setup is run and
+    the snapshot written (to a temporary name, then renamed, so concurrent
+    tasks never read a partial file). Variables matching ``skip`` describe
+    the task, not the software, and are never cached. Returns "snapshot",
+    "setup" or "none".
+    """
+
+    if setup_file is None:
+        return "none"
+    skip = re.compile(skip) if skip else None
+    if snapshot_file is not None:
+        snapshot_file = os.path.expanduser(os.path.expandvars(snapshot_file))
+    if (
+        snapshot_file is not None
+        and os.path.exists(snapshot_file)
+        and os.path.getmtime(snapshot_file) >= os.path.getmtime(setup_file)
+    ):
+        with open(snapshot_file) as sf:
+            changes = json.load(sf)
+        mode = "snapshot"
+    else:
+        after = _bash_environment(setup_file)
+        changes = {"set": {}, "unset": []}
+        for key, value in after.items():
+            if (skip is None or not skip.search(key)) and os.environ.get(key) != value:
+                changes["set"][key] = value
+        for key in os.environ:
+            if key not in after and (skip is None or not skip.search(key)):
+                changes["unset"].append(key)
+        if snapshot_file is not None:
+            os.makedirs(os.path.dirname(snapshot_file) or ".", exist_ok=True)
+            tmp = f"{snapshot_file}.{socket.gethostname()}.{os.getpid()}"
+            with open(tmp, "w") as sf:
+                json.dump(changes, sf)
+            os.replace(tmp, snapshot_file)
+        mode = "setup"
+
+    os.environ.update(changes["set"])
+    for key in changes["unset"]:
+        os.environ.pop(key, None)
+    return mode
+
+
+def recordTiming(times_file, task, mode, start=None):
+    """Append ``task, job id, host, environment mode, dispatch seconds`` to times_file."""
+
+    start = _T0 if start is None else start
+    line = "\t".join([
+        str(task),
+        os.environ.get("SLURM_ARRAY_JOB_ID", os.environ.get("SLURM_JOB_ID", "")),
+        socket.gethostname(),
+        mode,
+        f"{time.time() - start:.4f}",
+    ]) + "\n"
+    # One O_APPEND write per task keeps concurrent lines whole
+    fd = os.open(times_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode())
+    finally:
+        os.close(fd)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one array task of a job payload.")
+    parser.add_argument("--jobs", required=True, help="Job payload file")
+    parser.add_argument("--codec", default="gzip")
+    parser.add_argument("--frame", type=int, default=64, help="Jobs per payload frame")
+    parser.add_argument("--task", type=int, default=None, help="Default: $SLURM_ARRAY_TASK_ID")
+    parser.add_argument("--setup", help="Module/conda setup lines to run (or restore)")
+    parser.add_argument("--snapshot", help="JSON environment snapshot of the setup")
+    parser.add_argument("--skip", help="Regex of variables never cached")
+    parser.add_argument("--prelude", help="Bash lines run before the command")
+    parser.add_argument("--times", help="TSV file receiving the dispatch overhead")
+    args = parser.parse_args(argv)
+
+    task = args.task if args.task is not None else int(os.environ["SLURM_ARRAY_TASK_ID"])
+    start = float(os.environ.get("BSC_DISPATCH_T0") or _T0)
+    job = readJob(args.jobs, task, args.codec, args.frame)
+    mode = loadEnvironment(args.setup, args.snapshot, args.skip)
+    if args.times:
+        recordTiming(args.times, task, mode, start)
+
+    if args.prelude:
+        job = f'source "{args.prelude}"\n' + job
+    sys.stdout.flush()
+    os.execvp("bash", ["bash", "-c", job])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import hashlib
+
+# Variables that describe the running task rather than the software
+# environment; they are never written to (or restored from) a snapshot.
+SNAPSHOT_SKIP = r"^(SLURM_|SLURMD_|SBATCH_|PMI_|PMIX_|OMPI_COMM_|TELEMETRY_|ENV_SNAPSHOT)|^(PWD|OLDPWD|SHLVL|_|HOSTNAME|TMPDIR|CUDA_VISIBLE_DEVICES|GPU_DEVICE_ORDINAL)$"
+
+
+def snapshotKey(setup, program=None, partition=None):
+    """
+    Return the file name of the snapshot for an environment setup.
+
+    The name is the preset plus a hash of the exact setup text (module
+    purge/unload/load lines, sourced files and conda activation) and the
+    partition family, since GPP and ACC nodes have different module trees.
+    Changing any module, source or conda env therefore points to a new file.
+    """
+
+    family = "acc" if partition is not None and "acc" in partition else "gpp"
+    digest = hashlib.sha256((family + "\n" + setup).encode()).hexdigest()[:16]
+    return f"{program if program is not None else 'custom'}_{family}_{digest}.env"
+
+
+def snapshotBlock(setup, snapshot_dir, snapshot_name, conda_env=None):
+    """
+    Return the bash block that runs ``setup`` once and caches its effect.
+
+    The first task to run (on any node) executes the setup lines and writes
+    the environment variables they added, changed or removed, plus the shell
+    functions they defined (``module``, ``conda``), to
+    ``<snapshot_dir>/<snapshot_name>``. Every later task sources that file
+    instead, skipping the module loads, toolchain scripts and conda
+    activation. The file is written to a temporary name and moved into place,
+    so concurrent first tasks never read a partial snapshot. When ``conda_env``
+    is a path, the snapshot is rebuilt if the environment was modified after
+    it (conda-meta/history is newer). Delete the file to force a rebuild.
+
+    Parameters
+    ==========
+    setup : str
+        The environment setup lines, as they would be written to the script.
+    snapshot_dir : str
+        Directory holding the snapshots (shared by all tasks, e.g. on GPFS).
+    snapshot_name : str
+        File name from snapshotKey().
+    conda_env : str
+        Conda environment activated by the setup (for invalidation).
+    """
+
+    condition = '[ -s "$ENV_SNAPSHOT" ]'
+    if conda_env is not None and conda_env.startswith("/"):
+        condition += ' && [ "$ENV_SNAPSHOT" -nt ' + conda_env + "/conda-meta/history ]"
+
+    return (
+        "# Environment snapshot (see bsc_calculations.environment): the setup runs\n"
+        "# once and later tasks source the variables and functions it produced.\n"
+        f'ENV_SNAPSHOT_DIR="{snapshot_dir}"\n'
+        f'ENV_SNAPSHOT="$ENV_SNAPSHOT_DIR/{snapshot_name}"\n'
+        f"ENV_SNAPSHOT_SKIP='{SNAPSHOT_SKIP}'\n"
+        "env_snapshot_begin() {\n"
+        "    declare -gA ENV_SNAPSHOT_VARS ENV_SNAPSHOT_FUNCS\n"
+        "    local kv f\n"
+        "    while IFS= read -r -d '' kv; do ENV_SNAPSHOT_VARS[\"${kv%%=*}\"]=\"${kv#*=}\"; done < <(env -0)\n"
+        "    for f in $(compgen -A function); do ENV_SNAPSHOT_FUNCS[$f]=$(declare -f \"$f\"); done\n"
+        "}\n"
+        "env_snapshot_save() {\n"
+        "    local kv k v f tmp=\"$ENV_SNAPSHOT.$HOSTNAME.$$\"\n"
+        "    local -A after\n"
+        '    mkdir -p "$ENV_SNAPSHOT_DIR" || return\n'
+        "    {\n"
+        "        while IFS= read -r -d '' kv; do\n"
+        '            k="${kv%%=*}"; v="${kv#*=}"\n'
+        "            [[ $k =~ ^[A-Za-z_][A-Za-z0-9_]*$ ]] || continue\n"
+        "            [[ $k =~ $ENV_SNAPSHOT_SKIP ]] && continue\n"
+        "            after[$k]=1\n"
+        "            if [[ ! -v ENV_SNAPSHOT_VARS[$k] || \"${ENV_SNAPSHOT_VARS[$k]}\" != \"$v\" ]]; then\n"
+        "                printf 'export %s=%q\\n' \"$k\" \"$v\"\n"
+        "            fi\n"
+        "        done < <(env -0)\n"
+        '        for k in "${!ENV_SNAPSHOT_VARS[@]}"; do\n'
+        "            [[ $k =~ ^[A-Za-z_][A-Za-z0-9_]*$ ]] || continue\n"
+        "            [[ $k =~ $ENV_SNAPSHOT_SKIP ]] && continue\n"
+        "            [[ -v after[$k] ]] || printf 'unset %s\\n' \"$k\"\n"
+        "        done\n"
+        "        for f in $(compgen -A function); do\n"
+        "            [[ $f == env_snapshot_* ]] && continue\n"
+        "            [[ \"${ENV_SNAPSHOT_FUNCS[$f]}\" == \"$(declare -f \"$f\")\" ]] || declare -f \"$f\"\n"
+        "        done\n"
+        '    } > "$tmp" && mv -f "$tmp" "$ENV_SNAPSHOT"\n'
+        '    rm -f "$tmp"\n'
+        "    unset ENV_SNAPSHOT_VARS ENV_SNAPSHOT_FUNCS\n"
+        "}\n"
+        f"if {condition}; then\n"
+        '    source "$ENV_SNAPSHOT"\n'
+        "else\n"
+        "env_snapshot_begin\n"
+        f"{setup}"
+        "env_snapshot_save\n"
+        "fi\n"
+    )
+
+
+def packedArchive(conda_env, conda_pack=True):
+    """
+    Return the packed archive used for ``conda_env``: the ``conda_pack`` path
+    itself, or ``<conda_env>.tar.gz`` next to the environment when True.
+    """
+
+    if isinstance(conda_pack, str):
+        return conda_pack
+    if conda_env is None or not conda_env.startswith("/"):
+        raise ValueError(
+            "conda_pack=True needs a conda environment given by absolute path; "
+            "pass the archive path as conda_pack instead."
+        )
+    return conda_env.rstrip("/") + ".tar.gz"
+
+
+def packCommand(conda_env, archive=None):
+    """
+    Return the command that builds the archive for packedEnvBlock() (run it
+    once on a login node after creating or updating the environment).
+    Archives ending in .squashfs are built from a conda-pack directory.
+    """
+
+    if archive is None:
+        archive = packedArchive(conda_env)
+    if archive.endswith(".squashfs"):
+        staging = archive[: -len(".squashfs")] + "_pack"
+        return (
+            f"conda pack -p {conda_env} --format no-archive -o {staging} --ignore-editable-packages"
+            f" && mksquashfs {staging} {archive} -noappend && rm -rf {staging}"
+        )
+    return f"conda pack -p {conda_env} -o {archive} --ignore-editable-packages"
+
+
+def packedEnvBlock(archive, extract_dir="${TMPDIR:-/tmp}", conda_env=None):
+    """
+    Return the bash block that activates a conda-pack archive from node-local
+    storage instead of the environment on GPFS.
+
+    The archive (tar, tar.gz or squashfs, see packCommand()) is extracted to
+    ``<extract_dir>/bsc_envs/<name>_<mtime>_<size>`` under an ``flock``, so
+    only one task per node unpacks it and the rest reuse the extracted copy;
+    repacking the archive changes the directory name. ``conda-unpack`` fixes
+    the prefixes before the copy is marked ready. If extraction fails the
+    task falls back to ``source activate <conda_env>``.
+
+    Parameters
+    ==========
+    archive : str
+        Packed environment.
+    extract_dir : str
+        Node-local directory to extract into. The default, $TMPDIR, is
+        private to each job; use a persistent node-local path (e.g. /tmp) to
+        share one extraction between the array tasks landing on a node.
+    conda_env : str
+        Environment to activate if the packed copy cannot be used.
+    """
+
+    name = archive.rstrip("/").split("/")[-1]
+    for ext in (".tar.gz", ".tgz", ".tar", ".squashfs"):
+        if name.endswith(ext):
+            name = name[: -len(ext)]
+            break
+
+    fallback = ""
+    if conda_env is not None:
+        fallback = "    source activate " + conda_env + "\n"
+
+    return (
+        "# Packed conda env (see bsc_calculations.environment): extract once per node\n"
+        f'PACKED_ENV_ARCHIVE="{archive}"\n'
+        f'PACKED_ENV_ROOT="{extract_dir}/bsc_envs"\n'
+        f'PACKED_ENV="$PACKED_ENV_ROOT/{name}_$(stat -c %Y_%s "$PACKED_ENV_ARCHIVE")"\n'
+        'mkdir -p "$PACKED_ENV_ROOT"\n'
+        "(\n"
+        "    flock 9\n"
+        '    if [ ! -e "$PACKED_ENV/.ready" ]; then\n'
+        '        rm -rf "$PACKED_ENV" && mkdir -p "$PACKED_ENV" || exit 1\n'
+        '        case "$PACKED_ENV_ARCHIVE" in\n'
+        '            *.squashfs) unsquashfs -q -f -d "$PACKED_ENV" "$PACKED_ENV_ARCHIVE" > /dev/null ;;\n'
+        '            *) tar -xf "$PACKED_ENV_ARCHIVE" -C "$PACKED_ENV" ;;\n'
+        "        esac || exit 1\n"
+        '        if [ -x "$PACKED_ENV/bin/conda-unpack" ]; then "$PACKED_ENV/bin/conda-unpack" || exit 1; fi\n'
+        '        touch "$PACKED_ENV/.ready"\n'
+        "    fi\n"
+        ') 9> "$PACKED_ENV.lock"\n'
+        'if [ -e "$PACKED_ENV/.ready" ]; then\n'
+        '    source "$PACKED_ENV/bin/activate"\n'
+        "else\n"
+        '    echo "[bsc_calculations] WARNING: could not extract $PACKED_ENV_ARCHIVE" >&2\n'
+        + fallback
+        + "fi\n"
+    )
+
+
+def stagedWeightsBlock(variables, stage_dir="${TMPDIR:-/tmp}"):
+    """
+    Return the bash block that copies model weights to node-local disk.
+
+    Each variable in ``variables`` (e.g. WEIGHTS, HF_HOME, BOLTZ_CACHE) must
+    point to a weights directory when the block runs. The directory is copied
+    once per node under an ``flock`` to ``<stage_dir>/bsc_weights/<hash>``
+    (keyed on its path and mtime) and the variable is re-exported to the
+    copy, so every model load of the task reads local disk instead of GPFS.
+    Variables that are unset or not a directory are left alone; a failed copy
+    keeps the GPFS path. HF_HUB_CACHE follows a staged HF_HOME.
+    """
+
+    block = (
+        "# Stage model weights to node-local disk (see bsc_calculations.environment)\n"
+        f'WEIGHTS_STAGE_ROOT="{stage_dir}/bsc_weights"\n'
+        'mkdir -p "$WEIGHTS_STAGE_ROOT"\n'
+        "stage_weights() {\n"
+        '    local src="${!1}" dst\n'
+        '    [ -n "$src" ] && [ -d "$src" ] || return 0\n'
+        '    dst="$WEIGHTS_STAGE_ROOT/$(echo "$src $(stat -c %Y "$src")" | md5sum | cut -c1-16)"\n'
+        "    (\n"
+        "        flock 9\n"
+        '        if [ ! -e "$dst/.ready" ]; then\n'
+        '            rm -rf "$dst" && mkdir -p "$dst" && cp -a "$src"/. "$dst"/ && touch "$dst/.ready"\n'
+        "        fi\n"
+        '    ) 9> "$dst.lock"\n'
+        '    if [ -e "$dst/.ready" ]; then\n'
+        '        export "$1=$dst"\n'
+        "    else\n"
+        '        echo "[bsc_calculations] WARNING: could not stage $src; reading it from its original location" >&2\n'
+        "    fi\n"
+        "}\n"
+    )
+    for variable in variables:
+        block += "stage_weights " + variable + "\n"
+        if variable == "HF_HOME":
+            # Point the hub cache into the staged copy only when HF_HOME was staged
+            block += 'if [ -n "${HF_HOME:-}" ] && [ -e "$HF_HOME/.ready" ]; then export HF_HUB_CACHE="$HF_HOME/hub"; fi\n'
+    return block
@@ -0,0 +1,428 @@
+import os
+import re
+import struct
+
+# Smallest domain-decomposition cell (nm): about the pair-list cut-off plus
+# the bonded-interaction margin for the usual 1.0-1.2 nm cut-offs.
+MIN_CELL_SIZE = 1.4
+# Below these sizes extra GPUs / MPI ranks cost more in communication than
+# they add; pack several simulations per node instead (mps, concurrency).
+MIN_ATOMS_PER_GPU = 50000
+MIN_ATOMS_PER_RANK = 500
+# mdrun only uses separate PME ranks on CPU runs from about this many ranks.
+MIN_RANKS_FOR_PME = 12
+# Ranks per CPU simulation when the system size is unknown: few enough that
+# even small boxes have the domain-decomposition cells, OpenMP for the rest.
+MAX_RANKS_UNKNOWN_SIZE = 4
+
+_MDRUN = re.compile(
+    r"(?P<launcher>(?:\$\{?GMXBIN\}?|\S*gmx_mpi|\S*gmx(?:_d)?)\s+mdrun)(?P<args>[^\n;&|]*)"
+)
+
+
+def _read_gro(structure):
+    with open(structure) as gf:
+        lines = gf.read().splitlines()
+    natoms = int(lines[1].split()[0])
+    box = [float(x) for x in lines[natoms + 2].split()[:3]]
+    return natoms, box
+
+
+def _read_pdb(structure):
+    natoms = 0
+    box = None
+    with open(structure) as pf:
+        for line in pf:
+            if line.startswith(("ATOM", "HETATM")):
+                natoms += 1
+            elif line.startswith("CRYST1"):
+                box = [float(line[6:15]) / 10, float(line[15:24]) / 10, float(line[24:33]) / 10]
+    return natoms, box
+
+
+def _read_tpr(structure):
+    """natoms and box from the XDR header of a .tpr file (see tpxio.cpp)."""
+
+    with open(structure, "rb") as tf:
+        data = tf.read()
+    pos = 0
+
+    def unpack(fmt):
+        nonlocal pos
+        value = struct.unpack_from(">" + fmt, data, pos)
+        pos += struct.calcsize(fmt)
+        return value[0] if len(value) == 1 else value
+
+    def string():
+        nonlocal pos
+        unpack("i")  # length including the NUL byte
+        length = unpack("i")
+        text = data[pos : pos + length].decode(errors="replace")
+        pos += -(-length // 4) * 4
+        return text
+
+    try:
+        if not string().startswith("VERSION"):
+            raise ValueError
+        precision = unpack("i")
+        if precision not in (4, 8):
+            raise ValueError
+        real = "f" if precision == 4 else "d"
+        version = unpack("i")
+        if 77 <= version <= 79:
+            string()
+        unpack("i")  # file generation
+        if version >= 81:
+            string()
+        natoms = unpack("i")
+        unpack("i")  # temperature-coupling groups
+        if version < 62:
+            unpack("i")
+            unpack(real)
+        if version >= 79:
+            unpack("i")  # FEP state
+        unpack(real)  # lambda
+        has_ir, has_top, has_x, has_v, has_f, has_box = unpack("6i")
+        # Since GROMACS 2020 the body is preceded by its size (int64).
+        if len(data) - pos >= 8 and unpack("q") != len(data) - pos:
+            pos -= 8
+        box = None
+        if has_box:
+            matrix = unpack("9" + real)
+            box = [matrix[0], matrix[4], matrix[8]]
+    except (ValueError, struct.error):
+        raise ValueError(
+            f"Could not read the header of {structure}; give the .gro file of the system instead."
+        )
+    if natoms < 1:
+        raise ValueError(f"Could not read the number of atoms from {structure}.")
+    return natoms, box
+
+
+def readSystemSize(structure):
+    """
+    Return (natoms, box) of a .gro, .pdb or .tpr file. box holds the three
+    box lengths in nm (the diagonal for triclinic boxes) or None when the
+    file has no box.
+    """
+
+    extension = os.path.splitext(structure)[1].lower()
+    readers = {".gro": _read_gro, ".pdb": _read_pdb, ".tpr": _read_tpr}
+    if extension not in readers:
+        raise ValueError("The structure must be a .gro, .pdb or .tpr file.")
+    return readers[extension](structure)
+
+
+def _max_dd_ranks(box, min_cell_size):
+    if box is None:
+        return None
+    cells = 1
+    for length in box:
+        cells *= max(int(length // min_cell_size), 1)
+    return cells
+
+
+def planMdrun(
+    natoms=None,
+    box=None,
+    gpus=0,
+    cores=1,
+    simulations=1,
+    min_cell_size=MIN_CELL_SIZE,
+):
+    """
+    Choose the mdrun decomposition of the simulations sharing an allocation.
+
+    GPU runs put each simulation on its own GPU(s) with non-bonded, PME and
+    bonded work offloaded; a simulation spanning several GPUs gets one PP
+    rank per GPU, one of which does PME (-npme 1), as long as the box has
+    enough domain-decomposition cells and each GPU gets at least
+    MIN_ATOMS_PER_GPU atoms. CPU runs use as many ranks as the box and
+    MIN_ATOMS_PER_RANK allow, with OpenMP threads for the remaining cores
+    and a quarter of the ranks on PME from MIN_RANKS_FOR_PME ranks. Without
+    natoms and box, CPU runs use at most MAX_RANKS_UNKNOWN_SIZE ranks and
+    the plan warns that the decomposition was not sized. Each simulation is
+    pinned to its own contiguous block of cores.
+
+    Parameters
+    ==========
+    natoms : int
+        Atoms in the system (None skips the size checks).
+    box : list
+        Box lengths in nm (None skips the domain-decomposition check).
+    gpus : int
+        GPUs of the allocation (0 for CPU runs).
+    cores : int
+        Cores of the allocation.
+    simulations : int
+        Simulations running at the same time on the allocation (packed
+        with mps or concurrency); they share the GPUs and cores evenly.
+    min_cell_size : float
+        Smallest domain-decomposition cell in nm.
+
+    Returns
+    =======
+    list of dict
+        One plan per packed simulation with keys ranks, ntomp, npme,
+        pinoffset, gpu_ids (None on CPU runs) and warnings.
+    """
+
+    if not isinstance(simulations, int) or simulations < 1:
+        raise ValueError("simulations must be a positive integer.")
+    cores_per_sim = max(cores // simulations, 1)
+    max_dd = _max_dd_ranks(box, min_cell_size)
+    unknown_size = natoms is None and box is None
+
+    plans = []
+    for sim in range(simulations):
+        warnings = []
+        if gpus:
+            if gpus >= simulations:
+                share = gpus // simulations
+                gpu_ids = list(range(sim * share, (sim + 1) * share))
+            else:
+                gpu_ids = [sim * gpus // simulations]
+            ranks = len(gpu_ids)
+            if natoms is not None and ranks > 1 and natoms // ranks < MIN_ATOMS_PER_GPU:
+                ranks = max(natoms // MIN_ATOMS_PER_GPU, 1)
+                warnings.append(
+                    f"{natoms} atoms are too few for {len(gpu_ids)} GPUs per simulation; using "
+                    f"{ranks}. Pack more simulations per node (mps or concurrency) instead."
+                )
+            # With several ranks one of them does PME, the rest are PP domains.
+            if max_dd is not None and ranks > 1 and ranks - 1 > max_dd:
+                ranks = max_dd + 1
+                warnings.append(f"The box only allows {max_dd} domain-decomposition cells; using {ranks} ranks.")
+            gpu_ids = gpu_ids[:ranks]
+            npme = 1 if ranks > 1 else 0
+            ntomp = max(cores_per_sim // ranks, 1)
+        else:
+            gpu_ids = None
+            ranks, ntomp, npme = 1, cores_per_sim, 0
+            for threads in range(1, cores_per_sim + 1):
+                if cores_per_sim % threads:
+                    continue
+                candidate = cores_per_sim // threads
+                pme = candidate // 4 if candidate >= MIN_RANKS_FOR_PME else 0
+                if natoms is not None and natoms // candidate < MIN_ATOMS_PER_RANK:
+                    continue
+                if max_dd is not None and candidate - pme > max_dd:
+                    continue
+                if unknown_size and candidate > MAX_RANKS_UNKNOWN_SIZE:
+                    continue
+                ranks, ntomp, npme = candidate, threads, pme
+                break
+        if unknown_size and ranks > 1:
+            warnings.append(
+                f"The system size is unknown, so {ranks} ranks per simulation were not checked against "
+                "the box; if mdrun finds no domain decomposition, give gromacs_structures (the .gro, "
+                ".pdb or .tpr) or use fewer ranks."
+            )
+        plans.append({
+            "ranks": ranks,
+            "ntomp": ntomp,
+            "npme": npme,
+            "pinoffset": sim * cores_per_sim,
+            "gpu_ids": gpu_ids,
+            "warnings": warnings,
+        })
+    return plans
+
+
+def _given(args, flag):
+    return re.search(r"(^|\s)" + re.escape(flag) + r"(\s|$)", args) is not None
+
+
+def _mdrun_options(plan, gpu_ids=None):
+    options = [("-ntomp", str(plan["ntomp"]))]
+    if plan["npme"]:
+        options.append(("-npme", str(plan["npme"])))
+    gpu_ids = gpu_ids if gpu_ids is not None else plan["gpu_ids"]
+    if gpu_ids is not None:
+        options += [("-nb", "gpu"), ("-pme", "gpu"), ("-bonded", "gpu")]
+        options.append(("-gpu_id", ",".join(str(g) for g in gpu_ids)))
+    options.append(("-pin", "on"))
+    return options
+
+
+def mdrunCommand(job, plan):
+    """
+    Apply a planMdrun plan to the mdrun calls of a job. The rank count goes
+    to mpirun -np for MPI builds ($GMXBIN, gmx_mpi) and to -ntmpi for the
+    thread-MPI gmx binary; options already present in the command win.
+    """
+
+    def rewrite(match):
+        launcher, args = match.group("launcher"), match.group("args")
+        options = _mdrun_options(plan)
+        options += [("-pinoffset", str(plan["pinoffset"])), ("-pinstride", "1")]
+
+        if "GMXBIN" in launcher or "gmx_mpi" in launcher:
+            if "GMXBIN" in launcher:
+                launcher = "mpirun --bind-to none -report-bindings gmx_mpi mdrun"
+            if not launcher.startswith("mpirun"):
+                launcher = "mpirun --bind-to none " + launcher
+            # The ranks share the cores of the task's single Slurm slot.
+            launcher = launcher.replace("mpirun", f"mpirun -np {plan['ranks']} --oversubscribe", 1)
+        elif not _given(args, "-ntmpi"):
+            options.insert(0, ("-ntmpi", str(plan["ranks"])))
+
+        extra = "".join(f" {flag} {value}" for flag, value in options if not _given(args, flag))
+        return launcher + extra + args
+
+    return _MDRUN.sub(rewrite, job)
+
+
+def _structure_of(job):
+    """The -s / -deffnm .tpr of an mdrun call when it already exists."""
+    match = re.search(r"mdrun[^\n;&|]*?\s-(s|deffnm)\s+(\S+)", job)
+    if match is None:
+        return None
+    path = match.group(2) if match.group(1) == "s" else match.group(2) + ".tpr"
+    return path if os.path.exists(path) else None
+
+
+def decomposeJobs(jobs, structures=None, gpus=0, cores=1, simulations=1, min_cell_size=MIN_CELL_SIZE):
+    """
+    Rewrite the mdrun calls of a job list with planMdrun decompositions.
+
+    Job i is the (i % simulations)-th of the simulations packed together, so
+    it takes that slot's GPUs and pin offset. The system size comes from
+    ``structures`` (one .gro/.pdb/.tpr path for all jobs or one per job) or
+    else from the existing .tpr given to mdrun with -s/-deffnm; without
+    either the plan skips the size checks.
+    """
+
+    if isinstance(structures, str):
+        structures = [structures] * len(jobs)
+    if structures is not None and len(structures) != len(jobs):
+        raise ValueError("Give one structure for all the jobs or one per job.")
+
+    sizes = {}
+    warned = set()
+    rewritten = []
+    for i, job in enumerate(jobs):
+        structure = structures[i] if structures is not None else _structure_of(job)
+        if structure is not None and structure not in sizes:
+            sizes[structure] = readSystemSize(structure)
+        natoms, box = sizes.get(structure, (None, None))
+        plan = planMdrun(natoms, box, gpus, cores, simulations, min_cell_size)[i % simulations]
+        for warning in plan["warnings"]:
+            if warning not in warned:
+                warned.add(warning)
+                print("[bsc_calculations] WARNING: " + warning)
+        rewritten.append(mdrunCommand(job, plan))
+    return rewritten
+
+
+def _mdrun_file(args, flag, extension, default):
+    """File name mdrun uses for an option (-s, -g), honouring -deffnm."""
+    match = re.search(r"(?:^|\s)" + flag + r"\s+(\S+)", args)
+    if match:
+        return match.group(1)
+    match = re.search(r"(?:^|\s)-deffnm\s+(\S+)", args)
+    if match:
+        return match.group(1) + extension
+    return default
+
+
+def multidirJobs(
+    replicas,
+    replicas_per_ensemble,
+    mdrun_args="-deffnm md",
+    gpus=0,
+    cores=1,
+    structure=None,
+    replica_dir="replicas",
+    logs_dir="replica_logs",
+    min_cell_size=MIN_CELL_SIZE,
+):
+    """
+    Group replicas of a system into ``gmx_mpi mdrun -multidir`` ensembles.
+
+    Every ensemble is one mpirun launch running ``replicas_per_ensemble``
+    replicas side by side on the allocation's GPUs and cores (split as
+    planMdrun does for packed simulations; mdrun pins the ranks of all the
+    replicas of the node itself). After the run, each replica's log is
+    copied to ``<logs_dir>/<replica>.log`` and its ns/day appended to
+    ``<logs_dir>/performance.tsv``.
+
+    Parameters
+    ==========
+    replicas : list
+        Replica directories, each holding the run input named by mdrun_args
+        (-s, -deffnm or topol.tpr), or .tpr files, which are linked into
+        ``<replica_dir>/<tpr name>/`` under that input name.
+    replicas_per_ensemble : int
+        Replicas per mdrun -multidir launch (array task).
+    mdrun_args : str
+        mdrun options shared by all replicas.
+    gpus : int
+        GPUs of each array task (0 for CPU runs).
+    cores : int
+        Cores of each array task.
+    structure : str
+        .gro/.pdb/.tpr used to size the decomposition. Defaults to the
+        first replica's input when it exists.
+    replica_dir : str
+        Where replica directories are created for .tpr inputs.
+    logs_dir : str
+        Where the replica logs and the performance table are collected.
+
+    Returns
+    =======
+    list
+        One ensemble command per array task.
+    """
+
+    if not isinstance(replicas_per_ensemble, int) or isinstance(replicas_per_ensemble, bool) or replicas_per_ensemble < 1:
+        raise ValueError("replicas_per_ensemble must be a positive integer.")
+    if isinstance(replicas, str):
+        replicas = [replicas]
+
+    tpr = _mdrun_file(mdrun_args, "-s", ".tpr", "topol.tpr")
+    log = _mdrun_file(mdrun_args, "-g", ".log", "md.log")
+
+    directories = []
+    for replica in replicas:
+        if replica.endswith(".tpr"):
+            directory = os.path.join(replica_dir, os.path.splitext(os.path.basename(replica))[0])
+            os.makedirs(directory, exist_ok=True)
+            link = os.path.join(directory, tpr)
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(os.path.abspath(replica), link)
+            directories.append(directory)
+        else:
+            directories.append(replica.rstrip("/"))
+    if len(set(directories)) != len(directories):
+        raise ValueError("Every replica needs its own directory.")
+
+    if structure is None and os.path.exists(os.path.join(directories[0], tpr)):
+        structure = os.path.join(directories[0], tpr)
+    natoms, box = readSystemSize(structure) if structure is not None else (None, None)
+
+    jobs = []
+    for start in range(0, len(directories), replicas_per_ensemble):
+        ensemble = directories[start : start + replicas_per_ensemble]
+        plans = planMdrun(natoms, box, gpus, cores, len(ensemble), min_cell_size)
+        for warning in plans[0]["warnings"]:
+            print("[bsc_calculations] WARNING: " + warning)
+        gpu_ids = sorted({g for plan in plans for g in plan["gpu_ids"]}) if gpus else None
+        ranks = sum(plan["ranks"] for plan in plans)
+        options = "".join(
+            f" {flag} {value}" for flag, value in _mdrun_options(plans[0], gpu_ids) if not _given(mdrun_args, flag)
+        )
+        job = (
+            f"mpirun -np {ranks} --oversubscribe --bind-to none -report-bindings gmx_mpi mdrun"
+            f" -multidir {' '.join(ensemble)} {mdrun_args}{options}\n"
+            f"mkdir -p {logs_dir}\n"
+        )
+        for directory in ensemble:
+            name = directory.replace("/", "_")
+            job += (
+                f"cp -f {directory}/{log} {logs_dir}/{name}.log && printf '%s\\t%s\\n' {name}"
+                f" \"$(awk '/^Performance:/ {{print $2}}' {directory}/{log})\" >> {logs_dir}/performance.tsv\n"
+            )
+        jobs.append(job)
+    return jobs
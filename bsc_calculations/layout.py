@@ -0,0 +1,216 @@
+# ── Node shapes ────────────────────────────────────────────────────────────────
+# Cores are numbered socket-major (socket 0 owns the first half), which is how
+# Slurm enumerates them on these nodes (no SMT exposed). gpu_numa maps each GPU
+# index to the NUMA domain its PCIe root is attached to.
+NODE_SHAPES = {
+    "mn5_gpp": {"sockets": 2, "numa_domains": 2, "cores": 112, "gpus": 0, "gpu_numa": []},
+    "mn5_acc": {"sockets": 2, "numa_domains": 2, "cores": 80, "gpus": 4, "gpu_numa": [0, 0, 1, 1]},
+    "nord4": {"sockets": 2, "numa_domains": 2, "cores": 96, "gpus": 0, "gpu_numa": []},
+}
+
+
+def _cpu_list(cpus):
+    """Compress a sorted list of core ids into taskset/Slurm range syntax (0-3,8-11)."""
+    ranges = []
+    start = prev = cpus[0]
+    for c in cpus[1:]:
+        if c == prev + 1:
+            prev = c
+            continue
+        ranges.append(f"{start}-{prev}" if prev != start else str(start))
+        start = prev = c
+    ranges.append(f"{start}-{prev}" if prev != start else str(start))
+    return ",".join(ranges)
+
+
+def _cpu_mask(cpus):
+    mask = 0
+    for c in cpus:
+        mask |= 1 << c
+    return hex(mask)
+
+
+def packedLayout(node, jobs_per_node, ranks_per_job=1, threads_per_rank=None, gpus_per_job=None):
+    """
+    Compute a NUMA-aware rank/thread/GPU binding for jobs packed on one node.
+
+    Jobs are spread evenly over the NUMA domains and laid out contiguously
+    inside their domain, so no job straddles two domains (no cross-NUMA
+    memory traffic) unless a single job needs more cores than a domain has.
+    GPUs are handed out from the job's own domain; when there are more jobs
+    than GPUs (e.g. MPS packing) jobs in a domain share that domain's GPUs.
+
+    Parameters
+    ==========
+    node : str or dict
+        A key of NODE_SHAPES ("mn5_gpp", "mn5_acc", "nord4") or a shape dict
+        with the same keys.
+    jobs_per_node : int
+        Number of independent jobs packed on the node.
+    ranks_per_job : int
+        MPI ranks per job.
+    threads_per_rank : int
+        OpenMP threads per rank. Defaults to an even split of the node's cores.
+    gpus_per_job : int
+        GPUs per job. Defaults to gpus // jobs_per_node (at least 1 on GPU nodes).
+
+    Returns
+    =======
+    list of dict
+        One entry per job with keys: slot, numa, cpus (core ids), cpu_list
+        (taskset syntax), ranks (core ids per rank), cpu_bind (srun
+        ``--cpu-bind`` value, one mask per rank), cpu_mask (the whole job),
+        omp_num_threads, omp_places (per rank) and cuda_visible_devices
+        (None on CPU nodes).
+    """
+
+    if isinstance(node, str):
+        if node not in NODE_SHAPES:
+            raise ValueError(
+                "Unknown node shape. Available shapes are: " + ", ".join(NODE_SHAPES)
+            )
+        shape = NODE_SHAPES[node]
+    else:
+        shape = node
+
+    for name, value in (("jobs_per_node", jobs_per_node), ("ranks_per_job", ranks_per_job)):
+        if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+            raise ValueError(f"{name} must be a positive integer, got {value!r}")
+
+    cores = shape["cores"]
+    domains = shape["numa_domains"]
+    domain_cores = cores // domains
+
+    if threads_per_rank is None:
+        threads_per_rank = max(cores // (jobs_per_node * ranks_per_job), 1)
+    cores_per_job = ranks_per_job * threads_per_rank
+    if cores_per_job * jobs_per_node > cores:
+        raise ValueError(
+            f"{jobs_per_node} jobs x {ranks_per_job} ranks x {threads_per_rank} threads "
+            f"needs {cores_per_job * jobs_per_node} cores; the node has {cores}."
+        )
+
+    gpus = shape["gpus"]
+    if gpus_per_job is None:
+        gpus_per_job = max(gpus // jobs_per_node, 1) if gpus else 0
+    if gpus_per_job > gpus:
+        raise ValueError(f"gpus_per_job={gpus_per_job} exceeds the node's {gpus} GPUs.")
+
+    # When every domain can hold its share of jobs, jobs are dealt round-robin
+    # over the domains and stacked from the start of each one; otherwise they
+    # are laid out linearly (and some job necessarily straddles two domains).
+    jobs_per_domain = -(-jobs_per_node // domains)
+    fits = jobs_per_domain * cores_per_job <= domain_cores
+    next_core = [d * domain_cores for d in range(domains)]
+    next_gpu = {d: 0 for d in range(domains)}
+    linear = 0
+
+    layout = []
+    for slot in range(jobs_per_node):
+        if fits:
+            numa = slot % domains
+            first = next_core[numa]
+            next_core[numa] += cores_per_job
+        else:
+            first = linear
+            linear += cores_per_job
+            numa = first // domain_cores
+        cpus = list(range(first, first + cores_per_job))
+
+        ranks = [
+            cpus[r * threads_per_rank : (r + 1) * threads_per_rank]
+            for r in range(ranks_per_job)
+        ]
+
+        devices = None
+        if gpus:
+            local = [g for g in range(gpus) if shape["gpu_numa"][g] == numa] or list(range(gpus))
+            chosen = []
+            for _ in range(gpus_per_job):
+                chosen.append(local[next_gpu[numa] % len(local)])
+                next_gpu[numa] += 1
+            devices = ",".join(str(g) for g in chosen)
+
+        layout.append({
+            "slot": slot,
+            "numa": numa,
+            "cpus": cpus,
+            "cpu_list": _cpu_list(cpus),
+            "ranks": ranks,
+            "cpu_bind": "mask_cpu:" + ",".join(_cpu_mask(r) for r in ranks),
+            "cpu_mask": _cpu_mask(cpus),
+            "omp_num_threads": threads_per_rank,
+            "omp_places": ["{" + str(r[0]) + "}:" + str(len(r)) + ":1" for r in ranks],
+            "cuda_visible_devices": devices,
+        })
+
+    return layout
+
+
+def bindingExports(slot):
+    """
+    Return the ``VAR=value`` exports pinning a job of a packedLayout() slot
+    (OMP_* placement plus CUDA_VISIBLE_DEVICES). A single-rank job gets its
+    explicit OMP places; ranks of a multi-rank job each place their threads
+    on the cores of their own ``--cpu-bind`` mask (OMP_PLACES=cores).
+    """
+    places = slot["omp_places"][0] if len(slot["omp_places"]) == 1 else "cores"
+    exports = [
+        f"OMP_NUM_THREADS={slot['omp_num_threads']}",
+        f"OMP_PLACES={places}",
+        "OMP_PROC_BIND=close",
+    ]
+    if slot["cuda_visible_devices"] is not None:
+        exports.append(f"CUDA_VISIBLE_DEVICES={slot['cuda_visible_devices']}")
+    return exports
+
+
+def bindingCommand(slot):
+    """
+    Return the command that pins the current (sub)shell to the cores and
+    GPU(s) of a packedLayout() slot; children inherit the binding. Only valid
+    when the task owns the whole node the layout was computed for.
+    """
+    return (
+        f"taskset -pc {slot['cpu_list']} $BASHPID > /dev/null; "
+        "export " + " ".join(bindingExports(slot))
+    )
+
+
+def allocationCpusBlock():
+    """
+    Return bash helpers that bind packed processes relative to the cores the
+    running task was actually given.
+
+    Array tasks rarely own a whole node, so absolute core ids are unknown at
+    generation time. ``slot_cpus K N`` prints the K-th contiguous group of N
+    cores of the task's affinity list (as read by ``taskset``); Slurm hands a
+    task its cores socket by socket, so contiguous groups stay inside one
+    NUMA domain.
+    """
+    return (
+        "# Bind packed processes to disjoint slices of this task's cores\n"
+        "ALLOC_CPUS=()\n"
+        "for part in $(taskset -pc $$ | sed 's/.*: //; s/,/ /g'); do\n"
+        "    for ((c=${part%-*}; c<=${part#*-}; c++)); do ALLOC_CPUS+=($c); done\n"
+        "done\n"
+        "slot_cpus() {\n"
+        "    local IFS=,\n"
+        "    local cpus=\"${ALLOC_CPUS[*]:$(( $1 * $2 )):$2}\"\n"
+        "    echo \"${cpus:-${ALLOC_CPUS[*]}}\"\n"
+        "}\n"
+    )
+
+
+def slotBindingCommand(slot, slots):
+    """
+    Return the command that pins the current (sub)shell to the ``slot``-th of
+    ``slots`` disjoint core slices of the task; children inherit the binding.
+    Run it at the start of the subshell of each packed process (needs
+    allocationCpusBlock() earlier in the script).
+    """
+    n = "$(( ${#ALLOC_CPUS[@]} / " + str(slots) + " > 0 ? ${#ALLOC_CPUS[@]} / " + str(slots) + " : 1 ))"
+    return (
+        f'taskset -pc "$(slot_cpus {slot} {n})" $BASHPID > /dev/null; '
+        "export OMP_PLACES=cores OMP_PROC_BIND=close"
+    )
@@ -0,0 +1,165 @@
+import shlex
+
+from . import throttle
+
+# FlexLM feature every Schrödinger job checks out tokens from.
+DEFAULT_FEATURE = "SUITE"
+
+# Columns of the usage log appended by license_run (one line per command).
+USAGE_COLUMNS = ["host", "task", "tokens", "requested", "started", "finished", "free", "status"]
+
+
+def licenseBlock(counter=None, poll=30, settle=20, timeout=0, lock_file=None, log_file="license_usage.tsv"):
+    """
+    Return the bash block defining ``license_run <tokens> <command>``.
+
+    license_run waits until the token counter reports at least ``tokens``
+    free, starts the command and keeps other starts waiting for ``settle``
+    seconds (or until the command ends), so the command checks its tokens
+    out before the next one reads the counter. Starts are serialised through
+    ``lock_file``: the default, node-local, queues the commands packed in one
+    allocation (concurrency, grouped jobs); a path on the shared filesystem
+    queues every task of the array. Each command appends one line (see
+    USAGE_COLUMNS) to ``log_file`` for licenseReport().
+
+    Parameters
+    ==========
+    counter : str
+        Shell command printing the free tokens (default: FlexLM SUITE tokens
+        from $SCHRODINGER/licadmin STAT; see throttle.flexlmProbe and
+        writeFakeLicenseServer for tests).
+    poll : int
+        Seconds between counter reads while waiting.
+    settle : int
+        Seconds for a started command to check out its tokens.
+    timeout : int
+        Give up after waiting this many seconds (exit code 75); 0 waits forever.
+    """
+
+    if counter is None:
+        counter = throttle.flexlmProbe(DEFAULT_FEATURE)
+    if lock_file is None:
+        lock_file = "${TMPDIR:-/tmp}/bsc_license.lock"
+
+    return (
+        "# Licence-aware launcher (see bsc_calculations.licenses): a command starts only\n"
+        "# when the counter reports enough free tokens, one start at a time per lock.\n"
+        f"license_free() {{ {counter}; }}\n"
+        f'LICENSE_LOCK="{lock_file}"\n'
+        f'LICENSE_LOG="{log_file}"\n'
+        "license_run() {\n"
+        "    local tokens=$1 cmd=$2 lock requested started free pid status i warned=\n"
+        "    requested=$(date +%s)\n"
+        '    exec {lock}>>"$LICENSE_LOCK"\n'
+        '    flock "$lock"\n'
+        "    while true; do\n"
+        "        free=$(license_free)\n"
+        "        if [[ $free =~ ^-?[0-9]+$ ]]; then\n"
+        "            (( free >= tokens )) && break\n"
+        "        elif [ -z \"$warned\" ]; then\n"
+        "            echo \"[bsc_calculations] WARNING: the licence counter returned '$free'\" >&2\n"
+        "            warned=1\n"
+        "        fi\n"
+        f"        if (( {timeout} > 0 && $(date +%s) - requested >= {timeout} )); then\n"
+        f'            echo "[bsc_calculations] ERROR: no $tokens free licence tokens after {timeout} s" >&2\n'
+        '            exec {lock}>&-\n'
+        "            return 75\n"
+        "        fi\n"
+        f"        sleep {poll}\n"
+        "    done\n"
+        "    started=$(date +%s)\n"
+        '    ( exec {lock}>&-; eval "$cmd" ) &\n'
+        "    pid=$!\n"
+        f"    for (( i = 0; i < {settle}; i++ )); do kill -0 $pid 2> /dev/null || break; sleep 1; done\n"
+        '    exec {lock}>&-\n'
+        "    wait $pid\n"
+        "    status=$?\n"
+        "    printf '%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\n' \"$(hostname)\" \"${SLURM_ARRAY_TASK_ID:-0}\" "
+        '"$tokens" "$requested" "$started" "$(date +%s)" "$free" "$status" >> "$LICENSE_LOG"\n'
+        "    return $status\n"
+        "}\n"
+    )
+
+
+def licenseCommand(job, tokens):
+    """Wrap one job so it runs through license_run with ``tokens`` tokens."""
+
+    if not isinstance(tokens, int) or isinstance(tokens, bool) or tokens < 1:
+        raise ValueError(f"license tokens must be a positive integer, got {tokens!r}")
+    return "license_run " + str(tokens) + " " + shlex.quote(job.rstrip("\n")) + "\n"
+
+
+def writeFakeLicenseServer(script_name, total):
+    """
+    Write a local stand-in for a licence server, for testing wrapped jobs.
+
+    ``bash <script_name> free`` prints the free tokens, ``checkout N`` and
+    ``checkin N`` take and return tokens (checkout fails when too few are
+    free). The state lives in ``<script_name>.state`` under a lock. Use
+    ``bash <script_name> free`` as the counter and call checkout/checkin from
+    the test commands.
+    """
+
+    with open(script_name, "w") as fs:
+        fs.write("#!/bin/bash\n")
+        fs.write("# Fake licence server (see bsc_calculations.licenses.writeFakeLicenseServer)\n")
+        fs.write('STATE="${BASH_SOURCE[0]}.state"\n')
+        fs.write('exec 9>>"$STATE.lock"\nflock 9\n')
+        fs.write(f'[ -s "$STATE" ] || echo {total} > "$STATE"\n')
+        fs.write('read -r FREE < "$STATE"\n')
+        fs.write('case "$1" in\n')
+        fs.write('    free) echo "$FREE" ;;\n')
+        fs.write('    checkout) (( FREE >= $2 )) || exit 1; echo $(( FREE - $2 )) > "$STATE" ;;\n')
+        fs.write('    checkin) echo $(( FREE + $2 )) > "$STATE" ;;\n')
+        fs.write('    *) echo "usage: $0 free|checkout N|checkin N" >&2; exit 2 ;;\n')
+        fs.write("esac\n")
+    return script_name
+
+
+def licenseReport(log_file="license_usage.tsv"):
+    """
+    Summarise the usage log of license_run.
+
+    Returns
+    =======
+    dict
+        commands, failed, wait_mean_s, wait_max_s, token_hours (tokens held
+        while running), peak_tokens (most tokens held at once by the logged
+        commands), span_h (first request to last finish) and mean_tokens
+        (token_hours / span_h, the average tokens in use).
+    """
+
+    records = []
+    with open(log_file) as lf:
+        for line in lf:
+            values = line.rstrip("\n").split("\t")
+            if len(values) != len(USAGE_COLUMNS):
+                continue
+            record = dict(zip(USAGE_COLUMNS, values))
+            for key in ("tokens", "requested", "started", "finished", "status"):
+                record[key] = int(record[key])
+            records.append(record)
+    if not records:
+        raise ValueError(f"No license_run records in {log_file}.")
+
+    waits = [r["started"] - r["requested"] for r in records]
+    token_seconds = sum(r["tokens"] * (r["finished"] - r["started"]) for r in records)
+    events = sorted(
+        [(r["started"], r["tokens"]) for r in records] + [(r["finished"], -r["tokens"]) for r in records],
+        key=lambda e: (e[0], e[1]),
+    )
+    held = peak = 0
+    for _, change in events:
+        held += change
+        peak = max(peak, held)
+    span = max(r["finished"] for r in records) - min(r["requested"] for r in records)
+    return {
+        "commands": len(records),
+        "failed": sum(1 for r in records if r["status"] != 0),
+        "wait_mean_s": sum(waits) / len(waits),
+        "wait_max_s": max(waits),
+        "token_hours": token_seconds / 3600,
+        "peak_tokens": peak,
+        "span_h": span / 3600,
+        "mean_tokens": token_seconds / span if span else 0.0,
+    }
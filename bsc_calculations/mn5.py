@@ -1,8 +1,45 @@
+import itertools
+import json
 import os
+import shlex
+import shutil
+import string
+
+from . import advisor
+from . import core
+from . import dispatcher as task_dispatcher
+from . import environment
+from . import gromacs
+from . import layout
+from . import msa_cache as task_msa_cache
+from . import packing
+from . import payload
+from . import tables
+from . import telemetry as task_telemetry
+from . import workflow
 
 # ── Cluster-resident databases ─────────────────────────────────────────────────
 TREMBL_DB = "/gpfs/projects/bsc72/databases/trembl/uniprot_trembl"
 
+# AlphaFold3 driver provided by the alphafold/3.0.0 module; model weights live in $WEIGHTS.
+AF3_COMMAND = "run_alphafold.py"
+# AF3 modules of the ACC (GPU) module tree and of the GPP one, where the CPU-only
+# data pipeline runs without CUDA.
+AF3_MODULES = ["singularity", "cuda/12.6", "alphafold/3.0.0"]
+AF3_DATA_MODULES = ["singularity", "alphafold/3.0.0"]
+# LigandMPNN driver script (inside the LigandMPNN checkout used with the ligandmpnn env).
+LIGANDMPNN_COMMAND = "python run.py"
+
+# Variables pointing at each preset's model weights (staged by jobArrays(stage_weights=True)).
+MODEL_WEIGHTS = {
+    "alphafold3": ["WEIGHTS"],
+    "bioemu": ["HF_HOME"],
+    "boltz2": ["BOLTZ_CACHE"],
+}
+
+# Presets with a multi-input form usable by jobArrays(inference_batch=...).
+BATCHED_INFERENCE_PROGRAMS = ["alphafold3", "boltz2", "ligandmpnn", "bioemu"]
+
 
 def openmmSimulationCommand(
     prmtop,
@@ -59,6 +96,271 @@ def openmmSimulationCommand(
     return cmd
 
 
+def alphafold3Command(
+    json_path=None,
+    input_dir=None,
+    output_dir="af3_output",
+    stage=None,
+    af3_command=AF3_COMMAND,
+    extra_flags=None,
+):
+    """Return an AlphaFold3 command for one input JSON or a directory of them.
+
+    Parameters
+    ----------
+    json_path : str, optional
+        A single fold input JSON.
+    input_dir : str, optional
+        A directory of input JSONs, all run by ONE process (the model is
+        loaded once for the whole directory).
+    output_dir : str
+        AF3 output directory.
+    stage : str, optional
+        "data" runs only the data pipeline (``--norun_inference``),
+        "inference" only the model (``--norun_data_pipeline``, the inputs
+        being ``*_data.json`` files from the data stage). None runs both.
+    af3_command : str
+        AF3 driver (default AF3_COMMAND).
+    extra_flags : str, optional
+        Extra flags appended verbatim.
+    """
+    if (json_path is None) == (input_dir is None):
+        raise ValueError("Give exactly one of json_path or input_dir.")
+    if stage not in (None, "data", "inference"):
+        raise ValueError("stage must be None, 'data' or 'inference'.")
+
+    parts = [af3_command]
+    if json_path is not None:
+        parts.append(f"--json_path={json_path}")
+    else:
+        parts.append(f"--input_dir={input_dir}")
+    parts.append(f"--output_dir={output_dir}")
+    if stage != "data":
+        parts.append("--model_dir=$WEIGHTS")
+    if stage == "data":
+        parts.append("--norun_inference")
+    elif stage == "inference":
+        parts.append("--norun_data_pipeline")
+    if extra_flags:
+        parts.append(extra_flags)
+    return " ".join(parts)
+
+
+def _cli_flags(flags):
+    """``--key value`` flags from a dict (underscores kept, as these CLIs use them)."""
+    if not flags:
+        return ""
+    return " ".join(f"--{k} {v}" for k, v in flags.items())
+
+
+def _inputDirJob(inputs, batch_dir):
+    """Bash lines collecting ``inputs`` as symlinks in ``batch_dir``."""
+    job = "mkdir -p " + batch_dir + "\n"
+    for path in inputs:
+        job += "ln -sf " + os.path.abspath(path) + " " + batch_dir + "/\n"
+    return job
+
+
+def batchedInferenceJobs(program, inputs, batch_size, output_dir="predictions", flags=None):
+    """Return one multi-input job per ``batch_size`` inputs of a GPU inference preset.
+
+    Every job runs a single process over its whole batch, so the model weights
+    are loaded once per array task instead of once per input:
+
+    - alphafold3: AF3 over a directory of the batch's JSONs (``--input_dir``).
+    - boltz2: ``boltz predict`` over a directory of the batch's YAML/FASTA files.
+    - ligandmpnn: LigandMPNN with a ``--pdb_path_multi`` JSON listing the PDBs.
+    - bioemu: one Python process calling ``bioemu.sample.main`` per input
+      (inputs are sequences or .a3m/.fasta paths).
+
+    Parameters
+    ----------
+    program : str
+        One of BATCHED_INFERENCE_PROGRAMS.
+    inputs : list
+        Input files (sequences for bioemu).
+    batch_size : int
+        Inputs per job.
+    output_dir : str
+        Output directory (bioemu writes one sub-folder per input).
+    flags : dict, optional
+        Extra program options: ``--key value`` flags for the command line
+        tools, keyword arguments of ``bioemu.sample.main`` for bioemu.
+
+    Returns
+    -------
+    list
+        The batched jobs, ready for ``jobArrays``.
+    """
+    if program not in BATCHED_INFERENCE_PROGRAMS:
+        raise ValueError(
+            f"{program} has no multi-input form. Batched inference supports: "
+            + ", ".join(BATCHED_INFERENCE_PROGRAMS)
+            + ". Use group_jobs_by (with stage_weights) for other presets."
+        )
+    if not isinstance(batch_size, int) or isinstance(batch_size, bool) or batch_size < 1:
+        raise ValueError("inference_batch must be a positive integer.")
+
+    batches_dir = os.path.join(output_dir, "batches")
+    zfill = len(str(-(-len(inputs) // batch_size)))
+    jobs = []
+    for start in range(0, len(inputs), batch_size):
+        batch = inputs[start : start + batch_size]
+        batch_name = "batch_" + str(start // batch_size + 1).zfill(zfill)
+        batch_dir = os.path.join(batches_dir, batch_name)
+
+        if program == "alphafold3":
+            job = _inputDirJob(batch, batch_dir)
+            job += alphafold3Command(input_dir=batch_dir, output_dir=output_dir,
+                                     extra_flags=_cli_flags(flags)) + "\n"
+        elif program == "boltz2":
+            job = _inputDirJob(batch, batch_dir)
+            job += ("boltz predict " + batch_dir + " --out_dir " + output_dir
+                    + (" " + _cli_flags(flags) if flags else "") + "\n")
+        elif program == "ligandmpnn":
+            os.makedirs(batches_dir, exist_ok=True)
+            batch_json = os.path.join(batches_dir, batch_name + ".json")
+            with open(batch_json, "w") as bf:
+                json.dump({os.path.abspath(p): "" for p in batch}, bf, indent=1)
+            job = (LIGANDMPNN_COMMAND + " --pdb_path_multi " + batch_json + " --out_folder " + output_dir
+                   + (" " + _cli_flags(flags) if flags else "") + "\n")
+        else:
+            runs = []
+            for k, sequence in enumerate(batch):
+                if os.path.splitext(sequence)[1] in (".a3m", ".fasta", ".fa"):
+                    name = os.path.splitext(os.path.basename(sequence))[0]
+                else:
+                    name = "input_" + str(start + k + 1).zfill(len(str(len(inputs))))
+                runs.append((sequence, os.path.join(output_dir, name)))
+            kwargs = "".join(f", {k}={v!r}" for k, v in (flags or {}).items())
+            job = (
+                "python - <<'BIOEMU_BATCH'\n"
+                "from bioemu.sample import main as sample\n"
+                f"for sequence, output_dir in {runs!r}:\n"
+                f"    sample(sequence=sequence, output_dir=output_dir{kwargs})\n"
+                "BIOEMU_BATCH\n"
+            )
+        jobs.append(job)
+    return jobs
+
+
+def _af3_sanitised_name(json_file):
+    """The job name AF3 uses for its output folder (lower case, [a-z0-9_-.])."""
+    with open(json_file) as jf:
+        name = json.load(jf)["name"]
+    allowed = set(string.ascii_lowercase + string.digits + "_-.")
+    return "".join(c for c in name.lower().replace(" ", "_") if c in allowed)
+
+
+def _is_sweep(value):
+    """True for sequences of sweep values (lists, tuples, ranges, arrays), not strings."""
+    return hasattr(value, "__iter__") and not isinstance(value, (str, bytes, os.PathLike, dict))
+
+
+def _openmmSweepRows(params, mode):
+    """Yield the unique parameter combinations of an openmm sweep as dicts."""
+    if mode not in ("product", "zip"):
+        raise ValueError("mode must be 'product' (cartesian) or 'zip'.")
+
+    swept = {k: list(v) for k, v in params.items() if _is_sweep(v)}
+    fixed = {k: v for k, v in params.items() if k not in swept}
+    if mode == "zip":
+        lengths = {len(v) for v in swept.values()}
+        if len(lengths) > 1:
+            raise ValueError(
+                "mode='zip' needs swept parameters of equal length, got: "
+                + ", ".join(f"{k}={len(v)}" for k, v in swept.items())
+            )
+        combinations = zip(*swept.values())
+    else:
+        combinations = itertools.product(*swept.values())
+
+    seen = set()
+    for values in combinations:
+        key = tuple(str(v) for v in values)
+        if key in seen:
+            continue
+        seen.add(key)
+        row = dict(fixed)
+        row.update(zip(swept, values))
+        yield row
+
+
+def openmmSweep(
+    prmtop,
+    rst7,
+    simulation_time=100,
+    simulation_script="openmm_simulation.py",
+    work_dir=None,
+    mode="product",
+    **kwargs,
+):
+    """Yield openmmSimulationCommand strings for a parameter sweep.
+
+    Any argument (``prmtop``, ``rst7``, ``simulation_time``, ``work_dir`` or
+    an extra ``--flag``) may be a list, tuple, range or array of values.
+    Swept arguments are combined as a cartesian product (``mode="product"``)
+    or element-wise (``mode="zip"``, e.g. one prmtop/rst7/work_dir per
+    system). Commands are generated lazily and identical runs are yielded
+    only once.
+
+    Parameters
+    ----------
+    mode : str
+        "product" (default) or "zip".
+    **kwargs
+        Extra ``--key value`` flags, swept or fixed.
+
+    Examples
+    --------
+    >>> jobs = list(openmmSweep(prmtops, rst7s, work_dir=run_dirs, mode="zip",
+    ...                         seed=[1, 2, 3]))
+    """
+    params = dict(prmtop=prmtop, rst7=rst7, simulation_time=simulation_time,
+                  work_dir=work_dir, **kwargs)
+    for row in _openmmSweepRows(params, mode):
+        yield openmmSimulationCommand(simulation_script=simulation_script, **row)
+
+
+def openmmSweepTable(
+    table_file,
+    prmtop,
+    rst7,
+    simulation_time=100,
+    simulation_script="openmm_simulation.py",
+    work_dir=None,
+    mode="product",
+    **kwargs,
+):
+    """Write an openmm sweep as a parameter table and return its command template.
+
+    Same arguments as ``openmmSweep``. Instead of expanding every command,
+    the unique combinations of the swept arguments are written to
+    ``table_file`` (tab-separated, one row per run) and the returned command
+    has ``{name}`` placeholders for them. Pass it to
+    ``jobArrays([template], parameter_table=table_file, ...)`` so each array
+    task reads only its own row and the script stays one template long.
+
+    Returns
+    -------
+    str
+        The command template.
+    """
+    params = dict(prmtop=prmtop, rst7=rst7, simulation_time=simulation_time,
+                  work_dir=work_dir, **kwargs)
+    swept = [k for k, v in params.items() if _is_sweep(v)]
+    if not swept:
+        raise ValueError("No swept parameter given: pass at least one list of values.")
+
+    rows = ({k: row[k] for k in swept} for row in _openmmSweepRows(params, mode))
+    tables.writeParameterTable(rows, table_file, columns=swept)
+
+    template = dict(params)
+    for k in swept:
+        template[k] = "{" + k + "}"
+    return openmmSimulationCommand(simulation_script=simulation_script, **template)
+
+
 def jobArrays(
     jobs,
     script_name=None,
@@ -83,6 +385,8 @@ def jobArrays(
     jobs_range=None,
     group_jobs_by=None,
     mps=None,
+    cpu_bind=False,
+    job_steps=None,
     pythonpath=None,
     local_libraries=False,
     msd_version=None,
@@ -92,6 +396,30 @@ def jobArrays(
     exports=None,
     sources=None,
     colabfold_dir=None,
+    msa_cache=None,
+    msa_database=None,
+    telemetry=None,
+    telemetry_dir="telemetry",
+    advice=None,
+    env_snapshot=False,
+    env_snapshot_dir="$HOME/.bsc_calculations/env_snapshots",
+    conda_pack=None,
+    conda_pack_dir="${TMPDIR:-/tmp}",
+    parameter_table=None,
+    concurrency=None,
+    inference_batch=None,
+    inference_output="predictions",
+    inference_flags=None,
+    stage_weights=False,
+    stage_weights_dir="${TMPDIR:-/tmp}",
+    gromacs_structures=None,
+    gromacs_multidir=None,
+    gromacs_mdrun_args="-deffnm md",
+    job_payload=None,
+    payload_jobs_per_frame=64,
+    dispatcher=False,
+    throttle=None,
+    throttle_demands=None,
 ):
     """
     Set up job array scripts for marenostrum slurm job manager.
@@ -115,8 +443,29 @@ def jobArrays(
         Service). Each array task runs `mps` job commands in parallel under an MPS control
         daemon (with OMP_NUM_THREADS = cpus-per-task / mps), sharing one GPU -- the
         throughput-efficient layout when a single job under-utilizes the GPU. Requires
-        gpus=1 and is mutually exclusive with group_jobs_by (which bundles sequentially).
+        gpus=1 (or a whole ACC node, gpus=4 with cpu_bind) and is mutually exclusive with
+        group_jobs_by (which bundles sequentially).
         Benchmark the packing factor per system before committing (efficiency knee).
+    cpu_bind : bool
+        Pin packed processes to their own cores so they neither migrate across NUMA domains
+        nor fight over cores. With mps and gpus=1 each process gets a contiguous slice of
+        the task's cores, computed at runtime from its affinity list (taskset +
+        OMP_PLACES=cores). With mps and gpus=4 the task owns a whole ACC node and runs
+        mps x 4 processes, each pinned to a NUMA-local slot of layout.packedLayout("mn5_acc")
+        with a GPU of its own domain. With job_steps every step runs in a slot of the
+        node layout of the partition (srun --cpu-bind=mask_cpu, OMP placement,
+        CUDA_VISIBLE_DEVICES); the allocation must then fill whole nodes
+        (ntasks x cpus_per_task = nodes x cores).
+    job_steps : int
+        Pack all jobs into ONE allocation (no job array) and run each one as a concurrent
+        `srun --exclusive` job step of `job_steps` MPI ranks. A slot scheduler keeps
+        ntasks / job_steps steps running and backfills freed cores as soon as a step ends,
+        so many small MPI runs (cp2k, orca, Q6) pay queue wait and allocation once. Size
+        the allocation with ntasks (total ranks, a multiple of job_steps) and nodes. Write
+        `SRUN_STEP` in place of `mpirun -np N` for codes launched directly; commands
+        without it (ORCA, which spawns its own mpirun) run in a one-task step owning
+        `job_steps` cores. See packing.jobStepsBlock. Mutually exclusive with
+        group_jobs_by and mps.
     local_libraries : bool
         Add local libraries (e.g., prepare_proteins) to PYTHONPATH?
     colabfold_dir : (bool, str)
@@ -126,50 +475,137 @@ def jobArrays(
         where colabfold_search runs beforehand and bioemu is fed an .a3m file.
         True exports the colabfold folder shipped inside the bioemu conda env;
         a string exports that path instead. None (default) does not export it.
+    msa_cache : str
+        Only used by program='bioemu'. Content-addressed MSA cache directory (see
+        msa_cache.setUpMSACache): raw sequences whose alignment is cached there are
+        replaced by their .a3m path, in `--sequence` arguments of the jobs or in the
+        inputs of inference_batch, so bioemu skips the MSA search. Sequences not in the
+        cache are left as they are (bioemu searches them itself, see colabfold_dir).
+    msa_database : str
+        Database tag of the msa_cache keys (default msa_cache.DEFAULT_DATABASE).
+    telemetry : (bool, int)
+        Opt-in per-task resource telemetry. True samples every 30 s, an integer sets the
+        sampling interval in seconds. Each task writes CPU time, RSS, I/O bytes and (when
+        nvidia-smi exists) GPU utilisation/memory to <telemetry_dir>/<job>_<task>_<id>.csv;
+        telemetry.summarizeTelemetry(telemetry_dir) reports efficiency per program preset.
+    telemetry_dir : str
+        Directory for the telemetry CSV files (default "telemetry").
+    advice : (dict, str)
+        Right-sizing advice from advisor.recommendResources (or the JSON file written by
+        advisor.saveAdvice). When the entry for `program` exists, its cpus_per_task,
+        mem_per_cpu, highmem, time and mps fill in the arguments left at their defaults;
+        explicit arguments always win. cpus_per_task and mps are only taken where they
+        apply (CPU partitions / single-GPU tasks without other bundling).
+    env_snapshot : bool
+        Run the module purge/unload/load, sources and conda activation only in the first
+        task and save the resulting environment to <env_snapshot_dir>; later tasks source
+        the snapshot instead (seconds to tens of seconds less per task on GPFS). The file
+        name hashes the preset, the setup lines and the partition family, so changing any
+        module or env uses a fresh snapshot. See environment.snapshotBlock.
+    env_snapshot_dir : str
+        Directory for the environment snapshots (shared by all tasks).
+    conda_pack : (bool, str)
+        Activate the preset's conda env from a conda-pack archive extracted to node-local
+        storage instead of from GPFS, so Python imports stop walking thousands of small
+        files on the shared filesystem. True uses <conda_env>.tar.gz; a string gives the
+        archive path (.tar, .tar.gz or .squashfs). Build it once with
+        environment.packCommand(conda_env). The archive is extracted under a lock once
+        per node (and per archive version); tasks fall back to the GPFS env if that fails.
+    conda_pack_dir : str
+        Node-local directory to extract into (default $TMPDIR, which is per job; use a
+        persistent node-local path such as /tmp to share one copy between array tasks).
+    parameter_table : (str, object)
+        Parameters of each task as a table: a TSV or CSV file with a header line, or an
+        in-memory table (pandas DataFrame, numpy structured or 2D array, dict of columns,
+        list of dicts; written to <job_name>_parameters.tsv next to the script). jobs is then a single command
+        template with {column} placeholders ({0}, {1}... for unnamed columns); the array has
+        one task per row and task N substitutes row N, read through a byte-offset index
+        (<table>.idx) so it never scans the table. The script holds the template once
+        whatever the number of tasks. jobs_range selects a row range. Mutually exclusive
+        with group_jobs_by, mps and job_steps. See tables.prepareParameterTable.
+    concurrency : (int, bool)
+        With group_jobs_by, run the commands of each array task through a bounded parallel
+        executor (at most `concurrency` at a time; True uses all the task's cores)
+        instead of one after the other. Each command runs in its own subshell and its
+        exit code is written to <output>_<task>_<jobid>.exitcodes; the task reports the
+        failures at the end.
+    inference_batch : int
+        Batched GPU inference for alphafold3, boltz2, ligandmpnn and bioemu: jobs are then the
+        INPUTS (AF3 JSONs, boltz YAML/FASTA, PDBs, bioemu sequences or .a3m files) and every
+        array task runs ONE process over `inference_batch` of them through the program's
+        multi-input form, so the model weights are loaded once per task instead of once per
+        input. See batchedInferenceJobs. Mutually exclusive with group_jobs_by, mps,
+        job_steps and parameter_table.
+    inference_output : str
+        Output directory of the batched inference (default "predictions").
+    inference_flags : dict
+        Extra program options for the batched inference (--key value flags; keyword
+        arguments of bioemu.sample.main for bioemu).
+    stage_weights : (bool, list)
+        Copy the model weights to node-local disk once per node (under a lock) and point
+        the preset at the copy. True stages the preset's weights (MODEL_WEIGHTS: $WEIGHTS
+        for alphafold3, the HuggingFace cache for bioemu, $BOLTZ_CACHE for boltz2); a list
+        names the variables holding weight directories to stage.
+    stage_weights_dir : str
+        Node-local directory for the staged weights (default $TMPDIR).
+    gromacs_structures : (str, list)
+        Only used by program='gromacs'. The .gro, .pdb or .tpr of the system (one for all
+        jobs or one per job), from which the atom count and box size the mdrun
+        decomposition: MPI ranks (mpirun -np for gmx_mpi, -ntmpi for gmx), -ntomp, -npme,
+        -nb/-pme/-bonded gpu with -gpu_id, and -pin on with a -pinoffset per simulation
+        packed with mps or concurrency. Without it the .tpr given to mdrun (-s/-deffnm) is
+        read when it already exists; otherwise the size checks are skipped. Options already
+        in the mdrun command are kept. See gromacs.planMdrun.
+    gromacs_multidir : (int, bool)
+        Only used by program='gromacs'. Run replicas of a system as gmx_mpi mdrun -multidir
+        ensembles of this many replicas per array task (True: one replica per GPU of the
+        task) instead of one mpirun launch per replica. jobs are then the replica
+        directories, or .tpr files that get their own directory under replicas/. The ranks,
+        threads and GPUs of the task are split between the replicas; each replica's log is
+        collected into replica_logs/ with its ns/day in replica_logs/performance.tsv.
+        Mutually exclusive with group_jobs_by, mps, job_steps and parameter_table. See
+        gromacs.multidirJobs.
+    gromacs_mdrun_args : str
+        mdrun options shared by the replicas of gromacs_multidir (default "-deffnm md").
+    job_payload : (bool, str)
+        Store the job commands compressed in <job_name>_jobs.gz (or .zst) instead of in
+        the script: True or 'gzip', or 'zstd' (needs the zstandard package to generate and
+        zstd on the nodes). The jobs are compressed in frames of payload_jobs_per_frame
+        jobs with a byte-offset index (<payload>.idx); array task N decompresses only the
+        frame holding job N. The script holds one small block whatever the number of jobs.
+        The payload is written next to the script. Mutually exclusive with job_steps and
+        parameter_table. See payload.writeJobPayload.
+    payload_jobs_per_frame : int
+        Jobs per compressed frame of job_payload (default 64).
+    dispatcher : (bool, str)
+        Launch every task through a small Python dispatcher (dispatcher.py, stdlib only,
+        copied to <job_name>_dispatch.py) instead of a bash body: the script keeps only the
+        #SBATCH header and one exec line. The dispatcher reads the task's command from the
+        job payload (job_payload, gzip by default), restores the module/conda environment
+        from a JSON snapshot in env_snapshot_dir when env_snapshot is set (running the setup
+        in <job_name>_env.sh once otherwise), sources <job_name>_prelude.sh (exports, helpers
+        such as chemshell_run) and execs the command with bash. Each task appends its
+        dispatch overhead to <job_name>_dispatch.tsv. These files are written next to the
+        script. True runs python3; a string gives the interpreter. Mutually exclusive with job_steps, parameter_table, concurrency,
+        telemetry, stage_weights and conda_pack.
+    throttle : (int, dict)
+        Limit the array tasks running at once (--array=1-N%throttle): the limit, or the
+        budgets of shared resources, e.g. {"licenses": 40} or {"io_streams": 16} for
+        I/O-heavy searches (hmmer, blast), from which the limit is computed. See
+        throttle.arrayThrottle, and throttle.writeThrottleMonitor to adjust it live.
+    throttle_demands : dict
+        Units of each throttle budget one task uses (default 1 each).
     """
 
-    # --- Normalize and clamp walltime (accepts None | int hours | (hours, minutes))
-    def _normalize_time(partition_name, time_val):
-        """
-        Returns:
-          sbatch_time_str: 'HH:MM:SS'
-          norm_tuple: (hours, minutes)
-        """
-        def as_tuple(tv):
-            if tv is None:
-                return None
-            if isinstance(tv, int):
-                return (tv, 0)
-            if isinstance(tv, (tuple, list)) and len(tv) == 2:
-                h, m = int(tv[0]), int(tv[1])
-                if m >= 60:
-                    h += m // 60
-                    m = m % 60
-                return (max(h, 0), max(m, 0))
-            raise ValueError("time must be None, int (hours), or (hours, minutes)")
-
-        p = (partition_name or "").lower()
-        is_debug = "debug" in p or p in {"gp_debug", "acc_debug"}
-        is_bscls = p.endswith("bscls") or p in {"gp_bscls", "acc_bscls"}
-
-        default = (2, 0) if is_debug else ((48, 0) if is_bscls else (24, 0))
-        cap_minutes = 120 if is_debug else (48 * 60 if is_bscls else None)
-
-        ht = as_tuple(time_val) or default
-        total = ht[0] * 60 + ht[1]
-        if cap_minutes is not None and total > cap_minutes:
-            print(
-                f"Requested time {ht[0]}h{ht[1]:02d} exceeds partition cap; "
-                f"clamping to {cap_minutes//60}h{cap_minutes%60:02d}."
-            )
-            total = cap_minutes
-        hours, minutes = divmod(total, 60)
-        return f"{hours:02d}:{minutes:02d}:00", (hours, minutes)
-
     # Check input
     if isinstance(jobs, str):
         jobs = [jobs]
 
+    # Keep the caller's lists untouched by the program presets
+    modules, unload_modules, pythonpath, pathMN, extras, exports, sources = core.copyLists(
+        modules, unload_modules, pythonpath, pathMN, extras, exports, sources
+    )
+
     if jobs_range != None:
         if (
             not isinstance(jobs_range, (list, tuple))
@@ -185,30 +621,120 @@ def jobArrays(
             "You must select a partition. Available partitions are: "
             "acc_debug, acc_bscls, gp_debug, gp_bscls"
         )
+    if partition not in core.PROFILES["mn5"]["partitions"]:
+        raise ValueError(
+            "Wrong partition selected. Available partitions are:"
+            + ", ".join(core.PROFILES["mn5"]["partitions"])
+        )
+
+    # Cached MSAs: feed bioemu the .a3m of every sequence already aligned.
+    if msa_cache is not None:
+        if program != "bioemu":
+            raise ValueError("msa_cache is only used by program='bioemu'.")
+        if msa_database is None:
+            msa_database = task_msa_cache.DEFAULT_DATABASE
+        if inference_batch is not None:
+            sequences = [s for s in jobs if os.path.splitext(s)[1] not in (".a3m", ".fasta", ".fa")]
+        else:
+            sequences = [m for job in jobs for m in task_msa_cache.SEQUENCE_ARGUMENT.findall(job)]
+        cached = task_msa_cache.lookupCachedMSAs(sequences, msa_cache, msa_database)
+        missing = len(set(sequences) - set(cached))
+        if missing:
+            print(
+                f"[bsc_calculations] WARNING: {missing} sequence(s) have no cached MSA in {msa_cache}; "
+                "bioemu will run their MSA search itself."
+            )
+        if inference_batch is not None:
+            jobs = [cached.get(s, s) for s in jobs]
+        else:
+            jobs = task_msa_cache.useCachedMSAs(jobs, cached)
+
+    # Batched GPU inference: jobs are inputs, each task runs one multi-input process.
+    if inference_batch is not None:
+        if group_jobs_by is not None or mps is not None or job_steps is not None or parameter_table is not None:
+            raise ValueError(
+                "inference_batch is mutually exclusive with group_jobs_by, mps, job_steps and parameter_table."
+            )
+        jobs = batchedInferenceJobs(program, jobs, inference_batch, inference_output, inference_flags)
+
+    # Fill the sizing arguments the caller left at their defaults from the
+    # right-sizing advice for this preset (explicit arguments always win).
+    if advice is not None and program is not None:
+        if isinstance(advice, str):
+            advice = advisor.loadAdvice(advice)
+        preset_advice = advice.get(program) or {}
+        applied = []
+        if cpus_per_task is None and "acc" not in partition and preset_advice.get("cpus_per_task"):
+            cpus_per_task = preset_advice["cpus_per_task"]
+            applied.append(f"cpus_per_task={cpus_per_task}")
+        if mem_per_cpu is None and preset_advice.get("mem_per_cpu"):
+            mem_per_cpu = preset_advice["mem_per_cpu"]
+            applied.append(f"mem_per_cpu={mem_per_cpu}")
+        if not highmem and preset_advice.get("highmem"):
+            highmem = True
+            applied.append("highmem=True")
+        if time is None and preset_advice.get("time"):
+            time = tuple(preset_advice["time"])
+            applied.append(f"time={time}")
+        if (
+            mps is None
+            and (preset_advice.get("mps") or 1) > 1
+            and "acc" in partition
+            and gpus == 1
+            and group_jobs_by is None
+            and job_steps is None
+        ):
+            mps = preset_advice["mps"]
+            applied.append(f"mps={mps}")
+        if applied:
+            print(f"[bsc_calculations] Applying right-sizing advice for {program}: " + ", ".join(applied))
 
     # Capture whether the caller passed an explicit walltime *before* the
     # generic normalisation rewrites None into the partition default.
     # Program-specific blocks (e.g. alphafold3) consult this so they can
     # apply their own default only when the user has not opted in.
     _user_supplied_time = time is not None
-    sbatch_time, time = _normalize_time(partition, time)
+    time = core.clampTime("mn5", partition, time)
+
+    # GROMACS: size ranks, threads, GPU offload and pinning of every mdrun from the
+    # system and the allocation, before the jobs are bundled.
+    if program == "gromacs":
+        if "acc" in partition:
+            gmx_gpus, gmx_cores = gpus, cpus_per_task or gpus * 20
+        else:
+            gmx_gpus, gmx_cores = 0, (cpus_per_task or 1) * ntasks
+        if gromacs_multidir:
+            # Replicas (directories or .tpr files) run as mdrun -multidir ensembles.
+            if group_jobs_by is not None or mps is not None or job_steps is not None or parameter_table is not None:
+                raise ValueError(
+                    "gromacs_multidir is mutually exclusive with group_jobs_by, mps, job_steps and parameter_table."
+                )
+            if gromacs_multidir is True:
+                if not gmx_gpus:
+                    raise ValueError("gromacs_multidir=True fills the task's GPUs; give the replicas per ensemble on CPU partitions.")
+                gromacs_multidir = gmx_gpus
+            if isinstance(gromacs_structures, list):
+                gromacs_structures = gromacs_structures[0]
+            jobs = gromacs.multidirJobs(
+                jobs, gromacs_multidir, gromacs_mdrun_args, gpus=gmx_gpus, cores=gmx_cores,
+                structure=gromacs_structures,
+            )
+        else:
+            gmx_simulations = 1
+            if mps is not None:
+                gmx_simulations = mps
+            elif isinstance(group_jobs_by, int) and concurrency is not None:
+                gmx_simulations = group_jobs_by if concurrency is True else min(concurrency, group_jobs_by)
+            jobs = gromacs.decomposeJobs(
+                jobs, gromacs_structures, gpus=gmx_gpus, cores=gmx_cores, simulations=gmx_simulations
+            )
+    elif gromacs_multidir:
+        raise ValueError("gromacs_multidir is only available for program='gromacs'.")
 
     # Group jobs to enter in the same job array (useful for launching many short
     # jobs when there are a max_job_allowed limit per user.)
-    if isinstance(group_jobs_by, int):
-        grouped_jobs = []
-        gj = ""
-        for i, j in enumerate(jobs):
-            gj += j.rstrip("\n") + "\n"
-            if (i + 1) % group_jobs_by == 0:
-                grouped_jobs.append(gj)
-                gj = ""
-        if gj != "":
-            grouped_jobs.append(gj)
-        jobs = grouped_jobs
-
-    elif not isinstance(group_jobs_by, type(None)):
-        raise ValueError("You must give an integer to group jobs by this number.")
+    # With concurrency, each group runs through a bounded parallel executor instead of sequentially.
+    jobs = core.groupJobs(jobs, group_jobs_by, concurrency)
 
     # NVIDIA MPS packing: run `mps` jobs concurrently on ONE GPU per array task. Each group is
     # wrapped in the MPS control-daemon boilerplate; the existing per-array-task emission below
@@ -218,30 +744,102 @@ def jobArrays(
             raise ValueError("mps must be a positive integer (jobs packed per GPU under NVIDIA MPS).")
         if group_jobs_by is not None:
             raise ValueError("mps and group_jobs_by are mutually exclusive (both bundle jobs per array task).")
-        if gpus != 1:
-            raise ValueError("mps packing shares ONE GPU across the packed processes; use gpus=1.")
-        if len(jobs) % mps != 0:
+        acc_gpus = layout.NODE_SHAPES["mn5_acc"]["gpus"]
+        whole_node = cpu_bind and gpus == acc_gpus
+        if gpus != 1 and not whole_node:
+            raise ValueError(
+                "mps packing shares ONE GPU across the packed processes; use gpus=1 "
+                f"(or gpus={acc_gpus} with cpu_bind=True to pack a whole node)."
+            )
+        per_task = mps * gpus
+        if len(jobs) % per_task != 0:
             print(
-                f"[bsc_calculations] WARNING: {len(jobs)} jobs is not divisible by mps={mps}; "
-                f"the last array task will pack fewer than {mps} processes."
+                f"[bsc_calculations] WARNING: {len(jobs)} jobs is not divisible by {per_task}; "
+                f"the last array task will pack fewer than {per_task} processes."
             )
+        if whole_node:
+            slots = layout.packedLayout("mn5_acc", jobs_per_node=per_task)
         mps_jobs = []
-        for start in range(0, len(jobs), mps):
-            bundle = [j.rstrip("\n") for j in jobs[start : start + mps]]
+        for start in range(0, len(jobs), per_task):
+            bundle = [j.rstrip("\n") for j in jobs[start : start + per_task]]
             block = (
                 "export CUDA_MPS_PIPE_DIRECTORY=/tmp/nvidia-mps-$SLURM_JOB_ID-$SLURM_ARRAY_TASK_ID\n"
                 "export CUDA_MPS_LOG_DIRECTORY=/tmp/nvidia-mps-log-$SLURM_JOB_ID-$SLURM_ARRAY_TASK_ID\n"
                 'mkdir -p "$CUDA_MPS_PIPE_DIRECTORY" "$CUDA_MPS_LOG_DIRECTORY"\n'
                 "nvidia-cuda-mps-control -d\n"
-                f"export OMP_NUM_THREADS=$(( SLURM_CPUS_PER_TASK / {mps} > 0 ? SLURM_CPUS_PER_TASK / {mps} : 1 ))\n"
+                f"export OMP_NUM_THREADS=$(( SLURM_CPUS_PER_TASK / {per_task} > 0 ? SLURM_CPUS_PER_TASK / {per_task} : 1 ))\n"
             )
-            for cmd in bundle:
-                block += cmd + " &\n"
-            block += "wait\n"
+            # Wait only on the packed processes: a bare wait would also wait for the telemetry sampler
+            block += "MPS_PIDS=()\n"
+            if whole_node:
+                for k, cmd in enumerate(bundle):
+                    block += "( " + layout.bindingCommand(slots[k]) + "\n"
+                    block += cmd + "\n) &\n"
+                    block += "MPS_PIDS+=($!)\n"
+            elif cpu_bind:
+                block += layout.allocationCpusBlock()
+                for k, cmd in enumerate(bundle):
+                    block += "( " + layout.slotBindingCommand(k, len(bundle)) + "\n"
+                    block += cmd + "\n) &\n"
+                    block += "MPS_PIDS+=($!)\n"
+            else:
+                for cmd in bundle:
+                    block += cmd + " &\n"
+                    block += "MPS_PIDS+=($!)\n"
+            block += 'wait "${MPS_PIDS[@]}"\n'
             block += "echo quit | nvidia-cuda-mps-control\n"
             mps_jobs.append(block)
         jobs = mps_jobs
 
+    elif cpu_bind and job_steps is None:
+        raise ValueError("cpu_bind pins the processes packed by mps or job_steps; set one of them as well.")
+
+    # srun job-step packing: one allocation, each job launched as a concurrent step.
+    if job_steps is not None:
+        if not isinstance(job_steps, int) or isinstance(job_steps, bool) or job_steps < 1:
+            raise ValueError("job_steps must be a positive integer (MPI ranks per job step).")
+        if group_jobs_by is not None or mps is not None:
+            raise ValueError("job_steps is mutually exclusive with group_jobs_by and mps.")
+        if ntasks < job_steps or ntasks % job_steps != 0:
+            raise ValueError(
+                f"ntasks ({ntasks}) must be a multiple of job_steps ({job_steps}): it is the "
+                "total number of ranks shared by the concurrent job steps."
+            )
+        step_shape = None
+        if cpu_bind:
+            # Absolute core masks: the allocation must own its nodes entirely
+            step_shape = "mn5_acc" if "acc" in partition else "mn5_gpp"
+            step_threads = cpus_per_task or (gpus * 20 if "acc" in partition else 1)
+            node_cores = layout.NODE_SHAPES[step_shape]["cores"]
+            if ntasks * step_threads != (nodes or 1) * node_cores:
+                raise ValueError(
+                    f"cpu_bind with job_steps needs whole nodes: ntasks x cpus_per_task = "
+                    f"{ntasks * step_threads}, but {nodes or 1} node(s) have {(nodes or 1) * node_cores} cores."
+                )
+
+    if parameter_table is not None and (mps is not None or job_steps is not None):
+        raise ValueError("parameter_table is mutually exclusive with mps and job_steps.")
+    if job_payload and job_steps is not None:
+        raise ValueError("job_payload is mutually exclusive with job_steps.")
+
+    if dispatcher and (
+        job_steps is not None or parameter_table is not None or concurrency is not None
+        or telemetry or stage_weights or conda_pack
+    ):
+        raise ValueError(
+            "dispatcher is mutually exclusive with job_steps, parameter_table, concurrency, "
+            "telemetry, stage_weights and conda_pack."
+        )
+
+    telemetry = core.checkTelemetry(telemetry)
+
+    # Parameter table (each array task reads its own row) or job payload (the
+    # dispatcher reads its jobs from one as well); see core.taskLayout.
+    array_tasks, jobs_range = core.taskLayout(
+        jobs, job_name, script_name, jobs_range, group_jobs_by, parameter_table,
+        job_payload or bool(dispatcher), payload_jobs_per_frame,
+    )
+
     # Check PYTHONPATH variable
     if pythonpath == None:
         pythonpath = []
@@ -261,6 +859,7 @@ def jobArrays(
         "gromacs",
         "alphafold",
         "alphafold3",
+        "alphafold3_data",
         "hmmer",
         "asitedesign",
         "blast",
@@ -308,31 +907,6 @@ def jobArrays(
             'GMXBIN="mpirun --bind-to none -report-bindings gmx_mpi"',
         ]
 
-        if cpus_per_task > 1:
-            warning_message = """
-            ----------------------------------------------------------------------------------------------
-            |                                          WARNING                                           |
-            ----------------------------------------------------------------------------------------------
-
-            With cpus_per_task != 1 you might encounter the following
-            GROMACS error:
-
-            | Fatal error:
-            | There is no domain decomposition for {cpus_per_task} ranks that is
-            | compatible with the given box and a minimum cell size of
-            | ___ nm
-            | Change the number of ranks or mdrun option -rcon or -dds or
-            | your LINCS settings. Look in the log file for details on the
-            | domain decomposition
-            """
-            print(warning_message)
-
-        # Update mpi and omp options to match cpu and gpus
-        gromacs_jobs = []
-        for job in jobs:
-            gromacs_jobs.append(job.replace("mdrun", f"mdrun -pin on -pinoffset 0"))
-        jobs = gromacs_jobs
-
     if program == "openmm":
         openmm_modules = ["anaconda", "cuda/11.8"]
         if modules == None:
@@ -382,11 +956,10 @@ def jobArrays(
 
     if program == "alphafold3":
         module_purge = True
-        af3_modules = ["singularity", "cuda/12.6", "alphafold/3.0.0"]
         if modules is None:
-            modules = af3_modules
+            modules = list(AF3_MODULES)
         else:
-            modules += af3_modules
+            modules = modules + AF3_MODULES
 
         if partition == "gp_debug":
             partition = "acc_debug"
@@ -399,10 +972,9 @@ def jobArrays(
         # which timed out long-MSA jobs even though acc_bscls allows up to 48h.
         if not _user_supplied_time:
             time = (2, 0)
-        sbatch_time, time = _normalize_time(partition, time)
+        time = core.clampTime("mn5", partition, time)
 
-        if exports is None:
-            exports = []
+        exports = [] if exports is None else list(exports)
 
         required_exports = [
             "WEIGHTS=/gpfs/projects/bsc72/weights/AF3/",
@@ -411,6 +983,28 @@ def jobArrays(
             if export not in exports:
                 exports.append(export)
 
+    if program == "alphafold3_data":
+        # CPU half of the AF3 pipeline (jackhmmer/nhmmer MSAs + template
+        # search, run with --norun_inference): same container and modules as
+        # program="alphafold3" but kept on the GPP partition so the data
+        # pipeline does not hold H100 nodes, with the GPP module set. See
+        # setUpAlphaFold3Pipeline.
+        module_purge = True
+        if modules is None:
+            modules = list(AF3_DATA_MODULES)
+        else:
+            modules = modules + AF3_DATA_MODULES
+
+        if partition == "acc_debug":
+            partition = "gp_debug"
+        if partition == "acc_bscls":
+            partition = "gp_bscls"
+        time = core.clampTime("mn5", partition, time)
+
+        exports = [] if exports is None else list(exports)
+        if "WEIGHTS=/gpfs/projects/bsc72/weights/AF3/" not in exports:
+            exports.append("WEIGHTS=/gpfs/projects/bsc72/weights/AF3/")
+
     if program == "blast":
         if modules == None:
             modules = ["blast"]
@@ -841,6 +1435,21 @@ def jobArrays(
         if partition == "gp_bscls":
             partition = "acc_bscls"
 
+    # Model weights staged to node-local disk
+    if stage_weights is True:
+        if program not in MODEL_WEIGHTS:
+            raise ValueError(
+                "stage_weights=True needs a preset with known weights ("
+                + ", ".join(MODEL_WEIGHTS)
+                + "); pass the variables holding the weight directories instead."
+            )
+        stage_weights = MODEL_WEIGHTS[program]
+        if program == "boltz2":
+            exports = [] if exports is None else list(exports)
+            exports.append("BOLTZ_CACHE=${BOLTZ_CACHE:-$HOME/.boltz}")
+    elif isinstance(stage_weights, str):
+        stage_weights = [stage_weights]
+
     #! Partitions
     available_partitions = ["acc_debug", "acc_bscls", "gp_debug", "gp_bscls"]
 
@@ -859,23 +1468,7 @@ def jobArrays(
     elif not script_name.endswith(".sh"):
         script_name += ".sh"
 
-    if modules != None:
-        if isinstance(modules, str):
-            modules = [modules]
-        if not isinstance(modules, list):
-            raise ValueError(
-                "Modules to load must be given as a list or as a string (for loading one module only)"
-            )
-    if unload_modules != None:
-        if isinstance(unload_modules, str):
-            unload_modules = [unload_modules]
-        if not isinstance(unload_modules, list):
-            raise ValueError(
-                "Modules to unload must be given as a list or as a string (for unloading one module only)"
-            )
-    if conda_env != None:
-        if not isinstance(conda_env, str):
-            raise ValueError("The conda environment must be given as a string")
+    modules, unload_modules = core.checkModules(modules, unload_modules, conda_env)
 
     if sources is not None:
         if not isinstance(sources, list) or not all(isinstance(s, str) for s in sources):
@@ -885,6 +1478,9 @@ def jobArrays(
     if jobs_range != None:
         jobs = jobs[jobs_range[0] - 1 : jobs_range[1]]
 
+    if program == "RFDiffusion":
+        jobs = core.replaceInJobs(jobs, "SCRIPT_PATH", "/gpfs/projects/bsc72/RFdiffusion/scripts")
+
     # Write jobs as array
     with open(script_name, "w") as sf:
         sf.write("#!/bin/bash\n")
@@ -894,7 +1490,7 @@ def jobArrays(
             if not isinstance(nodes, int) or isinstance(nodes, bool) or nodes < 1:
                 raise ValueError(f"nodes must be a positive integer, got {nodes!r}")
             sf.write("#SBATCH --nodes=" + str(nodes) + "\n")
-        sf.write("#SBATCH --time=" + sbatch_time + "\n")
+        sf.write(f"#SBATCH --time={time[0]:02d}:{time[1]:02d}:00\n")
         sf.write("#SBATCH --ntasks " + str(ntasks) + "\n")
         if "acc" in partition:
             sf.write("#SBATCH --gres gpu:" + str(gpus) + "\n")
@@ -907,32 +1503,56 @@ def jobArrays(
             sf.write("#SBATCH --mem-per-cpu " + str(mem_per_cpu) + "\n")
         if cpus_per_task != None:
             sf.write("#SBATCH --cpus-per-task " + str(cpus_per_task) + "\n")
-        sf.write("#SBATCH --array=1-" + str(len(jobs)) + "\n")
-        sf.write("#SBATCH --output=" + output + "_%a_%A.out\n")
-        sf.write("#SBATCH --error=" + output + "_%a_%A.err\n")
+        if job_steps is not None:
+            sf.write("#SBATCH --output=" + output + "_%j.out\n")
+            sf.write("#SBATCH --error=" + output + "_%j.err\n")
+        else:
+            sf.write(
+                "#SBATCH --array="
+                + core.arraySpec(*core.taskRange(array_tasks, jobs), throttle, throttle_demands)
+                + "\n"
+            )
+            sf.write("#SBATCH --output=" + output + "_%a_%A.out\n")
+            sf.write("#SBATCH --error=" + output + "_%a_%A.err\n")
         if mail != None:
             sf.write("#SBATCH --mail-user=" + mail + "\n")
             sf.write("#SBATCH --mail-type=END,FAIL\n")
         sf.write("\n")
 
+        env_setup = ""
         if module_purge:
-            sf.write("module purge\n")
+            env_setup += "module purge\n"
         if unload_modules != None:
             for module in unload_modules:
-                sf.write("module unload " + module + "\n")
-            sf.write("\n")
+                env_setup += "module unload " + module + "\n"
+            env_setup += "\n"
         if modules != None:
             for module in modules:
-                sf.write("module load " + module + "\n")
-            sf.write("\n")
+                env_setup += "module load " + module + "\n"
+            env_setup += "\n"
         if sources != None:
             for s in sources:
-                sf.write("source " + s + "\n")
-            sf.write("\n")
+                env_setup += "source " + s + "\n"
+            env_setup += "\n"
         if conda_eval_bash:
-            sf.write('eval "$(conda shell.bash hook)"\n')
-        if conda_env != None:
-            sf.write("source activate " + conda_env + "\n")
+            env_setup += 'eval "$(conda shell.bash hook)"\n'
+        if conda_env != None and not conda_pack:
+            env_setup += "source activate " + conda_env + "\n"
+            env_setup += "\n"
+
+        if dispatcher:
+            # Run (or restored from its snapshot) by the dispatcher
+            pass
+        elif env_snapshot and env_setup:
+            snapshot_name = environment.snapshotKey(env_setup, program, partition)
+            sf.write(environment.snapshotBlock(env_setup, env_snapshot_dir, snapshot_name, conda_env))
+            sf.write("\n")
+        else:
+            sf.write(env_setup)
+
+        if conda_pack:
+            archive = environment.packedArchive(conda_env, conda_pack)
+            sf.write(environment.packedEnvBlock(archive, conda_pack_dir, conda_env))
             sf.write("\n")
 
         if exports != None:
@@ -954,35 +1574,203 @@ def jobArrays(
         for extra in extras:
             sf.write(extra + "\n")
 
-    for i in range(len(jobs)):
+        if stage_weights:
+            sf.write(environment.stagedWeightsBlock(stage_weights, stage_weights_dir))
+            sf.write("\n")
 
-        if program == "RFDiffusion":
-            if "SCRIPT_PATH" in jobs[i]:
-                jobs[i] = jobs[i].replace(
-                    "SCRIPT_PATH", "/gpfs/projects/bsc72/RFdiffusion/scripts"
-                )
+        if concurrency is not None:
+            sf.write(packing.concurrentHelpers(concurrency, output))
+            sf.write("\n")
 
-        with open(script_name, "a") as sf:
-            sf.write("if [[ $SLURM_ARRAY_TASK_ID = " + str(i + 1) + " ]]; then\n")
-            sf.write(jobs[i])
-            if jobs[i].endswith("\n"):
-                sf.write("fi\n")
-            else:
-                sf.write("\nfi\n")
+        if telemetry is not None:
+            sf.write(task_telemetry.samplerBlock(telemetry_dir, telemetry, program))
             sf.write("\n")
 
-    if conda_env != None:
+        if job_steps is not None:
+            if step_shape is not None:
+                sf.write(packing.jobStepsBlock(jobs, job_steps, output, cpus_per_task=step_threads,
+                                               node_shape=step_shape, nodes=nodes or 1))
+            else:
+                sf.write(packing.jobStepsBlock(jobs, job_steps, output, cpus_per_task=cpus_per_task))
+            sf.write("\n")
+        elif not dispatcher:
+            core.writeTaskBody(sf, jobs, array_tasks, script_name, job_name)
+
+    # Files written alongside the script (job payload, dispatcher)
+    script_dir = os.path.dirname(script_name)
+
+    if dispatcher:
+        # Keep the #SBATCH header in the script; the lines after it become the prelude
+        with open(script_name) as sf:
+            lines = sf.readlines()
+        n_header = next((i for i, line in enumerate(lines) if not line.startswith("#")), len(lines))
+        dispatch_file = os.path.join(script_dir, job_name + "_dispatch.py")
+        env_file = os.path.join(script_dir, job_name + "_env.sh")
+        prelude_file = os.path.join(script_dir, job_name + "_prelude.sh")
+        codec = array_tasks["payload"]
+        payload_file = core.payloadFile(script_name, job_name, codec)
+        payload.writeJobPayload(jobs, payload_file, codec=codec, jobs_per_frame=payload_jobs_per_frame)
+        args = ["--jobs", payload_file, "--codec", codec, "--frame", str(payload_jobs_per_frame),
+                "--times", os.path.join(script_dir, job_name + "_dispatch.tsv")]
+        if env_setup:
+            with open(env_file, "w") as ef:
+                ef.write(env_setup)
+            args += ["--setup", env_file, "--skip", environment.SNAPSHOT_SKIP]
+            if env_snapshot:
+                snapshot_name = environment.snapshotKey(env_setup, program, partition)
+                args += ["--snapshot", os.path.join(env_snapshot_dir, snapshot_name[: -len(".env")] + ".json")]
+        prelude = "".join(lines[n_header:])
+        if prelude.strip():
+            with open(prelude_file, "w") as pf:
+                pf.write(prelude)
+            args += ["--prelude", prelude_file]
+        shutil.copyfile(task_dispatcher.__file__, dispatch_file)
+
+        python = "python3" if dispatcher is True else dispatcher
+        with open(script_name, "w") as sf:
+            sf.writelines(lines[:n_header])
+            sf.write("\n")
+            sf.write(f"BSC_DISPATCH_T0=$EPOCHREALTIME exec {python} -S -E {shlex.quote(dispatch_file)} "
+                     + " ".join(shlex.quote(a) for a in args) + "\n")
+    elif conda_pack:
+        with open(script_name, "a") as sf:
+            sf.write('if [ -e "$PACKED_ENV/.ready" ]; then source "$PACKED_ENV/bin/deactivate"; else conda deactivate; fi\n')
+            sf.write("\n")
+    elif conda_env != None:
         with open(script_name, "a") as sf:
             sf.write("conda deactivate \n")
             sf.write("\n")
 
 
+def setUpAlphaFold3Pipeline(
+    json_files,
+    output_dir="af3_output",
+    job_name="af3",
+    inference_batch=4,
+    data_partition="gp_bscls",
+    gpu_partition="acc_bscls",
+    data_cpus=16,
+    data_time=None,
+    inference_time=None,
+    data_concurrency=None,
+    af3_command=AF3_COMMAND,
+    extra_flags=None,
+    submit_script=None,
+    **kwargs,
+):
+    """
+    Split AlphaFold3 runs into a CPU data-pipeline array and a GPU inference array.
+
+    The data pipeline (MSA + template search) is CPU bound and runs as an array
+    on ``data_partition`` (program="alphafold3_data"); inference runs as a second
+    array on ``gpu_partition`` (program="alphafold3") with ``inference_batch``
+    inputs per GPU task, all predicted by ONE AF3 process (``--input_dir``) so
+    the model is compiled and loaded once per task instead of once per input.
+    Both arrays use the same batches, so GPU task N only needs CPU task N:
+    the submit script chains them with ``--dependency=aftercorr``, and each
+    batch starts inference as soon as its own MSAs are done.
+
+    Parameters
+    ==========
+    json_files : list
+        AF3 fold input JSON files (their "name" fixes the output folders).
+    output_dir : str
+        Inference output directory; data-pipeline outputs go to <output_dir>/data.
+    job_name : str
+        Prefix of the job names and scripts (<job_name>_data.sh, <job_name>_inference.sh).
+    inference_batch : int
+        Inputs per GPU task (and per CPU task).
+    data_cpus : int
+        cpus-per-task of the data-pipeline tasks.
+    data_time, inference_time : (int, tuple)
+        Walltimes per task (default 4 h and 2 h; scale them with inference_batch).
+    data_concurrency : (int, bool)
+        Run the MSAs of a batch concurrently inside its CPU task (see
+        jobArrays(concurrency=...)); None runs them one after the other.
+    af3_command, extra_flags : str
+        Passed to alphafold3Command().
+    submit_script : str
+        Script submitting both arrays (default <job_name>_submit.sh).
+    kwargs
+        Extra jobArrays arguments for both arrays (account, mail, ...).
+
+    Returns
+    =======
+    str
+        The submit script.
+    """
+
+    if not isinstance(inference_batch, int) or isinstance(inference_batch, bool) or inference_batch < 1:
+        raise ValueError("inference_batch must be a positive integer.")
+    if isinstance(json_files, str):
+        json_files = [json_files]
+
+    data_dir = os.path.join(output_dir, "data")
+    batches_dir = os.path.join(output_dir, "batches")
+    zfill = len(str(-(-len(json_files) // inference_batch)))
+
+    data_jobs = []
+    inference_jobs = []
+    for start in range(0, len(json_files), inference_batch):
+        batch = json_files[start : start + inference_batch]
+        batch_dir = os.path.join(batches_dir, "batch_" + str(start // inference_batch + 1).zfill(zfill))
+        data_jsons = []
+        for json_file in batch:
+            data_jobs.append(
+                alphafold3Command(json_path=json_file, output_dir=data_dir, stage="data",
+                                  af3_command=af3_command, extra_flags=extra_flags)
+            )
+            name = _af3_sanitised_name(json_file)
+            data_jsons.append(os.path.join(data_dir, name, name + "_data.json"))
+        job = _inputDirJob(data_jsons, batch_dir)
+        job += alphafold3Command(input_dir=batch_dir, output_dir=output_dir, stage="inference",
+                                 af3_command=af3_command, extra_flags=extra_flags) + "\n"
+        inference_jobs.append(job)
+
+    data_script = job_name + "_data.sh"
+    inference_script = job_name + "_inference.sh"
+    pipeline = workflow.Workflow()
+    pipeline.addStage(
+        "data",
+        jobArrays,
+        data_jobs,
+        script_name=data_script,
+        job_name=job_name + "_data",
+        partition=data_partition,
+        gpus=0,
+        cpus_per_task=data_cpus,
+        time=data_time if data_time is not None else (4, 0),
+        program="alphafold3_data",
+        group_jobs_by=inference_batch,
+        concurrency=data_concurrency,
+        **kwargs,
+    )
+    pipeline.addStage(
+        "inference",
+        jobArrays,
+        inference_jobs,
+        script_name=inference_script,
+        job_name=job_name + "_inference",
+        partition=gpu_partition,
+        time=inference_time if inference_time is not None else (2, 0),
+        program="alphafold3",
+        after="data",
+        **kwargs,
+    )
+
+    if submit_script is None:
+        submit_script = job_name + "_submit.sh"
+    return pipeline.writeSubmitScript(submit_script)
+
+
 def setUpPELEForMarenostrum(
     jobs,
     general_script="pele_slurm.sh",
     scripts_folder="pele_slurm_scripts",
     print_name=False,
     partition="gp_bscls",
+    pack=False,
+    cores_per_node=112,
     **kwargs,
 ):
     """
@@ -992,6 +1780,15 @@ def setUpPELEForMarenostrum(
     ==========
     jobs : list
         Commands for run PELE. This is the output of the setUpPELECalculation() function.
+    pack : bool
+        Instead of one whole-node job per PELE run, read the MPI ranks of each run
+        (the cpus of its input yaml, see packing.peleCpus), pack the runs onto as
+        few nodes as they fit in and write ONE job, <general_script>_packed.sh,
+        that launches them as concurrent srun steps, each pinned to its planned
+        node (see packing.jobStepsBlock). Runs without a readable cpus count
+        take a whole node.
+    cores_per_node : int
+        Cores of a node, used by pack.
     """
 
     if not os.path.exists(scripts_folder):
@@ -1000,6 +1797,34 @@ def setUpPELEForMarenostrum(
     if not general_script.endswith(".sh"):
         general_script += ".sh"
 
+    if pack:
+        sizes = [packing.peleCpus(job, default=cores_per_node) for job in jobs]
+        nodes = packing.packNodes(sizes, cores_per_node)
+        order = [i for node in nodes for i in node]
+        step_nodes = [n for n, node in enumerate(nodes) for _ in node]
+        kwargs.pop("ntasks", None)
+        kwargs.pop("cpus_per_task", None)
+        kwargs.pop("nodes", None)
+        job_name = os.path.splitext(os.path.basename(general_script))[0] + "_packed"
+        singleJob(
+            packing.jobStepsBlock(
+                [jobs[i] for i in order], [sizes[i] for i in order], job_name, step_nodes=step_nodes
+            ),
+            job_name=job_name,
+            script_name=scripts_folder + "/" + job_name + ".sh",
+            program="pele",
+            partition=partition,
+            ntasks=len(nodes) * cores_per_node,
+            cpus_per_task=1,
+            nodes=len(nodes),
+            **kwargs,
+        )
+        with open(general_script, "w") as ps:
+            if print_name:
+                ps.write(f"echo Launching {len(jobs)} PELE runs packed on {len(nodes)} node(s)\n")
+            ps.write("sbatch " + scripts_folder + "/" + job_name + ".sh\n")
+        return
+
     zfill = len(str(len(jobs)))
     with open(general_script, "w") as ps:
         for i, job in enumerate(jobs):
@@ -1049,6 +1874,11 @@ def singleJob(
     # UnboundLocalError at the `if module_purge:` block downstream.
     module_purge = False
 
+    # Keep the caller's lists untouched by the program presets
+    modules, unload_modules, pythonpath, pathMN, exports = core.copyLists(
+        modules, unload_modules, pythonpath, pathMN, exports
+    )
+
     # Check PYTHONPATH variable
     if pythonpath == None:
         pythonpath = []
@@ -1107,23 +1937,7 @@ def singleJob(
         )
     if script_name == None:
         script_name = "slurm_job.sh"
-    if modules != None:
-        if isinstance(modules, str):
-            modules = [modules]
-        if not isinstance(modules, list):
-            raise ValueError(
-                "Modules to load must be given as a list or as a string (for loading one module only)"
-            )
-    if unload_modules != None:
-        if isinstance(unload_modules, str):
-            unload_modules = [unload_modules]
-        if not isinstance(unload_modules, list):
-            raise ValueError(
-                "Modules to unload must be given as a list or as a string (for unloading one module only)"
-            )
-    if conda_env != None:
-        if not isinstance(conda_env, str):
-            raise ValueError("The conda environment must be given as a string")
+    modules, unload_modules = core.checkModules(modules, unload_modules, conda_env)
 
     if exports != None:
         if isinstance(exports, str):
@@ -1135,20 +1949,7 @@ def singleJob(
 
     if isinstance(time, int):
         time = (time, 0)
-    if partition in ["gp_debug", "acc_debug"] and time == None:
-        time = (2, 0)
-    elif partition in ["gp_debug", "acc_debug"] and time != None:
-        if time[0] * 60 + time[1] > 120:
-            print("Setting time at maximum allowed for the debug partition (2 hours).")
-            time = (2, 0)
-    elif partition in ["gp_bscls", "acc_bscls"] and time == None:
-        time = (48, 0)
-    elif partition in ["gp_bscls", "acc_bscls"] and time != None:
-        if time[0] * 60 + time[1] > 2880:
-            print(
-                "Setting time at maximum allowed for the bsc_ls partition (48 hours)."
-            )
-            time = (48, 0)
+    time = core.clampTime("mn5", partition, time)
 
     # Write jobs as array
     with open(script_name, "w") as sf:
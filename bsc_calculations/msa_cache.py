@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import re
+import shlex
+
+# Default MSA database tag, part of every cache key: bump it when the
+# ColabFold databases (UniRef30 / ColabFoldDB) are updated on the cluster.
+DEFAULT_DATABASE = "uniref30_2302+colabfold_envdb_202108"
+
+# Raw sequence given to bioemu.sample on the command line (not a file path).
+SEQUENCE_ARGUMENT = re.compile(r"--sequence[= ]+([A-Za-z]+)(?=\s|$)")
+
+
+def _normalize(sequence):
+    return "".join(sequence.split()).upper()
+
+
+def msaKey(sequence, database=DEFAULT_DATABASE):
+    """Content address of an MSA: sha256 of the sequence and the database tag."""
+    return hashlib.sha256((database + "\n" + _normalize(sequence)).encode()).hexdigest()
+
+
+def cachedMSA(cache_dir, sequence, database=DEFAULT_DATABASE):
+    """Path of the cached .a3m for a sequence (it may not exist yet)."""
+    key = msaKey(sequence, database)
+    return os.path.join(cache_dir, key[:2], key + ".a3m")
+
+
+def setUpMSACache(
+    sequences,
+    cache_dir,
+    db_dir,
+    database=DEFAULT_DATABASE,
+    chunk_size=50,
+    queries_dir="msa_queries",
+    search_flags="--use-env 1 --use-templates 0 --threads $SLURM_CPUS_PER_TASK",
+):
+    """
+    Plan the MSAs of a job list against a content-addressed a3m cache.
+
+    Sequences are deduplicated, looked up in ``cache_dir`` by
+    msaKey(sequence, database) and only the missing ones are searched: they
+    are written to multi-FASTA chunks of ``chunk_size`` queries (named by
+    their key) and each chunk becomes one ``colabfold_search`` job, so the
+    MMseqs2 databases are read once per chunk. Each a3m colabfold_search
+    writes is filed under the key of its own query sequence (its first
+    record), whatever the file is called, so the cache does not depend on how
+    a colabfold version names its outputs. Every later job finds them there
+    (bioemu via mn5.jobArrays(msa_cache=...), ColabFold, AF3 via
+    alphafold3UseCachedMSAs, which drops AF3's paired MSA and templates).
+
+    Parameters
+    ==========
+    sequences : (dict, list)
+        Sequences to align ({name: sequence} or a list).
+    cache_dir : str
+        Shared cache directory (e.g. on GPFS projects).
+    db_dir : str
+        ColabFold database directory passed to colabfold_search.
+    database : str
+        Database tag included in the cache key.
+    chunk_size : int
+        Queries per colabfold_search job.
+    queries_dir : str
+        Where the query chunks are written.
+    search_flags : str
+        Extra colabfold_search flags.
+
+    Returns
+    =======
+    (list, dict)
+        The colabfold_search jobs (for mn5.jobArrays, e.g. with
+        program="bioemu" on a gp partition) and {sequence: a3m path} for
+        every input sequence.
+    """
+
+    if isinstance(sequences, dict):
+        sequences = list(sequences.values())
+
+    paths = {}
+    missing = {}
+    for sequence in sequences:
+        if sequence in paths:
+            continue
+        paths[sequence] = cachedMSA(cache_dir, sequence, database)
+        if not os.path.exists(paths[sequence]):
+            missing.setdefault(msaKey(sequence, database), _normalize(sequence))
+
+    jobs = []
+    keys = sorted(missing)
+    if keys:
+        os.makedirs(queries_dir, exist_ok=True)
+    zfill = len(str(-(-len(keys) // chunk_size)))
+    for start in range(0, len(keys), chunk_size):
+        chunk = "chunk_" + str(start // chunk_size + 1).zfill(zfill)
+        fasta = os.path.join(queries_dir, chunk + ".fasta")
+        with open(fasta, "w") as ff:
+            for key in keys[start : start + chunk_size]:
+                ff.write(">" + key + "\n" + missing[key] + "\n")
+        tmp = os.path.join(cache_dir, "tmp_" + chunk + "_${SLURM_JOB_ID}")
+        jobs.append(
+            f"colabfold_search {fasta} {db_dir} {tmp} {search_flags}\n"
+            f"for a3m in {tmp}/*.a3m; do\n"
+            "    query=$(awk '/^#/ {next} /^>/ {if (n++) exit; next} {printf \"%s\", $0}' \"$a3m\")\n"
+            f"    key=$(printf '%s\\n%s' {shlex.quote(database)} \"$query\" | sha256sum | cut -c 1-64)\n"
+            f'    mkdir -p {cache_dir}/${{key:0:2}}\n'
+            f'    mv -f "$a3m" {cache_dir}/${{key:0:2}}/$key.a3m\n'
+            "done\n"
+            f"rm -rf {tmp}\n"
+        )
+    return jobs, paths
+
+
+def lookupCachedMSAs(sequences, cache_dir, database=DEFAULT_DATABASE):
+    """{sequence: a3m path} for the sequences whose MSA is already in the cache."""
+
+    paths = {}
+    for sequence in sequences:
+        path = cachedMSA(cache_dir, sequence, database)
+        if os.path.exists(path):
+            paths[sequence] = path
+    return paths
+
+
+def useCachedMSAs(jobs, paths):
+    """
+    Rewrite jobs to consume cached alignments: the value of every
+    ``--sequence`` argument found in ``paths`` (as returned by
+    setUpMSACache) is replaced by its a3m path, e.g. ``bioemu.sample
+    --sequence MKT...`` becomes ``--sequence <cache>/ab/ab12....a3m``. The
+    rest of the command (output paths, names) is left as it is.
+    """
+
+    def cached(match):
+        sequence = match.group(1)
+        if sequence not in paths:
+            return match.group(0)
+        return match.group(0)[: match.start(1) - match.start(0)] + paths[sequence]
+
+    return [SEQUENCE_ARGUMENT.sub(cached, job) for job in jobs]
+
+
+def alphafold3UseCachedMSAs(json_files, cache_dir, database=DEFAULT_DATABASE, output_dir="af3_cached_inputs"):
+    """
+    Write copies of AF3 input JSONs whose protein chains carry their cached
+    a3m inline as ``unpairedMsa`` (an input every AF3 3.x release reads)
+    instead of running the MSA search again. Chains that already carry an
+    MSA, or whose sequence is not cached yet, are left alone.
+
+    This changes the model inputs: AF3 needs all three fields once an MSA is
+    given, so ``pairedMsa`` is set to "" and ``templates`` to [] on every
+    rewritten chain, i.e. those chains are predicted from the ColabFold
+    unpaired MSA alone, without AF3's paired MSA or template search. Returns
+    the new JSON paths.
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    missing = 0
+    for json_file in json_files:
+        with open(json_file) as jf:
+            fold_input = json.load(jf)
+        for entry in fold_input.get("sequences", []):
+            protein = entry.get("protein")
+            if protein is None or "unpairedMsa" in protein or "unpairedMsaPath" in protein:
+                continue
+            msa_file = cachedMSA(cache_dir, protein["sequence"], database)
+            if not os.path.exists(msa_file):
+                missing += 1
+                continue
+            with open(msa_file) as mf:
+                protein["unpairedMsa"] = mf.read()
+            protein["pairedMsa"] = ""
+            protein["templates"] = []
+        new_file = os.path.join(output_dir, os.path.basename(json_file))
+        with open(new_file, "w") as jf:
+            json.dump(fold_input, jf, indent=2)
+        written.append(new_file)
+    if missing:
+        print(
+            f"[bsc_calculations] WARNING: {missing} protein chain(s) have no cached MSA in {cache_dir}; "
+            "AF3 will run their MSA search itself."
+        )
+    return written
@@ -1,5 +1,9 @@
 import os
 
+from . import core
+from . import packing
+from . import telemetry as task_telemetry
+
 
 def jobArrays(
     jobs,
@@ -26,6 +30,14 @@ def jobArrays(
     mpi=False,
     pythonpath=None,
     pathMN=None,
+    concurrency=None,
+    throttle=None,
+    throttle_demands=None,
+    parameter_table=None,
+    job_payload=None,
+    payload_jobs_per_frame=64,
+    telemetry=None,
+    telemetry_dir="telemetry",
 ):
     """
     Set up job array scripts for marenostrum slurm job manager.
@@ -44,12 +56,40 @@ def jobArrays(
     group_jobs_by : int
         Group jobs to enter in the same job array (useful for launching many short
         jobs when there are a max_job_allowed limit per user.
+    concurrency : (int, bool)
+        With group_jobs_by, run the commands of each array task through a bounded
+        parallel executor (at most `concurrency` at a time; True uses all the task's
+        cores) instead of one after the other. See core.groupJobs.
+    throttle : (int, dict)
+        Limit the array tasks running at once (--array=1-N%throttle): the limit, or
+        resource budgets from which it is computed. See throttle.arrayThrottle.
+    throttle_demands : dict
+        Units of each throttle budget one task uses (default 1 each).
+    parameter_table : (str, list, dict)
+        Give one command template as jobs and a table of its parameters; array task
+        N runs the template with row N. See core.taskLayout.
+    job_payload : (bool, str)
+        Write the jobs to a compressed payload next to the script ("gzip" or
+        "zstd"; True is gzip) that each array task reads its job from.
+    payload_jobs_per_frame : int
+        Jobs per compressed frame of the payload.
+    telemetry : (bool, int)
+        Sample each task's resource use every `telemetry` seconds (True is 30) into
+        telemetry_dir. See telemetry.samplerBlock.
+    telemetry_dir : str
+        Folder of the telemetry samples.
     """
 
     # Check input
     if isinstance(jobs, str):
         jobs = [jobs]
 
+    # Keep the caller's lists untouched by the program presets
+    modules, unload_modules, pythonpath, pathMN = core.copyLists(
+        modules, unload_modules, pythonpath, pathMN
+    )
+    telemetry = core.checkTelemetry(telemetry)
+
     # Check input
     if jobs_range != None:
         if (
@@ -63,20 +103,12 @@ def jobArrays(
 
     # Group jobs to enter in the same job array (useful for launching many short
     # jobs when there are a max_job_allowed limit per user.)
-    if isinstance(group_jobs_by, int):
-        grouped_jobs = []
-        gj = ""
-        for i, j in enumerate(jobs):
-            gj += j
-            if (i + 1) % group_jobs_by == 0:
-                grouped_jobs.append(gj)
-                gj = ""
-        if gj != "":
-            grouped_jobs.append(gj)
-        jobs = grouped_jobs
-
-    elif not isinstance(group_jobs_by, type(None)):
-        raise ValueError("You must give an integer to group jobs by this number.")
+    # With concurrency, each group runs through a bounded parallel executor instead of sequentially.
+    array_tasks, jobs_range = core.taskLayout(
+        jobs, job_name, script_name, jobs_range, group_jobs_by, parameter_table,
+        job_payload, payload_jobs_per_frame,
+    )
+    jobs = core.groupJobs(jobs, group_jobs_by, concurrency)
 
     # Check PYTHONPATH variable
     if pythonpath == None:
@@ -160,11 +192,9 @@ def jobArrays(
             modules += netsolp_modules
         conda_env = "/gpfs/projects/bsc72/conda_envs/netsolp"
 
-        for i, job in enumerate(jobs):
-            if "NETSOLP_PATH" in jobs[i]:
-                jobs[i] = jobs[i].replace(
-                    "NETSOLP_PATH", "\/gpfs\/projects\/bsc72\/programs\/netsolp-1.0"
-                )
+        jobs = core.replaceInJobs(
+            jobs, "NETSOLP_PATH", "\/gpfs\/projects\/bsc72\/programs\/netsolp-1.0"
+        )
 
     if program == "blast":
         blast_modules = ["blast"]
@@ -234,23 +264,7 @@ def jobArrays(
     if not isinstance(script_name, str):
         raise ValueError("script_name must be a string")
 
-    if modules != None:
-        if isinstance(modules, str):
-            modules = [modules]
-        if not isinstance(modules, list):
-            raise ValueError(
-                "Modules to load must be given as a list or as a string (for loading one module only)"
-            )
-    if unload_modules != None:
-        if isinstance(unload_modules, str):
-            unload_modules = [unload_modules]
-        if not isinstance(unload_modules, list):
-            raise ValueError(
-                "Modules to unload must be given as a list or as a string (for unloading one module only)"
-            )
-    if conda_env != None:
-        if not isinstance(conda_env, str):
-            raise ValueError("The conda environment must be given as a string")
+    modules, unload_modules = core.checkModules(modules, unload_modules, conda_env)
 
     if isinstance(time, int):
         time = (time, 0)
@@ -258,20 +272,7 @@ def jobArrays(
         cpus = 64
         print("Setting cpus at maximum allowed for the debug partition (64)")
 
-    if partition == "debug" and time == None:
-        time = (2, 0)
-    elif partition == "debug" and time != None:
-        if time[0] * 60 + time[1] > 120:
-            print("Setting time at maximum allowed for the debug partition (2 hours).")
-            time = (2, 0)
-    elif partition == "bsc_ls" and time == None:
-        time = (48, 0)
-    elif partition == "bsc_ls" and time != None:
-        if time[0] * 60 + time[1] > 2880:
-            print(
-                "Setting time at maximum allowed for the bsc_ls partition (48 hours)."
-            )
-            time = (48, 0)
+    time = core.clampTime("nord3", partition, time)
 
     # Slice jobs if a range is given
     if jobs_range != None:
@@ -295,7 +296,11 @@ def jobArrays(
             sf.write("#SBATCH --mem-per-cpu " + str(mem_per_cpu) + "\n")
         if threads != None:
             sf.write("#SBATCH -c " + str(threads) + "\n")
-        sf.write("#SBATCH --array=1-" + str(len(jobs)) + "\n")
+        sf.write(
+            "#SBATCH --array="
+            + core.arraySpec(*core.taskRange(array_tasks, jobs), throttle, throttle_demands)
+            + "\n"
+        )
         sf.write("#SBATCH --output=" + output + "_%a_%A.out\n")
         sf.write("#SBATCH --error=" + output + "_%a_%A.err\n")
         if mail != None:
@@ -327,16 +332,17 @@ def jobArrays(
             sf.write("export PATH=$PATH:" + pp + "\n")
             sf.write("\n")
 
-    for i in range(len(jobs)):
-        with open(script_name, "a") as sf:
-            sf.write("if [[ $SLURM_ARRAY_TASK_ID = " + str(i + 1) + " ]]; then\n")
-            sf.write(jobs[i])
-            if jobs[i].endswith("\n"):
-                sf.write("fi\n")
-            else:
-                sf.write("\nfi\n")
+        if concurrency is not None:
+            sf.write(packing.concurrentHelpers(concurrency, output))
             sf.write("\n")
 
+        if telemetry is not None:
+            sf.write(task_telemetry.samplerBlock(telemetry_dir, telemetry, program))
+            sf.write("\n")
+
+    with open(script_name, "a") as sf:
+        core.writeTaskBody(sf, jobs, array_tasks, script_name, job_name)
+
     if conda_env != None:
         with open(script_name, "a") as sf:
             sf.write("conda deactivate \n")
@@ -364,6 +370,9 @@ def singleJob(
     conda_eval_bash=False,
     exports=None,
 ):
+    # Keep the caller's lists untouched by the program presets
+    modules, unload_modules, exports = core.copyLists(modules, unload_modules, exports)
+
     available_programs = ["pele", "pyrosetta", "pml", "netsolp"]
     if program != None:
         if program not in available_programs:
@@ -418,11 +427,9 @@ def singleJob(
             modules += netsolp_modules
         conda_env = "/gpfs/projects/bsc72/conda_envs/netsolp"
 
-        for i, job in enumerate(jobs):
-            if "NETSOLP_PATH" in jobs[i]:
-                jobs[i] = jobs[i].replace(
-                    "NETSOLP_PATH", "\/gpfs\/projects\/bsc72\/programs\/netsolp-1.0"
-                )
+        jobs = core.replaceInJobs(
+            jobs, "NETSOLP_PATH", "\/gpfs\/projects\/bsc72\/programs\/netsolp-1.0"
+        )
 
     available_partitions = ["debug", "bsc_ls"]
     if job_name == None:
@@ -441,23 +448,7 @@ def singleJob(
         )
     if script_name == None:
         script_name = "slurm_job.sh"
-    if modules != None:
-        if isinstance(modules, str):
-            modules = [modules]
-        if not isinstance(modules, list):
-            raise ValueError(
-                "Modules to load must be given as a list or as a string (for loading one module only)"
-            )
-    if unload_modules != None:
-        if isinstance(unload_modules, str):
-            unload_modules = [unload_modules]
-        if not isinstance(unload_modules, list):
-            raise ValueError(
-                "Modules to unload must be given as a list or as a string (for unloading one module only)"
-            )
-    if conda_env != None:
-        if not isinstance(conda_env, str):
-            raise ValueError("The conda environment must be given as a string")
+    modules, unload_modules = core.checkModules(modules, unload_modules, conda_env)
 
     if exports != None:
         if isinstance(exports, str):
@@ -473,20 +464,7 @@ def singleJob(
         cpus = 64
         print("Setting cpus at maximum allowed for the debug partition (64)")
 
-    if partition == "debug" and time == None:
-        time = (2, 0)
-    elif partition == "debug" and time != None:
-        if time[0] * 60 + time[1] > 120:
-            print("Setting time at maximum allowed for the debug partition (2 hours).")
-            time = (2, 0)
-    elif partition == "bsc_ls" and time == None:
-        time = (48, 0)
-    elif partition == "bsc_ls" and time != None:
-        if time[0] * 60 + time[1] > 2880:
-            print(
-                "Setting time at maximum allowed for the bsc_ls partition (48 hours)."
-            )
-            time = (48, 0)
+    time = core.clampTime("nord3", partition, time)
 
     # Write jobs as array
     with open(script_name, "w") as sf:
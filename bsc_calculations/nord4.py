@@ -1,5 +1,10 @@
 import os
 
+from . import core
+from . import licenses
+from . import packing
+from . import telemetry as task_telemetry
+
 
 def jobArrays(
     jobs,
@@ -29,6 +34,17 @@ def jobArrays(
     pathMN=None,
     exports=None,
     sources=None,
+    concurrency=None,
+    throttle=None,
+    throttle_demands=None,
+    license_tokens=None,
+    license_counter=None,
+    license_log="license_usage.tsv",
+    parameter_table=None,
+    job_payload=None,
+    payload_jobs_per_frame=64,
+    telemetry=None,
+    telemetry_dir="telemetry",
 ):
     """
     Generate a Slurm **job array** submission script tailored for BSC clusters
@@ -143,6 +159,58 @@ def jobArrays(
         when user array limits apply. The concatenation is literal: commands
         are appended in order; ensure each ends with `\\n` or `;` as needed.
 
+    concurrency : int or bool or None, default=None
+        With `group_jobs_by`, run the `k` commands of each array element
+        through a bounded parallel executor (at most `concurrency` at once;
+        `True` uses all the element's cores) instead of sequentially.
+        Each command runs in its own subshell and its exit code is written to
+        `<output>_<task>_<jobid>.exitcodes`.
+
+    throttle : int or dict or None, default=None
+        Limit the array elements running at once (`--array=1-N%throttle`):
+        the limit itself, or resource budgets such as `{"licenses": 40}`
+        (e.g. Schrodinger tokens) from which it is computed. See
+        `throttle.arrayThrottle` and `throttle.writeThrottleMonitor`.
+
+    throttle_demands : dict or None, default=None
+        Units of each budget one element uses (default 1 each).
+
+    license_tokens : int or None, default=None
+        For licensed codes (`program="schrodinger"`): start every command
+        through `license_run`, only once the licence counter reports this many
+        free tokens. Starts are queued per node, so commands packed with
+        `group_jobs_by`/`concurrency` wait their turn instead of failing.
+        See `licenses.licenseBlock`; summarise with `licenses.licenseReport`.
+
+    license_counter : str or None, default=None
+        Command printing the free tokens (default: FlexLM SUITE tokens from
+        `$SCHRODINGER/licadmin STAT`).
+
+    license_log : str, default="license_usage.tsv"
+        Per-command token usage log.
+
+    parameter_table : str or list or dict or None, default=None
+        Give a single command template as `jobs` and a table of its
+        parameters (a TSV/CSV file, a list of row dicts or a dict of
+        columns): array element N runs the template with row N. See
+        `core.taskLayout`.
+
+    job_payload : bool or str or None, default=None
+        Write the jobs to a compressed payload next to the script (`"gzip"`
+        or `"zstd"`; `True` is gzip) that each array element reads its
+        command from, instead of inlining every command in the script.
+
+    payload_jobs_per_frame : int, default=64
+        Jobs per compressed frame of the payload.
+
+    telemetry : bool or int or None, default=None
+        Sample each element's CPU, memory and I/O use every `telemetry`
+        seconds (`True` is 30) into `telemetry_dir`. See
+        `telemetry.samplerBlock`.
+
+    telemetry_dir : str, default="telemetry"
+        Folder of the telemetry samples.
+
     mpi : bool, default=False
         Hint for certain `program` presets (e.g., `pyrosetta`) to choose a
         specific conda env for MPI builds. The function does not itself add
@@ -233,6 +301,15 @@ def jobArrays(
     if isinstance(jobs, str):
         jobs = [jobs]
 
+    # Keep the caller's lists untouched by the program presets
+    modules, unload_modules, pythonpath, pathMN, exports, sources = core.copyLists(
+        modules, unload_modules, pythonpath, pathMN, exports, sources
+    )
+    telemetry = core.checkTelemetry(telemetry)
+
+    if license_tokens is not None:
+        jobs = [licenses.licenseCommand(job, license_tokens) for job in jobs]
+
     # Check input
     if jobs_range != None:
         if (
@@ -246,22 +323,12 @@ def jobArrays(
 
     # Group jobs to enter in the same job array (useful for launching many short
     # jobs when there are a max_job_allowed limit per user.)
-    if isinstance(group_jobs_by, int):
-        grouped_jobs = []
-        gj = ""
-        for i, j in enumerate(jobs):
-            # Newline separator prevents adjacent commands from being glued
-            # onto the same shell line (e.g. `cmd1 -WAIT"cmd2 ..."`).
-            gj += j + "\n"
-            if (i + 1) % group_jobs_by == 0:
-                grouped_jobs.append(gj.rstrip("\n"))
-                gj = ""
-        if gj != "":
-            grouped_jobs.append(gj.rstrip("\n"))
-        jobs = grouped_jobs
-
-    elif not isinstance(group_jobs_by, type(None)):
-        raise ValueError("You must give an integer to group jobs by this number.")
+    # With concurrency, each group runs through a bounded parallel executor instead of sequentially.
+    array_tasks, jobs_range = core.taskLayout(
+        jobs, job_name, script_name, jobs_range, group_jobs_by, parameter_table,
+        job_payload, payload_jobs_per_frame,
+    )
+    jobs = core.groupJobs(jobs, group_jobs_by, concurrency)
 
     # Check PYTHONPATH variable
     if pythonpath == None:
@@ -350,11 +417,9 @@ def jobArrays(
             modules += netsolp_modules
         conda_env = "/gpfs/projects/bsc72/conda_envs/netsolp"
 
-        for i, job in enumerate(jobs):
-            if "NETSOLP_PATH" in jobs[i]:
-                jobs[i] = jobs[i].replace(
-                    "NETSOLP_PATH", "\/gpfs\/projects\/bsc72\/programs\/netsolp-1.0"
-                )
+        jobs = core.replaceInJobs(
+            jobs, "NETSOLP_PATH", "\/gpfs\/projects\/bsc72\/programs\/netsolp-1.0"
+        )
 
     if program == "blast": # Needs update for N4
         blast_modules = ["blast"]
@@ -480,23 +545,7 @@ def jobArrays(
     if not isinstance(script_name, str):
         raise ValueError("script_name must be a string")
 
-    if modules != None:
-        if isinstance(modules, str):
-            modules = [modules]
-        if not isinstance(modules, list):
-            raise ValueError(
-                "Modules to load must be given as a list or as a string (for loading one module only)"
-            )
-    if unload_modules != None:
-        if isinstance(unload_modules, str):
-            unload_modules = [unload_modules]
-        if not isinstance(unload_modules, list):
-            raise ValueError(
-                "Modules to unload must be given as a list or as a string (for unloading one module only)"
-            )
-    if conda_env != None:
-        if not isinstance(conda_env, str):
-            raise ValueError("The conda environment must be given as a string")
+    modules, unload_modules = core.checkModules(modules, unload_modules, conda_env)
     if conda_activate_bash != None:
         if not isinstance(conda_activate_bash, str):
             raise ValueError("The conda environment must be given as a string")
@@ -506,20 +555,7 @@ def jobArrays(
         cpus_per_task = 64
         print("Setting cpus at maximum allowed for the debug partition (64)")
 
-    if partition == "debug" and time == None:
-        time = (2, 0)
-    elif partition == "debug" and time != None:
-        if time[0] * 60 + time[1] > 120:
-            print("Setting time at maximum allowed for the debug partition (2 hours).")
-            time = (2, 0)
-    elif partition == "bsc_ls" and time == None:
-        time = (48, 0)
-    elif partition == "bsc_ls" and time != None:
-        if time[0] * 60 + time[1] > 2880:
-            print(
-                "Setting time at maximum allowed for the bsc_ls partition (48 hours)."
-            )
-            time = (48, 0)
+    time = core.clampTime("nord4", partition, time)
 
     # Slice jobs if a range is given
     if jobs_range != None:
@@ -542,7 +578,11 @@ def jobArrays(
             sf.write("#SBATCH --mem-per-cpu " + str(mem_per_cpu) + "\n")
         if threads != None:
             sf.write("#SBATCH -c " + str(threads) + "\n")
-        sf.write("#SBATCH --array=1-" + str(len(jobs)) + "\n")
+        sf.write(
+            "#SBATCH --array="
+            + core.arraySpec(*core.taskRange(array_tasks, jobs), throttle, throttle_demands)
+            + "\n"
+        )
         sf.write("#SBATCH --output=" + output + "_%a_%A.out\n")
         sf.write("#SBATCH --error=" + output + "_%a_%A.err\n")
         if mail != None:
@@ -588,16 +628,21 @@ def jobArrays(
             sf.write("export PATH=$PATH:" + pp + "\n")
             sf.write("\n")
 
-    for i in range(len(jobs)):
-        with open(script_name, "a") as sf:
-            sf.write("if [[ $SLURM_ARRAY_TASK_ID = " + str(i + 1) + " ]]; then\n")
-            sf.write(jobs[i])
-            if jobs[i].endswith("\n"):
-                sf.write("fi\n")
-            else:
-                sf.write("\nfi\n")
+        if concurrency is not None:
+            sf.write(packing.concurrentHelpers(concurrency, output))
+            sf.write("\n")
+
+        if license_tokens is not None:
+            sf.write(licenses.licenseBlock(license_counter, log_file=license_log))
             sf.write("\n")
 
+        if telemetry is not None:
+            sf.write(task_telemetry.samplerBlock(telemetry_dir, telemetry, program))
+            sf.write("\n")
+
+    with open(script_name, "a") as sf:
+        core.writeTaskBody(sf, jobs, array_tasks, script_name, job_name)
+
     if conda_env != None:
         with open(script_name, "a") as sf:
             sf.write("conda deactivate \n")
@@ -624,7 +669,11 @@ def singleJob(
     program=None,
     conda_eval_bash=False,
     exports=None,
+    nodes=None,
 ):
+    # Keep the caller's lists untouched by the program presets
+    modules, unload_modules, exports = core.copyLists(modules, unload_modules, exports)
+
     available_programs = ["pele", "pyrosetta", "pml", "netsolp"]
     if program != None:
         if program not in available_programs:
@@ -692,11 +741,9 @@ def singleJob(
             modules += netsolp_modules
         conda_env = "/gpfs/projects/bsc72/conda_envs/netsolp"
 
-        for i, job in enumerate(jobs):
-            if "NETSOLP_PATH" in jobs[i]:
-                jobs[i] = jobs[i].replace(
-                    "NETSOLP_PATH", "\/gpfs\/projects\/bsc72\/programs\/netsolp-1.0"
-                )
+        jobs = core.replaceInJobs(
+            jobs, "NETSOLP_PATH", "\/gpfs\/projects\/bsc72\/programs\/netsolp-1.0"
+        )
 
     available_partitions = ["debug", "bsc_ls"]
     if job_name == None:
@@ -715,23 +762,7 @@ def singleJob(
         )
     if script_name == None:
         script_name = "slurm_job.sh"
-    if modules != None:
-        if isinstance(modules, str):
-            modules = [modules]
-        if not isinstance(modules, list):
-            raise ValueError(
-                "Modules to load must be given as a list or as a string (for loading one module only)"
-            )
-    if unload_modules != None:
-        if isinstance(unload_modules, str):
-            unload_modules = [unload_modules]
-        if not isinstance(unload_modules, list):
-            raise ValueError(
-                "Modules to unload must be given as a list or as a string (for unloading one module only)"
-            )
-    if conda_env != None:
-        if not isinstance(conda_env, str):
-            raise ValueError("The conda environment must be given as a string")
+    modules, unload_modules = core.checkModules(modules, unload_modules, conda_env)
 
     if exports != None:
         if isinstance(exports, str):
@@ -747,20 +778,7 @@ def singleJob(
         cpus = 64
         print("Setting cpus at maximum allowed for the debug partition (64)")
 
-    if partition == "debug" and time == None:
-        time = (2, 0)
-    elif partition == "debug" and time != None:
-        if time[0] * 60 + time[1] > 120:
-            print("Setting time at maximum allowed for the debug partition (2 hours).")
-            time = (2, 0)
-    elif partition == "bsc_ls" and time == None:
-        time = (48, 0)
-    elif partition == "bsc_ls" and time != None:
-        if time[0] * 60 + time[1] > 2880:
-            print(
-                "Setting time at maximum allowed for the bsc_ls partition (48 hours)."
-            )
-            time = (48, 0)
+    time = core.clampTime("nord4", partition, time)
 
     # Write jobs as array
     with open(script_name, "w") as sf:
@@ -769,6 +787,8 @@ def singleJob(
         sf.write("#SBATCH --job-name=" + job_name + "\n")
         sf.write("#SBATCH --qos=" + partition + "\n")
         sf.write("#SBATCH --time=" + str(time[0]) + ":" + str(time[1]) + ":00\n")
+        if nodes is not None:
+            sf.write("#SBATCH --nodes=" + str(nodes) + "\n")
         if tasks:
             sf.write("#SBATCH --ntasks " + str(tasks) + "\n")
         else:
@@ -829,6 +849,7 @@ def setUpPELEForNord4(
     partition="bsc_ls",
     cpus=96,
     time=None,
+    pack=False,
 ):
     """
     Creates submission scripts for Marenostrum for each PELE job inside the jobs variable.
@@ -837,6 +858,12 @@ def setUpPELEForNord4(
     ==========
     jobs : list
         Commands for run PELE. This is the output of the setUpPELECalculation() function.
+    pack : bool
+        Instead of one job of `cpus` cores per PELE run, read the MPI ranks of each
+        run (the cpus of its input yaml, see packing.peleCpus), pack the runs onto
+        as few nodes of `cpus` cores as they fit in and write ONE job,
+        <general_script>_packed.sh, that launches them as concurrent srun steps,
+        each pinned to its planned node (see packing.jobStepsBlock).
     """
 
     if not isinstance(jobs, list):
@@ -845,6 +872,30 @@ def setUpPELEForNord4(
     if not os.path.exists(scripts_folder):
         os.mkdir(scripts_folder)
 
+    if pack:
+        sizes = [packing.peleCpus(job, default=cpus) for job in jobs]
+        nodes = packing.packNodes(sizes, cpus)
+        order = [i for node in nodes for i in node]
+        step_nodes = [n for n, node in enumerate(nodes) for _ in node]
+        job_name = os.path.splitext(os.path.basename(general_script))[0] + "_packed"
+        singleJob(
+            packing.jobStepsBlock(
+                [jobs[i] for i in order], [sizes[i] for i in order], job_name, step_nodes=step_nodes
+            ),
+            cpus=len(nodes) * cpus,
+            nodes=len(nodes),
+            partition=partition,
+            program="pele",
+            time=time,
+            job_name=job_name,
+            script_name=scripts_folder + "/" + job_name + ".sh",
+        )
+        with open(general_script, "w") as ps:
+            if print_name:
+                ps.write(f"echo Launching {len(jobs)} PELE runs packed on {len(nodes)} node(s)\n")
+            ps.write("sbatch -A "+account+' -q '+qos+' '+ scripts_folder + "/" + job_name + ".sh\n")
+        return
+
     zfill = len(str(len(jobs)))
     with open(general_script, "w") as ps:
         for i, job in enumerate(jobs):
@@ -0,0 +1,341 @@
+import os
+import re
+import shlex
+
+from . import layout
+
+# Bash function printing how many of the given PIDs are still running; the
+# packing blocks count their slots with it instead of ``jobs -r``, which also
+# sees unrelated background processes such as the telemetry sampler.
+LIVE_PIDS = (
+    "live_pids() {\n"
+    "    local pid n=0\n"
+    '    for pid; do kill -0 "$pid" 2> /dev/null && n=$(( n + 1 )); done\n'
+    "    echo $n\n"
+    "}\n"
+)
+
+
+def jobStepsBlock(jobs, step_ntasks, output, cpus_per_task=None, step_nodes=None, node_shape=None, nodes=1):
+    """
+    Return the bash body that runs every job as a concurrent ``srun`` job step
+    inside ONE allocation, instead of one array task per job.
+
+    A slot scheduler keeps at most ``SLURM_NTASKS / step_ntasks`` steps alive
+    and backfills a freed slot as soon as any step finishes (``wait -n``), so
+    dozens of small MPI runs share the allocation without paying queue wait
+    for each of them. ``srun --exclusive`` makes every step own its cores.
+    Slots are counted, and the block waits, only on the step PIDs it started,
+    so other background processes of the script (the telemetry sampler) are
+    never mistaken for steps. The script exits non-zero if any step failed.
+
+    Jobs that launch their MPI binary directly should write the literal
+    ``SRUN_STEP`` where ``mpirun -np N`` would go (e.g.
+    ``cd run_01 && SRUN_STEP cp2k.psmp -i md.inp -o md.out``); it is replaced
+    by an ``srun --exclusive --nodes=1 --ntasks=<step_ntasks>`` prefix.
+
+    Jobs without the placeholder are treated as self-launching codes (ORCA,
+    PELE) that call ``mpirun`` themselves: the whole command runs in a
+    one-task step holding ``step_ntasks`` cores, with OpenMPI oversubscription
+    allowed and the Intel MPI bootstrap set to ``fork`` so the nested
+    ``mpirun`` stays inside the step's cpuset. Such commands run under
+    ``bash -c``, so helper shell functions must be exported (``export -f``).
+
+    Parameters
+    ==========
+    jobs : list
+        Commands to pack. Each one becomes one job step.
+    step_ntasks : (int, list)
+        MPI ranks (cores) each job step gets, or one value per job. With
+        per-job sizes there is no slot limit: every step is submitted and
+        ``srun --exclusive`` holds a step back until its cores are free.
+    output : str
+        Prefix of the per-step log files (``<output>_step<N>_<jobid>.out``).
+    cpus_per_task : int
+        Threads per rank; defaults to the allocation's SLURM_CPUS_PER_TASK.
+    step_nodes : list
+        Node of the allocation (0-based position in SLURM_JOB_NODELIST) each
+        job step must run on, e.g. the plan of packNodes(). Without it Slurm
+        places every step wherever it finds free cores.
+    node_shape : (str, dict)
+        Bind every step to a fixed slot of layout.packedLayout() for this node
+        shape (a layout.NODE_SHAPES key or a shape dict): the node's cores are
+        cut into NUMA-local slots of step_ntasks x cpus_per_task cores, a step
+        starts in a free slot and gets that slot's ``--cpu-bind=mask_cpu``
+        masks, OMP placement and CUDA_VISIBLE_DEVICES. The allocation must
+        own its ``nodes`` whole nodes (the masks are absolute core ids).
+        Needs one step size for all jobs.
+    nodes : int
+        Nodes of the allocation, with node_shape.
+    """
+
+    if cpus_per_task is None:
+        cpus = "${SLURM_CPUS_PER_TASK:-1}"
+    else:
+        cpus = str(cpus_per_task)
+
+    sizes = step_ntasks if isinstance(step_ntasks, list) else [step_ntasks] * len(jobs)
+    if len(sizes) != len(jobs):
+        raise ValueError("Give one step size per job.")
+    if step_nodes is not None and len(step_nodes) != len(jobs):
+        raise ValueError("Give one step node per job.")
+
+    if node_shape is not None:
+        if isinstance(step_ntasks, list) or step_nodes is not None:
+            raise ValueError("node_shape needs one step size for all jobs and no step_nodes.")
+        slots = _boundSlots(node_shape, step_ntasks, cpus_per_task or 1)
+        return _boundJobStepsBlock(jobs, step_ntasks, output, cpus_per_task or 1, slots, nodes)
+
+    block = "# srun job-step packing: run every job as a concurrent step of this allocation\n"
+    if isinstance(step_ntasks, list):
+        block += "MAX_STEPS=" + str(len(jobs)) + "\n"
+    else:
+        block += "MAX_STEPS=$(( SLURM_NTASKS / " + str(step_ntasks) + " ))\n"
+    block += "if [ \"$MAX_STEPS\" -lt 1 ]; then MAX_STEPS=1; fi\n"
+    if step_nodes is not None:
+        block += "STEP_HOSTS=($(scontrol show hostnames \"$SLURM_JOB_NODELIST\"))\n"
+    block += LIVE_PIDS
+    block += "STEP_PIDS=()\n"
+    block += "step_slot() {\n"
+    block += "    while [ \"$(live_pids \"${STEP_PIDS[@]}\")\" -ge \"$MAX_STEPS\" ]; do\n"
+    block += "        wait -n\n"
+    block += "    done\n"
+    block += "}\n"
+    block += "\n"
+
+    zfill = len(str(len(jobs)))
+    for i, job in enumerate(jobs):
+        job = job.rstrip("\n")
+        nodelist = ""
+        if step_nodes is not None:
+            nodelist = " --nodelist=${STEP_HOSTS[" + str(step_nodes[i]) + "]}"
+        srun_step = (
+            "srun --exclusive --nodes=1" + nodelist + " --ntasks=" + str(sizes[i])
+            + " --cpus-per-task=" + cpus + " --kill-on-bad-exit=1"
+        )
+        srun_self = (
+            "srun --exclusive --nodes=1" + nodelist + " --ntasks=1"
+            + " --cpus-per-task=$(( " + str(sizes[i]) + " * " + cpus + " ))"
+            + " --export=ALL,OMPI_MCA_rmaps_base_oversubscribe=1,I_MPI_HYDRA_BOOTSTRAP=fork"
+        )
+        if "SRUN_STEP" in job:
+            cmd = job.replace("SRUN_STEP", srun_step)
+        else:
+            cmd = srun_self + " bash -c " + shlex.quote(job)
+        log = output + "_step" + str(i + 1).zfill(zfill) + "_${SLURM_JOB_ID}.out"
+        block += "step_slot\n"
+        block += "(\n"
+        block += cmd + "\n"
+        block += ") > " + log + " 2>&1 &\n"
+        block += "STEP_PIDS+=($!)\n"
+        block += "\n"
+
+    block += _stepsReport(output)
+    return block
+
+
+def _stepsReport(output):
+    """Wait on every step PID and exit 1 if any step failed."""
+    return (
+        "STEP_FAILED=0\n"
+        'for pid in "${STEP_PIDS[@]}"; do\n'
+        '    wait "$pid" || STEP_FAILED=$(( STEP_FAILED + 1 ))\n'
+        "done\n"
+        'if [ "$STEP_FAILED" -gt 0 ]; then\n'
+        '    echo "[bsc_calculations] $STEP_FAILED job step(s) failed; see ' + output + '_step*_${SLURM_JOB_ID}.out" >&2\n'
+        "    exit 1\n"
+        "fi\n"
+    )
+
+
+def _boundSlots(node_shape, step_ntasks, threads):
+    """The packedLayout() slots of one node for steps of step_ntasks x threads cores."""
+    shape = layout.NODE_SHAPES.get(node_shape) if isinstance(node_shape, str) else node_shape
+    if shape is None:
+        raise ValueError("Unknown node shape. Available shapes are: " + ", ".join(layout.NODE_SHAPES))
+    per_node = shape["cores"] // (step_ntasks * threads)
+    if per_node < 1:
+        raise ValueError(
+            f"A step of {step_ntasks} ranks x {threads} threads needs more than the {shape['cores']} cores of a node."
+        )
+    return layout.packedLayout(shape, per_node, ranks_per_job=step_ntasks, threads_per_rank=threads)
+
+
+def _boundJobStepsBlock(jobs, step_ntasks, output, threads, slots, nodes):
+    """jobStepsBlock() with every step pinned to a free slot of the node layout."""
+
+    per_node = len(slots)
+    block = "# srun job-step packing: each job runs as a concurrent step pinned to a NUMA-local slot\n"
+    block += "STEP_HOSTS=($(scontrol show hostnames \"$SLURM_JOB_NODELIST\"))\n"
+    block += "SLOTS_PER_NODE=" + str(per_node) + "\n"
+    block += "MAX_STEPS=$(( SLOTS_PER_NODE * " + str(nodes) + " ))\n"
+    block += "SLOT_RANK_MASKS=(" + " ".join(slot["cpu_bind"] for slot in slots) + ")\n"
+    block += "SLOT_MASKS=(" + " ".join(slot["cpu_mask"] for slot in slots) + ")\n"
+    block += "SLOT_ENV=(" + " ".join(shlex.quote(" ".join(layout.bindingExports(slot))) for slot in slots) + ")\n"
+    block += "SLOT_PIDS=()\n"
+    block += "STEP_PIDS=()\n"
+    block += "step_slot() {\n"
+    block += "    local s\n"
+    block += "    while true; do\n"
+    block += "        for (( s = 0; s < MAX_STEPS; s++ )); do\n"
+    block += "            if [ -z \"${SLOT_PIDS[s]}\" ] || ! kill -0 \"${SLOT_PIDS[s]}\" 2> /dev/null; then\n"
+    block += "                STEP_SLOT=$s\n"
+    block += "                STEP_HOST=${STEP_HOSTS[s / SLOTS_PER_NODE]}\n"
+    block += "                STEP_LOCAL=$(( s % SLOTS_PER_NODE ))\n"
+    block += "                return\n"
+    block += "            fi\n"
+    block += "        done\n"
+    block += "        wait -n\n"
+    block += "    done\n"
+    block += "}\n"
+    block += "\n"
+
+    # --overlap: the slots, not Slurm, keep the steps on disjoint cores
+    srun = "srun --overlap --nodes=1 --nodelist=$STEP_HOST"
+    zfill = len(str(len(jobs)))
+    for i, job in enumerate(jobs):
+        job = job.rstrip("\n")
+        if "SRUN_STEP" in job:
+            cmd = job.replace(
+                "SRUN_STEP",
+                srun + " --ntasks=" + str(step_ntasks) + " --cpus-per-task=" + str(threads)
+                + " --cpu-bind=${SLOT_RANK_MASKS[STEP_LOCAL]} --kill-on-bad-exit=1",
+            )
+        else:
+            cmd = (
+                srun + " --ntasks=1 --cpus-per-task=" + str(step_ntasks * threads)
+                + " --cpu-bind=mask_cpu:${SLOT_MASKS[STEP_LOCAL]}"
+                + " --export=ALL,OMPI_MCA_rmaps_base_oversubscribe=1,I_MPI_HYDRA_BOOTSTRAP=fork"
+                + " bash -c " + shlex.quote(job)
+            )
+        log = output + "_step" + str(i + 1).zfill(zfill) + "_${SLURM_JOB_ID}.out"
+        block += "step_slot\n"
+        block += "(\n"
+        block += "export ${SLOT_ENV[STEP_LOCAL]}\n"
+        block += cmd + "\n"
+        block += ") > " + log + " 2>&1 &\n"
+        block += "SLOT_PIDS[STEP_SLOT]=$!\n"
+        block += "STEP_PIDS+=($!)\n"
+        block += "\n"
+
+    block += _stepsReport(output)
+    return block
+
+
+def peleCpus(job, default=None):
+    """
+    Return the MPI ranks a PELE job asks for: the ``cpus:`` entry of the
+    input yaml its command runs (found relative to the ``cd`` lines before
+    it), else the ``-np``/``-n`` of an explicit mpirun/srun, else default.
+    """
+
+    folder = ""
+    for line in job.splitlines():
+        for command in line.split("&&"):
+            command = command.strip()
+            if command.startswith("cd "):
+                folder = os.path.normpath(os.path.join(folder, command[3:].strip()))
+                continue
+            match = re.search(r"(\S+\.ya?ml)\b", command)
+            if match:
+                path = os.path.join(folder, match.group(1))
+                if os.path.exists(path):
+                    with open(path) as yf:
+                        cpus = re.search(r"^cpus\s*:\s*(\d+)", yf.read(), re.M)
+                    if cpus:
+                        return int(cpus.group(1))
+            match = re.search(r"(?:mpirun|srun)\s.*?-(?:np|n)\s+(\d+)", command)
+            if match:
+                return int(match.group(1))
+    return default
+
+
+def packNodes(sizes, cores_per_node):
+    """
+    First-fit-decreasing bin packing of job sizes (cores) onto nodes.
+    Returns one list of job indices per node.
+    """
+
+    nodes = []
+    free = []
+    for i in sorted(range(len(sizes)), key=lambda i: sizes[i], reverse=True):
+        if sizes[i] > cores_per_node:
+            raise ValueError(f"A job needs {sizes[i]} cores; a node has {cores_per_node}.")
+        for n, cores in enumerate(free):
+            if sizes[i] <= cores:
+                nodes[n].append(i)
+                free[n] -= sizes[i]
+                break
+        else:
+            nodes.append([i])
+            free.append(cores_per_node - sizes[i])
+    return nodes
+
+
+def checkConcurrency(concurrency):
+    """Validate a jobArrays ``concurrency`` value (positive int or True)."""
+    if concurrency is not True and (
+        not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1
+    ):
+        raise ValueError("concurrency must be a positive integer or True (one slot per allocated core).")
+
+
+def concurrentHelpers(concurrency, output):
+    """
+    Return the bash helpers used by concurrentBlock(), written once per script.
+
+    ``concurrency`` is the number of commands of a bundle run at the same
+    time; True uses every core the task may run on (``nproc`` honours the
+    task's cpuset, i.e. its cpus-per-task or ntasks). Exit codes are appended
+    as ``<job number> <exit code>`` lines to
+    ``<output>_<task>_<jobid>.exitcodes``.
+    """
+
+    if concurrency is True:
+        slots = "$(nproc)"
+    else:
+        slots = str(concurrency)
+
+    return (
+        "# Bounded concurrent execution of the commands bundled in each array task\n"
+        f"BUNDLE_SLOTS={slots}\n"
+        f'BUNDLE_STATUS="{output}_${{SLURM_ARRAY_TASK_ID}}_${{SLURM_ARRAY_JOB_ID:-$SLURM_JOB_ID}}.exitcodes"\n'
+        ': > "$BUNDLE_STATUS"\n'
+        + LIVE_PIDS
+        + "bundle_slot() {\n"
+        "    while [ \"$(live_pids \"${BUNDLE_PIDS[@]}\")\" -ge \"$BUNDLE_SLOTS\" ]; do\n"
+        "        wait -n\n"
+        "    done\n"
+        "}\n"
+        "bundle_report() {\n"
+        "    local failed\n"
+        "    failed=$(awk '$2 != 0' \"$BUNDLE_STATUS\" | wc -l)\n"
+        '    if [ "$failed" -gt 0 ]; then\n'
+        '        echo "[bsc_calculations] $failed command(s) failed; exit codes in $BUNDLE_STATUS" >&2\n'
+        "        return 1\n"
+        "    fi\n"
+        "}\n"
+    )
+
+
+def concurrentBlock(commands, first=1):
+    """
+    Return the bash block that runs a bundle of commands through the bounded
+    executor of concurrentHelpers() instead of one after the other.
+
+    Each command runs in its own subshell (so ``cd`` does not leak between
+    commands) as soon as a slot is free, and its exit code is recorded under
+    its job number (``first`` for the first command of the bundle); the
+    array task exits non-zero if any of them failed.
+    """
+
+    block = "BUNDLE_PIDS=()\n"
+    for k, cmd in enumerate(commands):
+        block += "bundle_slot\n"
+        block += "{ (\n"
+        block += cmd.rstrip("\n") + "\n"
+        block += "); echo \"" + str(first + k) + " $?\" >> \"$BUNDLE_STATUS\"; } &\n"
+        block += "BUNDLE_PIDS+=($!)\n"
+    block += 'wait "${BUNDLE_PIDS[@]}"\n'
+    block += "bundle_report || exit 1\n"
+    return block
@@ -0,0 +1,123 @@
+import gzip
+
+from . import dispatcher
+from .tables import INDEX_WIDTH
+
+# Task-side decompression command of each codec.
+DECOMPRESS = {"gzip": "gzip -dc", "zstd": "zstd -dcq"}
+EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def _compressor(codec, level):
+    """Return a callable compressing one frame with the codec."""
+
+    if codec == "gzip":
+        level = 6 if level is None else level
+        return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+    if codec == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError(
+                "codec='zstd' needs the zstandard package (pip install zstandard); use codec='gzip'."
+            )
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress
+    raise ValueError(f"Unknown payload codec {codec!r}: use 'gzip' or 'zstd'.")
+
+
+def writeJobPayload(jobs, payload_file, codec="gzip", jobs_per_frame=64, level=None):
+    """
+    Store job commands compressed in independently decompressible frames.
+
+    Every ``jobs_per_frame`` consecutive jobs (NUL separated) are compressed
+    into one frame (a gzip member or a zstd frame, so the whole file is also a
+    valid .gz/.zst). The index ``<payload_file>.idx`` uses the fixed-width
+    format of tables.buildTableIndex: entry 0 holds the payload size, entry F
+    the byte offset of frame F and the last entry the payload size again (the
+    end of the last frame). Array task N then reads and decompresses only the
+    frame holding job N (see payloadTaskBlock).
+
+    Parameters
+    ==========
+    jobs : iterable
+        Job commands (strings or a core.JobBatch); read once, a frame at a time.
+    payload_file : str
+        Output path.
+    codec : str
+        'gzip' (standard library) or 'zstd' (needs the zstandard package here and
+        the zstd command on the compute nodes).
+    jobs_per_frame : int
+        Jobs per frame: larger frames compress better, smaller frames are cheaper
+        to decompress per task.
+    level : int
+        Compression level (default 6 for gzip, 3 for zstd).
+
+    Returns
+    =======
+    int
+        Number of jobs written.
+    """
+
+    if not isinstance(jobs_per_frame, int) or isinstance(jobs_per_frame, bool) or jobs_per_frame < 1:
+        raise ValueError(f"jobs_per_frame must be a positive integer, got {jobs_per_frame!r}")
+    compress = _compressor(codec, level)
+
+    n = 0
+    offsets = []
+    frame = []
+    with open(payload_file, "wb") as pf:
+
+        def flush():
+            offsets.append(pf.tell())
+            pf.write(compress("".join(frame).encode()))
+            frame.clear()
+
+        for job in jobs:
+            if "\0" in job:
+                raise ValueError("Jobs stored in a payload cannot contain NUL characters.")
+            frame.append(job + "\0")
+            n += 1
+            if len(frame) == jobs_per_frame:
+                flush()
+        if frame:
+            flush()
+        size = pf.tell()
+
+    width = INDEX_WIDTH - 1
+    with open(payload_file + ".idx", "w") as xf:
+        for o in [size] + offsets + [size]:
+            xf.write(str(o).zfill(width) + "\n")
+    return n
+
+
+def readJobPayload(payload_file, task, codec="gzip", jobs_per_frame=64):
+    """Return job ``task`` (one-based) of a payload, decompressing only its frame."""
+
+    return dispatcher.readJob(payload_file, task, codec, jobs_per_frame)
+
+
+def payloadTaskBlock(payload_file, codec="gzip", jobs_per_frame=64):
+    """
+    Return the bash block with which array task N runs job N of a payload.
+
+    The task reads the two index entries bounding its frame, pipes only those
+    bytes through the decompressor and evaluates its job. A payload edited
+    after its index was built fails the task instead of running the wrong job.
+    """
+
+    width = str(INDEX_WIDTH)
+    return (
+        "# Job payload: task N decompresses only the frame holding job N\n"
+        f'JOB_PAYLOAD="{payload_file}"\n'
+        'read -r PAYLOAD_SIZE < "$JOB_PAYLOAD.idx"\n'
+        'if [ "$(( 10#$PAYLOAD_SIZE ))" -ne "$(stat -c %s "$JOB_PAYLOAD")" ]; then\n'
+        '    echo "[bsc_calculations] ERROR: $JOB_PAYLOAD changed since its index was built" >&2\n'
+        "    exit 1\n"
+        "fi\n"
+        f"PAYLOAD_FRAME=$(( (SLURM_ARRAY_TASK_ID - 1) / {jobs_per_frame} + 1 ))\n"
+        "{ read -r FRAME_START; read -r FRAME_END; } < "
+        f'<(tail -c +$(( PAYLOAD_FRAME * {width} + 1 )) "$JOB_PAYLOAD.idx")\n'
+        'mapfile -t -d \'\' FRAME_JOBS < <(tail -c +$(( 10#$FRAME_START + 1 )) "$JOB_PAYLOAD" '
+        f"| head -c $(( 10#$FRAME_END - 10#$FRAME_START )) | {DECOMPRESS[codec]})\n"
+        f'eval "${{FRAME_JOBS[$(( (SLURM_ARRAY_TASK_ID - 1) % {jobs_per_frame} ))]}}"\n'
+    )
@@ -0,0 +1,172 @@
+import heapq
+import os
+import re
+
+# Tabular column holding the query name: BLAST -outfmt 6 (qseqid first) and
+# HMMER --tblout (target name, accession, query name, ...).
+QUERY_COLUMN = {"blast": 0, "hmmer": 2}
+
+
+def readFasta(fasta_file):
+    """Return the (id, sequence) records of a FASTA file (id = first header word)."""
+
+    records = []
+    name, chunks = None, []
+    with open(fasta_file) as ff:
+        for line in ff:
+            line = line.strip()
+            if line.startswith(">"):
+                if name is not None:
+                    records.append((name, "".join(chunks)))
+                name, chunks = line[1:].split()[0], []
+            elif line:
+                chunks.append(line)
+    if name is not None:
+        records.append((name, "".join(chunks)))
+    return records
+
+
+def batchQueries(queries, n_chunks=None, max_residues=None, chunk_dir="query_chunks"):
+    """
+    Merge single queries into size-balanced multi-FASTA chunks.
+
+    Identical sequences are searched once (the first id is kept as the
+    representative and the others are restored by splitResults). The unique
+    queries are packed longest-first into the currently lightest chunk (LPT
+    scheduling), so the chunks carry about the same number of residues and
+    the array tasks finish together.
+
+    Parameters
+    ==========
+    queries : (dict, list, str)
+        {id: sequence}, a list of (id, sequence), or a FASTA file / list of
+        FASTA files (one query per file is the old one-task-per-query layout).
+    n_chunks : int
+        Number of chunks (array tasks).
+    max_residues : int
+        Alternatively, the target residues per chunk (sets n_chunks).
+    chunk_dir : str
+        Directory for the chunk FASTA files.
+
+    Returns
+    =======
+    (list, dict)
+        The chunk FASTA paths and {representative id: [original ids]}.
+    """
+
+    if isinstance(queries, str):
+        queries = [queries]
+    if isinstance(queries, dict):
+        records = list(queries.items())
+    elif queries and isinstance(queries[0], str):
+        records = [r for fasta in queries for r in readFasta(fasta)]
+    else:
+        records = list(queries)
+
+    members = {}
+    unique = {}
+    for name, sequence in records:
+        sequence = sequence.upper()
+        if sequence in unique:
+            members[unique[sequence]].append(name)
+        else:
+            unique[sequence] = name
+            members[name] = [name]
+
+    total = sum(len(s) for s in unique)
+    if n_chunks is None:
+        if max_residues is None:
+            raise ValueError("Give n_chunks or max_residues.")
+        n_chunks = -(-total // max_residues)
+    n_chunks = max(1, min(n_chunks, len(unique)))
+
+    heap = [(0, c, []) for c in range(n_chunks)]
+    for sequence in sorted(unique, key=len, reverse=True):
+        load, c, chunk = heapq.heappop(heap)
+        chunk.append((unique[sequence], sequence))
+        heapq.heappush(heap, (load + len(sequence), c, chunk))
+
+    os.makedirs(chunk_dir, exist_ok=True)
+    zfill = len(str(n_chunks))
+    chunks = []
+    for _, c, chunk in sorted(heap, key=lambda h: h[1]):
+        path = os.path.join(chunk_dir, "chunk_" + str(c + 1).zfill(zfill) + ".fasta")
+        with open(path, "w") as cf:
+            for name, sequence in chunk:
+                cf.write(">" + name + "\n" + sequence + "\n")
+        chunks.append(path)
+    return chunks, members
+
+
+def searchJobs(chunks, tool="blast", database="$TREMBL_DB", flags=None):
+    """
+    Return one search job per chunk (for mn5.jobArrays with program="blast"
+    or "hmmer"); each writes a tabular ``<chunk>.tsv`` next to the chunk.
+
+    BLAST runs ``blastp -outfmt 6`` against the BLAST database (TREMBL_DB by
+    default); HMMER runs ``phmmer --tblout`` against a FASTA database, which
+    must be given explicitly.
+    """
+
+    if tool not in QUERY_COLUMN:
+        raise ValueError("tool must be 'blast' or 'hmmer'")
+    if tool == "hmmer" and database == "$TREMBL_DB":
+        raise ValueError("phmmer searches a FASTA file: pass the FASTA database explicitly.")
+
+    jobs = []
+    for chunk in chunks:
+        out = os.path.splitext(chunk)[0] + ".tsv"
+        if tool == "blast":
+            job = (f"blastp -query {chunk} -db {database} -outfmt 6 -out {out}"
+                   " -num_threads ${SLURM_CPUS_PER_TASK:-1}")
+        else:
+            job = (f"phmmer --cpu ${{SLURM_CPUS_PER_TASK:-1}} --noali --tblout {out}"
+                   f" {chunk} {database} > /dev/null")
+        if flags:
+            job += " " + flags
+        jobs.append(job + "\n")
+    return jobs
+
+
+def _renameQuery(line, column, name, tool):
+    """Return a result line with its query column set to name (separators kept)."""
+
+    if tool == "blast":
+        fields = line.split("\t")
+        fields[column] = name
+        return "\t".join(fields)
+    # Whitespace-aligned HMMER tables: keep the separators between the fields
+    fields = re.split(r"(\s+)", line)
+    fields[2 * column + (2 if fields[0] == "" else 0)] = name
+    return "".join(fields)
+
+
+def splitResults(result_files, members, output_dir="search_results", tool="blast"):
+    """
+    Split per-chunk tabular results back into one file per original query
+    (``<output_dir>/<id>.tsv``), copying the hits of a deduplicated sequence
+    to every query that shared it with the query column set to that query's
+    own id. Queries without hits get an empty file. HMMER comment lines are
+    dropped.
+    """
+
+    column = QUERY_COLUMN[tool]
+    hits = {name: [] for name in members}
+    for result_file in result_files:
+        with open(result_file) as rf:
+            for line in rf:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                query = line.split("\t" if tool == "blast" else None)[column]
+                hits.setdefault(query, []).append(line)
+
+    os.makedirs(output_dir, exist_ok=True)
+    for representative, names in members.items():
+        lines = hits.get(representative, [])
+        for name in names:
+            with open(os.path.join(output_dir, name + ".tsv"), "w") as of:
+                if name == representative:
+                    of.writelines(lines)
+                else:
+                    of.writelines(_renameQuery(line, column, name, tool) for line in lines)
+    return output_dir
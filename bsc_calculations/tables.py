@@ -0,0 +1,229 @@
+import csv
+import os
+import re
+
+# Width of one entry of a table index: a zero-padded byte offset plus "\n".
+INDEX_WIDTH = 13
+
+# A {column} placeholder of a command template; ${NAME} is a shell expansion, not a placeholder.
+PLACEHOLDER = re.compile(r"(?<!\$)\{(\w+)\}")
+
+
+def writeParameterTable(rows, table_file, columns=None):
+    """
+    Write parameter rows to a tab-separated table with a header line.
+
+    Parameters
+    ==========
+    rows : iterable
+        Dicts (column -> value) or sequences ordered as ``columns``.
+    table_file : str
+        Output path.
+    columns : list
+        Column names. Defaults to the keys of the first row.
+
+    Returns
+    =======
+    int
+        Number of rows written.
+    """
+
+    n = 0
+    with open(table_file, "w") as tf:
+        for row in rows:
+            if columns is None:
+                columns = list(row)
+            if n == 0:
+                tf.write("\t".join(str(c) for c in columns) + "\n")
+            if isinstance(row, dict):
+                values = [row[c] for c in columns]
+            else:
+                values = list(row)
+            values = [str(v) for v in values]
+            if any("\t" in v or "\n" in v for v in values):
+                raise ValueError(f"Table values cannot contain tabs or newlines: {values}")
+            tf.write("\t".join(values) + "\n")
+            n += 1
+    return n
+
+
+def _table_rows(table, columns):
+    """Return (columns, row iterator) for in-memory tables."""
+
+    # pandas DataFrame
+    if hasattr(table, "itertuples") and hasattr(table, "columns"):
+        return [str(c) for c in table.columns], table.itertuples(index=False, name=None)
+    # numpy structured / record array
+    names = getattr(getattr(table, "dtype", None), "names", None)
+    if names:
+        return list(names), (tuple(r) for r in table)
+    # dict of columns
+    if isinstance(table, dict):
+        columns = list(table)
+        return columns, zip(*(table[c] for c in columns))
+    rows = iter(table)
+    first = next(rows, None)
+    if first is None:
+        raise ValueError("The parameter table is empty.")
+    if isinstance(first, dict):
+        columns = list(first) if columns is None else columns
+    elif columns is None:
+        # plain 2D array / list of lists: placeholders are {0}, {1}, ...
+        columns = [str(i) for i in range(len(first))]
+
+    def chained():
+        yield first
+        yield from rows
+
+    return columns, chained()
+
+
+def prepareParameterTable(table, table_file=None, columns=None):
+    """
+    Turn a parameter table into an indexed TSV file that array tasks can read.
+
+    Parameters
+    ==========
+    table : (str, object)
+        A path to a TSV (used in place) or CSV (converted to ``<name>.tsv``)
+        file with a header line, or an in-memory table: a pandas DataFrame, a
+        numpy structured array, a dict of columns, a list of dicts or a 2D
+        array / list of lists (columns named 0, 1, ... unless given).
+    table_file : str
+        Where to write in-memory tables.
+    columns : list
+        Column names for 2D arrays.
+
+    Returns
+    =======
+    (str, list, int)
+        The TSV path, its column names and its number of rows. The byte
+        offset index is written to ``<table_file>.idx`` (see buildTableIndex).
+    """
+
+    if isinstance(table, str):
+        if table.endswith(".csv"):
+            tsv_file = table[: -len(".csv")] + ".tsv"
+            with open(table) as cf:
+                reader = csv.reader(cf)
+                header = next(reader)
+                writeParameterTable(reader, tsv_file, columns=header)
+            table = tsv_file
+        columns, rows = buildTableIndex(table)
+        return table, columns, rows
+
+    if table_file is None:
+        raise ValueError("In-memory parameter tables need a table_file to be written to.")
+    columns, rows = _table_rows(table, columns)
+    writeParameterTable(rows, table_file, columns=columns)
+    columns, rows = buildTableIndex(table_file)
+    return table_file, columns, rows
+
+
+def buildTableIndex(table_file, index_file=None):
+    """
+    Write the byte-offset index of a TSV parameter table.
+
+    Entry 0 holds the table size (so tasks detect a table edited after the
+    index was built) and entry N the offset of data row N, each as a
+    fixed-width line of INDEX_WIDTH bytes. Task N then seeks straight to its
+    row instead of scanning the table.
+
+    Returns
+    =======
+    (list, int)
+        The column names and the number of data rows.
+    """
+
+    if index_file is None:
+        index_file = table_file + ".idx"
+
+    offsets = []
+    with open(table_file, "rb") as tf:
+        header = tf.readline()
+        offset = len(header)
+        for line in tf:
+            if line.strip():
+                offsets.append(offset)
+            offset += len(line)
+
+    width = INDEX_WIDTH - 1
+    with open(index_file, "w") as xf:
+        xf.write(str(os.path.getsize(table_file)).zfill(width) + "\n")
+        for o in offsets:
+            xf.write(str(o).zfill(width) + "\n")
+
+    columns = header.decode().rstrip("\r\n").split("\t")
+    return columns, len(offsets)
+
+
+def _rowTemplate(template, columns):
+    """Replace the placeholders by quoted ${ROW[i]} references, minding the template's own quotes."""
+
+    index = {column: i for i, column in enumerate(columns)}
+    out = []
+    quote = None
+    i = 0
+    while i < len(template):
+        match = PLACEHOLDER.match(template, i)
+        if match:
+            ref = "${ROW[" + str(index[match.group(1)]) + "]}"
+            if quote == '"':
+                out.append(ref)
+            elif quote == "'":
+                out.append("'\"" + ref + "\"'")
+            else:
+                out.append('"' + ref + '"')
+            i = match.end()
+            continue
+        char = template[i]
+        if char == "\\" and quote != "'":
+            out.append(template[i : i + 2])
+            i += 2
+            continue
+        if char in "'\"":
+            if quote is None:
+                quote = char
+            elif quote == char:
+                quote = None
+        out.append(char)
+        i += 1
+    return "".join(out)
+
+
+def tableTaskBlock(template, table_file, columns):
+    """
+    Return the bash block with which array task N runs ``template`` on row N
+    of ``table_file`` (one-based, after the header).
+
+    ``{column}`` placeholders in the template are replaced by the row's
+    values, so the script holds one template whatever the number of rows.
+    Each value expands as one quoted word (spaces and globs are kept as
+    they are), and shell expansions such as ``${HOME}`` are left alone.
+    The task reads its row's offset from the index and reads only that row;
+    if the table changed size since the index was built it falls back to
+    scanning for the row.
+    """
+
+    unknown = set(PLACEHOLDER.findall(template)) - set(columns)
+    if unknown:
+        raise ValueError(
+            "Template placeholders not in the parameter table: " + ", ".join(sorted(unknown))
+        )
+    template = _rowTemplate(template, columns)
+
+    width = str(INDEX_WIDTH)
+    return (
+        "# Parameter table: task N runs the template on row N of the table\n"
+        f'PARAM_TABLE="{table_file}"\n'
+        'read -r TABLE_SIZE < "$PARAM_TABLE.idx"\n'
+        'if [ "$(( 10#$TABLE_SIZE ))" -eq "$(stat -c %s "$PARAM_TABLE")" ]; then\n'
+        f'    read -r ROW_OFFSET < <(tail -c +$(( SLURM_ARRAY_TASK_ID * {width} + 1 )) "$PARAM_TABLE.idx")\n'
+        '    ROW_LINE=$(tail -c +$(( 10#$ROW_OFFSET + 1 )) "$PARAM_TABLE" | head -n 1)\n'
+        "else\n"
+        '    echo "[bsc_calculations] WARNING: $PARAM_TABLE changed since its index was built" >&2\n'
+        "    ROW_LINE=$(awk -v n=$SLURM_ARRAY_TASK_ID 'NR > 1 && NF && ++i == n {print; exit}' \"$PARAM_TABLE\")\n"
+        "fi\n"
+        "mapfile -t -d $'\\t' ROW < <(printf '%s' \"$ROW_LINE\" | tr -d '\\r')\n"
+        + template.rstrip("\n") + "\n"
+    )
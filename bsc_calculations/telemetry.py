@@ -0,0 +1,201 @@
+import glob
+import os
+
+# Columns written by the per-task sampler (after the "# key=value" metadata line).
+# cpu_seconds, read_bytes and write_bytes are cumulative counters.
+TELEMETRY_COLUMNS = [
+    "time",
+    "cpu_seconds",
+    "rss_kb",
+    "read_bytes",
+    "write_bytes",
+    "gpu_util",
+    "gpu_mem_mb",
+]
+
+
+def samplerBlock(telemetry_dir="telemetry", interval=30, program=None):
+    """
+    Return the bash block that samples the running task's resource usage.
+
+    The sampler runs in the background for the whole life of the array task
+    and appends one CSV row every ``interval`` seconds (plus a final one on
+    exit) to ``<telemetry_dir>/<job>_<task>_<jobid>.csv``. CPU time, resident
+    memory and I/O bytes are read from the task's cgroup (v2) when it is
+    visible, otherwise summed over the processes of the task's session from
+    ``/proc/<pid>/stat`` (including reaped children), ``ps`` and
+    ``/proc/<pid>/io``. GPU utilisation and memory come from
+    ``nvidia-smi`` when it exists. The first line records the preset and the
+    allocation so summarizeTelemetry() can compare use against request.
+
+    Parameters
+    ==========
+    telemetry_dir : str
+        Directory for the per-task CSV files (relative to the submit dir).
+    interval : int
+        Seconds between samples.
+    program : str
+        Preset name recorded in the metadata line (None -> "none").
+    """
+
+    if not isinstance(interval, int) or isinstance(interval, bool) or interval < 1:
+        raise ValueError("The telemetry interval must be a positive integer (seconds).")
+
+    program = program if program is not None else "none"
+
+    return (
+        "# Per-task resource telemetry (see bsc_calculations.telemetry)\n"
+        f"TELEMETRY_DIR={telemetry_dir}\n"
+        'mkdir -p "$TELEMETRY_DIR"\n'
+        'TELEMETRY_FILE="$TELEMETRY_DIR/${SLURM_JOB_NAME}_${SLURM_ARRAY_TASK_ID:-0}_${SLURM_ARRAY_JOB_ID:-$SLURM_JOB_ID}.csv"\n'
+        "TELEMETRY_SID=$(ps -o sid= -p $$ | tr -d ' ')\n"
+        "TELEMETRY_CG=/sys/fs/cgroup$(awk -F: '$1 == \"0\" {print $3}' /proc/self/cgroup 2>/dev/null)\n"
+        "telemetry_sample() {\n"
+        "    local cpu rss rb wb gpu\n"
+        '    if [ -r "$TELEMETRY_CG/cpu.stat" ]; then\n'
+        "        cpu=$(awk '$1 == \"usage_usec\" {printf \"%.1f\", $2 / 1e6}' \"$TELEMETRY_CG/cpu.stat\")\n"
+        "        rss=$(awk '$1 == \"anon\" {printf \"%d\", $2 / 1024}' \"$TELEMETRY_CG/memory.stat\" 2>/dev/null)\n"
+        "        read rb wb < <(awk '{for (i = 2; i <= NF; i++) {split($i, kv, \"=\"); if (kv[1] == \"rbytes\") r += kv[2]; if (kv[1] == \"wbytes\") w += kv[2]}} END {printf \"%d %d\\n\", r, w}' \"$TELEMETRY_CG/io.stat\" 2>/dev/null)\n"
+        "    else\n"
+        "        cpu=$(for p in $(ps -o pid= -s \"$TELEMETRY_SID\"); do cat /proc/$p/stat 2>/dev/null; done | awk -v hz=$(getconf CLK_TCK) '{sub(/^.*\\) /, \"\"); c += $12 + $13 + $14 + $15} END {printf \"%.1f\", c / hz}')\n"
+        "        rss=$(ps -o rss= -s \"$TELEMETRY_SID\" | awk '{r += $1} END {printf \"%d\", r}')\n"
+        "        read rb wb < <(for p in $(ps -o pid= -s \"$TELEMETRY_SID\"); do cat /proc/$p/io 2>/dev/null; done | awk '$1 == \"read_bytes:\" {r += $2} $1 == \"write_bytes:\" {w += $2} END {printf \"%d %d\\n\", r, w}')\n"
+        "    fi\n"
+        "    gpu=,\n"
+        "    if command -v nvidia-smi > /dev/null 2>&1; then\n"
+        "        gpu=$(nvidia-smi --query-gpu=utilization.gpu,memory.used --format=csv,noheader,nounits -i \"${CUDA_VISIBLE_DEVICES:-0}\" 2>/dev/null | awk -F', ' '{u += $1; m += $2; n++} END {if (n) printf \"%.1f,%d\", u / n, m; else printf \",\"}')\n"
+        "    fi\n"
+        '    echo "$(date +%s),${cpu:-0},${rss:-0},${rb:-0},${wb:-0},$gpu" >> "$TELEMETRY_FILE"\n'
+        "}\n"
+        f'echo "# program={program} job=${{SLURM_JOB_NAME}} task=${{SLURM_ARRAY_TASK_ID:-0}} '
+        'cpus=${SLURM_CPUS_ON_NODE:-1} mem_per_cpu_mb=${SLURM_MEM_PER_CPU:-} '
+        'mem_per_node_mb=${SLURM_MEM_PER_NODE:-} gpus=${SLURM_GPUS_ON_NODE:-0}" > "$TELEMETRY_FILE"\n'
+        f'echo "{",".join(TELEMETRY_COLUMNS)}" >> "$TELEMETRY_FILE"\n'
+        f"( while true; do telemetry_sample; sleep {interval}; done ) &\n"
+        "TELEMETRY_PID=$!\n"
+        "trap 'kill $TELEMETRY_PID 2>/dev/null; telemetry_sample' EXIT\n"
+    )
+
+
+def readTelemetry(telemetry_file):
+    """
+    Read one per-task telemetry CSV.
+
+    Returns
+    =======
+    (dict, list of dict)
+        The metadata from the first line and the samples (numbers as floats,
+        missing GPU values as None).
+    """
+
+    metadata = {}
+    samples = []
+    with open(telemetry_file) as tf:
+        for line in tf:
+            line = line.strip()
+            if line.startswith("#"):
+                for item in line[1:].split():
+                    if "=" in item:
+                        key, value = item.split("=", 1)
+                        metadata[key] = value
+                continue
+            if not line or line.startswith(TELEMETRY_COLUMNS[0]):
+                continue
+            values = line.split(",")
+            if len(values) != len(TELEMETRY_COLUMNS):
+                continue
+            samples.append({
+                c: (float(v) if v != "" else None) for c, v in zip(TELEMETRY_COLUMNS, values)
+            })
+    return metadata, samples
+
+
+def _task_metrics(metadata, samples):
+    first, last = samples[0], samples[-1]
+    elapsed = last["time"] - first["time"]
+    cpus = float(metadata.get("cpus") or 1)
+
+    requested_mb = None
+    if metadata.get("mem_per_node_mb"):
+        requested_mb = float(metadata["mem_per_node_mb"])
+    elif metadata.get("mem_per_cpu_mb"):
+        requested_mb = float(metadata["mem_per_cpu_mb"]) * cpus
+
+    peak_rss_mb = max(s["rss_kb"] for s in samples) / 1024
+    # cpu_seconds is cumulative; with the /proc fallback it can drop when a
+    # process exits before its parent reaps it, so only count the increments.
+    cpu_seconds = sum(
+        max(b["cpu_seconds"] - a["cpu_seconds"], 0) for a, b in zip(samples, samples[1:])
+    )
+    gpu_util = [s["gpu_util"] for s in samples if s["gpu_util"] is not None]
+    gpu_mem = [s["gpu_mem_mb"] for s in samples if s["gpu_mem_mb"] is not None]
+
+    return {
+        "elapsed_s": elapsed,
+        "cpus": cpus,
+        "cpu_efficiency": cpu_seconds / (elapsed * cpus) if elapsed > 0 else None,
+        "peak_rss_mb": peak_rss_mb,
+        "mem_efficiency": peak_rss_mb / requested_mb if requested_mb else None,
+        "gpu_util": sum(gpu_util) / len(gpu_util) if gpu_util else None,
+        "peak_gpu_mem_mb": max(gpu_mem) if gpu_mem else None,
+        "read_gb": max(last["read_bytes"] - first["read_bytes"], 0) / 1e9,
+        "write_gb": max(last["write_bytes"] - first["write_bytes"], 0) / 1e9,
+    }
+
+
+def summarizeTelemetry(telemetry_dir="telemetry"):
+    """
+    Aggregate per-task telemetry files into an efficiency report per preset.
+
+    Parameters
+    ==========
+    telemetry_dir : str
+        Directory holding the CSV files written by samplerBlock().
+
+    Returns
+    =======
+    dict
+        ``{program: {"tasks": n, "<metric>": {"mean":, "min":, "max":}, ...}}``
+        for the metrics elapsed_s, cpu_efficiency (CPU time / (elapsed x
+        allocated cpus)), peak_rss_mb, mem_efficiency (peak RSS / requested
+        memory), gpu_util (%), peak_gpu_mem_mb, read_gb and write_gb. Each
+        program entry also keeps the raw per-task metrics under "per_task".
+    """
+
+    per_program = {}
+    for telemetry_file in sorted(glob.glob(os.path.join(telemetry_dir, "*.csv"))):
+        metadata, samples = readTelemetry(telemetry_file)
+        if len(samples) < 2:
+            continue
+        metrics = _task_metrics(metadata, samples)
+        metrics["file"] = telemetry_file
+        per_program.setdefault(metadata.get("program", "none"), []).append(metrics)
+
+    summary = {}
+    for program, tasks in per_program.items():
+        entry = {"tasks": len(tasks), "per_task": tasks}
+        for metric in tasks[0]:
+            if metric in ("file", "cpus"):
+                continue
+            values = [t[metric] for t in tasks if t[metric] is not None]
+            if values:
+                entry[metric] = {
+                    "mean": sum(values) / len(values),
+                    "min": min(values),
+                    "max": max(values),
+                }
+        summary[program] = entry
+    return summary
+
+
+def telemetryReport(summary):
+    """Return a plain-text table of summarizeTelemetry() means per preset."""
+
+    columns = ["cpu_efficiency", "mem_efficiency", "peak_rss_mb", "gpu_util", "elapsed_s"]
+    lines = ["program".ljust(16) + "tasks".rjust(7) + "".join(c.rjust(16) for c in columns)]
+    for program, entry in sorted(summary.items()):
+        row = program.ljust(16) + str(entry["tasks"]).rjust(7)
+        for c in columns:
+            row += (f"{entry[c]['mean']:.2f}" if c in entry else "-").rjust(16)
+        lines.append(row)
+    return "\n".join(lines)
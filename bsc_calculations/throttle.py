@@ -0,0 +1,108 @@
+def arrayThrottle(throttle, tasks=None, demands=None):
+    """
+    Return the %N limit of concurrently running array tasks for a budget.
+
+    Parameters
+    ==========
+    throttle : (int, dict)
+        The limit itself, or the budgets of shared resources, e.g.
+        ``{"licenses": 40, "io_streams": 16}`` (licence tokens available to
+        the campaign, concurrent streams GPFS sustains for the job's files).
+    tasks : int
+        Number of array tasks; no limit is returned when they all fit.
+    demands : dict
+        Units of each budgeted resource one task uses (default 1 per
+        resource, e.g. {"licenses": 8} for a task checking out 8 tokens).
+
+    Returns
+    =======
+    int
+        N for ``--array=1-<tasks>%N``, or None when no throttle is needed.
+    """
+
+    if throttle is None:
+        return None
+    if isinstance(throttle, dict):
+        demands = demands or {}
+        limits = []
+        for resource, budget in throttle.items():
+            demand = demands.get(resource, 1)
+            if demand <= 0:
+                raise ValueError(f"The per-task demand of {resource} must be positive, got {demand!r}")
+            if budget < demand:
+                raise ValueError(
+                    f"The {resource} budget ({budget}) is below what one task needs ({demand})."
+                )
+            limits.append(int(budget // demand))
+        if not limits:
+            return None
+        throttle = min(limits)
+    elif not isinstance(throttle, int) or isinstance(throttle, bool) or throttle < 1:
+        raise ValueError(f"throttle must be a positive integer or a dict of budgets, got {throttle!r}")
+    if tasks is not None and throttle >= tasks:
+        return None
+    return throttle
+
+
+def arraySuffix(throttle, tasks=None, demands=None):
+    """Return the ``%N`` suffix of an --array range ("" when unthrottled)."""
+
+    limit = arrayThrottle(throttle, tasks, demands)
+    return "" if limit is None else "%" + str(limit)
+
+
+def flexlmProbe(feature, lmstat="$SCHRODINGER/licadmin STAT"):
+    """
+    Return a shell command printing the free tokens of a FlexLM feature
+    (e.g. GLIDE_MAIN), from the "Users of <feature>: (Total of X licenses
+    issued; Total of Y licenses in use)" line of lmstat / licadmin STAT.
+    """
+
+    return f"{lmstat} 2>/dev/null | awk '$3 == \"{feature}:\" {{print $6 - $11; exit}}'"
+
+
+def writeThrottleMonitor(script_name, probe, demand=1, interval=300, min_throttle=1, max_throttle=None):
+    """
+    Write a monitor that keeps an array's throttle matched to a live budget.
+
+    Run it next to the job (``nohup bash <script_name> <array job id> &`` on a
+    login node, or as a small job). Every ``interval`` seconds it runs
+    ``probe`` (a shell command printing the free units of the budget, see
+    flexlmProbe), counts the job's running tasks and sets
+    ``scontrol update JobId=<id> ArrayTaskThrottle=N`` with N = running +
+    free // demand, clamped to [min_throttle, max_throttle]. Running tasks
+    keep their units, so N never stops them; it only gates new tasks. The
+    monitor exits when the job leaves the queue.
+
+    Returns
+    =======
+    str
+        The monitor script.
+    """
+
+    if not isinstance(interval, int) or isinstance(interval, bool) or interval < 0:
+        raise ValueError("interval must be a non-negative integer (seconds).")
+    max_throttle = 0 if max_throttle is None else max_throttle
+
+    with open(script_name, "w") as ms:
+        ms.write("#!/bin/bash\n")
+        ms.write("# Match the ArrayTaskThrottle of an array job to a live budget (see bsc_calculations.throttle)\n")
+        ms.write('JOB=${1:?"usage: $0 <array job id>"}\n')
+        ms.write("LAST=\n")
+        ms.write('while [ -n "$(squeue -h -j "$JOB" 2>/dev/null)" ]; do\n')
+        ms.write(f"    FREE=$({probe})\n")
+        ms.write("    if [[ $FREE =~ ^[0-9]+$ ]]; then\n")
+        ms.write('        RUNNING=$(squeue -h -r -j "$JOB" -t RUNNING | wc -l)\n')
+        ms.write(f"        N=$(( RUNNING + FREE / {demand} ))\n")
+        ms.write(f"        (( N < {min_throttle} )) && N={min_throttle}\n")
+        ms.write(f"        (( {max_throttle} > 0 && N > {max_throttle} )) && N={max_throttle}\n")
+        ms.write('        if [ "$N" != "$LAST" ]; then\n')
+        ms.write('            scontrol update JobId="$JOB" ArrayTaskThrottle="$N" && LAST=$N\n')
+        ms.write("            echo \"$(date '+%F %T') throttle=$N free=$FREE running=$RUNNING\"\n")
+        ms.write("        fi\n")
+        ms.write("    else\n")
+        ms.write("        echo \"$(date '+%F %T') WARNING: the budget probe returned '$FREE'\" >&2\n")
+        ms.write("    fi\n")
+        ms.write(f"    sleep {interval}\n")
+        ms.write("done\n")
+    return script_name
@@ -0,0 +1,337 @@
+import math
+import re
+
+from . import advisor
+
+# Short sbatch options used by the generators, by long name.
+_SHORT_OPTIONS = {"-J": "job-name", "-t": "time", "-n": "ntasks", "-c": "cpus-per-task", "-a": "array"}
+
+
+def sbatchOptions(script):
+    """Return the #SBATCH options of a script header as {long name: value} (the last one wins)."""
+
+    options = {}
+    with open(script) as sf:
+        for line in sf:
+            if not line.startswith("#"):
+                break
+            match = re.match(r"#SBATCH\s+(--[\w-]+|-\w)(?:[= ]\s*(\S+))?", line)
+            if match:
+                name = _SHORT_OPTIONS.get(match.group(1), match.group(1).lstrip("-"))
+                options[name] = match.group(2)
+    return options
+
+
+def arrayRange(script):
+    """Return the (first, last) task ids of a job-array script, or None for a single job."""
+
+    array = sbatchOptions(script).get("array")
+    if array is None:
+        return None
+    match = re.match(r"(\d+)(?:-(\d+))?", array)
+    first = int(match.group(1))
+    return first, int(match.group(2) or first)
+
+
+def arrayLimit(script):
+    """Return the ``%N`` limit of concurrent tasks of a job-array script (None when unthrottled)."""
+
+    array = sbatchOptions(script).get("array")
+    match = re.search(r"%(\d+)$", array or "")
+    return int(match.group(1)) if match else None
+
+
+class Workflow:
+    """
+    Multi-stage campaign submitted as one Slurm dependency graph.
+
+    Each stage is a script written by an existing generator (jobArrays,
+    singleJob, ...) or given directly, plus the stages it depends on. When a
+    job array depends on another array task by task (task N of the stage
+    needs only task N upstream, the layout of e.g. AF3 -> OpenMM over the
+    same systems), the dependency is ``aftercorr``, so each task starts as
+    soon as its own upstream task finishes. Otherwise the stage waits for the
+    whole upstream job (``afterok``). writeSubmitScript() emits one script
+    submitting every stage in order with its dependencies.
+
+    Example
+    =======
+    wf = workflow.Workflow()
+    wf.addStage("fold", mn5.jobArrays, af3_jobs, script_name="fold.sh", job_name="fold", ...)
+    wf.addStage("md", mn5.jobArrays, md_jobs, script_name="md.sh", job_name="md", after="fold", ...)
+    wf.addStage("analysis", mn5.singleJob, job, script_name="analysis.sh", after="md", ...)
+    wf.writeSubmitScript("campaign_submit.sh")
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def addStage(self, name, generator, *args, after=None, per_task=True, cost=None, **kwargs):
+        """
+        Add a stage.
+
+        Parameters
+        ==========
+        name : str
+            Stage name (letters, digits and underscores).
+        generator : (callable, str)
+            A script generator called as ``generator(*args, **kwargs)``; the
+            script is the path it returns, or else its ``script_name``
+            argument. A string is taken as an already written script.
+        after : (str, list)
+            Upstream stage(s), which must have been added before.
+        per_task : bool
+            Map array tasks one to one onto the upstream array tasks
+            (aftercorr). Needs the same task ids on both sides; single jobs
+            and per_task=False wait for the whole upstream job (afterok).
+        cost : float
+            Estimated hours per task, for schedule() (default: runtime history,
+            then the script's walltime).
+
+        Returns
+        =======
+        str
+            The stage script.
+        """
+
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name):
+            raise ValueError(f"Stage names must be letters, digits and underscores, got {name!r}")
+        if name.upper() in (stage.upper() for stage in self.stages):
+            raise ValueError(f"Stage {name!r} was already added (names are case-insensitive).")
+        if after is None:
+            after = []
+        elif isinstance(after, str):
+            after = [after]
+        for upstream in after:
+            if upstream not in self.stages:
+                raise ValueError(f"Stage {name!r} depends on {upstream!r}, which must be added first.")
+
+        if isinstance(generator, str):
+            script = generator
+        else:
+            returned = generator(*args, **kwargs)
+            script = returned if isinstance(returned, str) else kwargs.get("script_name")
+            if script is None:
+                raise ValueError(f"Give the script_name of stage {name!r}.")
+        tasks = arrayRange(script)
+
+        dependencies = []
+        for upstream in after:
+            upstream_tasks = self.stages[upstream]["tasks"]
+            if per_task and tasks is not None and upstream_tasks is not None:
+                if tasks != upstream_tasks:
+                    raise ValueError(
+                        f"Stage {name!r} (tasks {tasks[0]}-{tasks[1]}) cannot depend task by task on "
+                        f"{upstream!r} (tasks {upstream_tasks[0]}-{upstream_tasks[1]}); use the same "
+                        "number of tasks or per_task=False."
+                    )
+                dependencies.append(("aftercorr", upstream))
+            else:
+                dependencies.append(("afterok", upstream))
+
+        self.stages[name] = {
+            "script": script, "tasks": tasks, "limit": arrayLimit(script) if tasks else None,
+            "dependencies": dependencies, "cost": cost,
+        }
+        return script
+
+    def _task_hours(self, name, history):
+        """Estimated hours per task: the stage cost, the median history runtime, or the walltime."""
+
+        stage = self.stages[name]
+        if stage["cost"] is not None:
+            return float(stage["cost"]), "cost"
+        options = sbatchOptions(stage["script"])
+        elapsed = sorted(history.get(options.get("job-name"), []))
+        if elapsed:
+            return elapsed[len(elapsed) // 2] / 3600, "history"
+        walltime = advisor._seconds(options.get("time"))
+        if walltime is None:
+            raise ValueError(f"Stage {name!r} has no cost, runtime history or walltime.")
+        return walltime / 3600, "walltime"
+
+    def schedule(self, quota_cores, history=None, nice_per_hour=100, max_nice=10000):
+        """
+        Plan the submission for the shortest end-to-end time within a core quota.
+
+        Each stage's duration is estimated from its hours per task (see
+        addStage(cost=...); else the median Elapsed of COMPLETED runs with the
+        same job name in ``history``; else its walltime) and the waves its tasks
+        need when it gets the whole quota. A forward and a backward pass over
+        the graph give every stage its earliest start, latest finish and slack
+        (aftercorr stages may start one upstream task after their upstream).
+        Then:
+
+        - stages are submitted in dependency order, the longest remaining path
+          first, so critical stages are queued (and age) first;
+        - stages with slack get ``--nice`` proportional to it (nice_per_hour per
+          hour of slack, at most max_nice), critical stages none;
+        - arrays with slack are throttled (``--array=a-b%N``) to the fewest
+          concurrent tasks that still finish within their slack, which leaves
+          the quota to the critical path.
+
+        A ``%N`` already in a script (e.g. a licence or I/O budget, see
+        jobArrays(throttle=...)) caps the tasks the stage runs at once in the
+        duration estimate, and the schedule only ever lowers it.
+
+        Parameters
+        ==========
+        quota_cores : int
+            Cores the campaign may use at once (allocation / QOS limit).
+        history : (str, list)
+            sacct output file (advisor.SACCT_FORMAT) or advisor.readSacct records.
+
+        Returns
+        =======
+        dict
+            {stage: {"order", "task_hours", "source", "duration_h", "start_h",
+            "finish_h", "slack_h", "critical", "nice", "throttle"}} plus
+            "makespan_h" for the whole workflow.
+        """
+
+        if isinstance(history, str):
+            history = advisor.readSacct(history)
+        by_name = {}
+        for record in history or []:
+            if record.get("state") == "COMPLETED" and record.get("elapsed_s"):
+                by_name.setdefault(record["job_name"], []).append(record["elapsed_s"])
+
+        info = {}
+        for name, stage in self.stages.items():
+            options = sbatchOptions(stage["script"])
+            cores = int(options.get("cpus-per-task") or 1) * int(options.get("ntasks") or 1)
+            tasks = 1 if stage["tasks"] is None else stage["tasks"][1] - stage["tasks"][0] + 1
+            hours, source = self._task_hours(name, by_name)
+            concurrent = max(1, min(tasks, quota_cores // cores))
+            if stage["limit"] is not None:
+                concurrent = min(concurrent, stage["limit"])
+            info[name] = {
+                "tasks": tasks,
+                "task_hours": hours,
+                "source": source,
+                "concurrent": concurrent,
+                "duration_h": math.ceil(tasks / concurrent) * hours,
+            }
+
+        # Forward pass (stages were added upstream first)
+        for name, stage in self.stages.items():
+            start = 0.0
+            for kind, upstream in stage["dependencies"]:
+                up = info[upstream]
+                if kind == "aftercorr":
+                    start = max(start, up["start_h"] + up["task_hours"])
+                else:
+                    start = max(start, up["finish_h"])
+            info[name]["start_h"] = start
+            info[name]["finish_h"] = start + info[name]["duration_h"]
+            for kind, upstream in stage["dependencies"]:
+                if kind == "aftercorr":
+                    # task N cannot finish before upstream task N
+                    info[name]["finish_h"] = max(
+                        info[name]["finish_h"], info[upstream]["finish_h"] + info[name]["task_hours"]
+                    )
+        makespan = max(i["finish_h"] for i in info.values())
+
+        # Backward pass: latest finish without delaying the end of the workflow
+        for name in self.stages:
+            info[name]["latest_finish_h"] = makespan
+        for name in reversed(list(self.stages)):
+            i = info[name]
+            latest_start = i["latest_finish_h"] - (i["finish_h"] - i["start_h"])
+            for kind, upstream in self.stages[name]["dependencies"]:
+                up = info[upstream]
+                if kind == "aftercorr":
+                    limit = min(
+                        latest_start + up["duration_h"] - up["task_hours"],
+                        i["latest_finish_h"] - i["task_hours"],
+                    )
+                else:
+                    limit = latest_start
+                up["latest_finish_h"] = min(up["latest_finish_h"], limit)
+
+        # Longest remaining path from each stage, for the submission order
+        remaining = {}
+        for name in reversed(list(self.stages)):
+            downstream = [d for d, s in self.stages.items() if any(u == name for _, u in s["dependencies"])]
+            remaining[name] = info[name]["duration_h"] + max((remaining[d] for d in downstream), default=0.0)
+
+        order = []
+        done = set()
+        while len(order) < len(self.stages):
+            ready = [
+                n for n, s in self.stages.items()
+                if n not in done and all(u in done for _, u in s["dependencies"])
+            ]
+            ready.sort(key=lambda n: -remaining[n])
+            order.append(ready[0])
+            done.add(ready[0])
+
+        plan = {"makespan_h": makespan}
+        for position, name in enumerate(order):
+            i = info[name]
+            slack = max(0.0, i["latest_finish_h"] - i["finish_h"])
+            critical = slack < 1e-9
+            throttle = None
+            if not critical and self.stages[name]["tasks"] is not None:
+                waves = max(1, int((i["latest_finish_h"] - i["start_h"]) / i["task_hours"] + 1e-9))
+                needed = math.ceil(i["tasks"] / waves)
+                if needed < min(i["tasks"], self.stages[name]["limit"] or i["tasks"]):
+                    throttle = needed
+            plan[name] = {
+                "order": position,
+                "task_hours": i["task_hours"],
+                "source": i["source"],
+                "duration_h": i["duration_h"],
+                "start_h": i["start_h"],
+                "finish_h": i["finish_h"],
+                "slack_h": slack,
+                "critical": critical,
+                "nice": 0 if critical else min(max_nice, int(round(slack * nice_per_hour))),
+                "throttle": throttle,
+            }
+        return plan
+
+    def plan(self, schedule=None):
+        """
+        Return the submission plan: one (stage, script, sbatch options) per stage,
+        in submission order (that of ``schedule`` when given, else as added).
+        """
+
+        names = list(self.stages)
+        if schedule is not None:
+            names.sort(key=lambda n: schedule[n]["order"])
+        plan = []
+        for name in names:
+            stage = self.stages[name]
+            options = []
+            if stage["dependencies"]:
+                options.append("--dependency=" + ",".join(
+                    f"{kind}:${{{upstream.upper()}_JOB}}" for kind, upstream in stage["dependencies"]
+                ))
+                options.append("--kill-on-invalid-dep=yes")
+            if schedule is not None:
+                if schedule[name]["nice"]:
+                    options.append(f"--nice={schedule[name]['nice']}")
+                if schedule[name]["throttle"] is not None:
+                    first, last = stage["tasks"]
+                    options.append(f"--array={first}-{last}%{schedule[name]['throttle']}")
+            plan.append((name, stage["script"], options))
+        return plan
+
+    def writeSubmitScript(self, submit_script="workflow_submit.sh", schedule=None):
+        """
+        Write the script submitting every stage, upstream first. Each job id
+        is kept in <STAGE>_JOB; stages whose dependencies can no longer be met
+        are cancelled by Slurm (--kill-on-invalid-dep=yes). With a schedule()
+        result, the stages follow its order, nice values and array throttles.
+        """
+
+        if not self.stages:
+            raise ValueError("The workflow has no stages.")
+        with open(submit_script, "w") as ss:
+            ss.write("#!/bin/bash\n")
+            ss.write("set -e\n")
+            for name, script, options in self.plan(schedule):
+                ss.write(f"{name.upper()}_JOB=$(sbatch {' '.join(['--parsable'] + options)} {script})\n")
+                ss.write(f'echo "{name}: ${{{name.upper()}_JOB}}"\n')
+        return submit_script
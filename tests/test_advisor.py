@@ -0,0 +1,91 @@
+"""Tests for the right-sizing advisor (sacct + telemetry -> jobArrays defaults)."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import advisor, mn5
+
+SACCT = """JobID|JobName|State|Elapsed|Timelimit|AllocCPUS|TotalCPU|MaxRSS|ReqMem
+100_1|chemsh|COMPLETED|02:00:00|2-00:00:00|32|2-00:00:00||256000M
+100_1.batch|batch|COMPLETED|02:00:00||32|2-00:00:00|150G|
+100_2|chemsh|COMPLETED|03:00:00|2-00:00:00|32|3-00:00:00||256000M
+100_2.batch|batch|COMPLETED|03:00:00||32|3-00:00:00|156G|
+100_3|chemsh|FAILED|00:01:00|2-00:00:00|32|00:30.000||256000M
+200_1|q6run|COMPLETED|00:40:00|12:00:00|20|06:40:00||2000Mc
+200_1.batch|batch|COMPLETED|00:40:00||20|06:40:00|1500M|
+200_2|q6run|TIMEOUT|12:00:00|12:00:00|20|1-00:00:00||2000Mc
+"""
+
+
+def test_read_sacct_merges_steps(tmp_path):
+    sacct = tmp_path / "usage.txt"
+    sacct.write_text(SACCT)
+    records = {r["job_id"]: r for r in advisor.readSacct(sacct)}
+    assert records["100_2"]["max_rss_mb"] == pytest.approx(156 * 1024)
+    assert records["100_2"]["cpu_seconds"] == 3 * 86400
+    assert records["200_1"]["req_mem_per_cpu"] is True
+    assert records["200_2"]["state"] == "TIMEOUT"
+
+
+def test_recommendations_from_sacct(tmp_path):
+    sacct = tmp_path / "usage.txt"
+    sacct.write_text(SACCT)
+    advice = advisor.recommendResources(sacct_file=sacct, programs={"chemsh": "chemshell", "q6run": "Q6"})
+    chem = advice["chemshell"]
+    # 24 busy cores x 1.2 headroom -> 29 cpus; 156 GB x 1.2 over 29 cpus -> highmem
+    assert chem["cpus_per_task"] == 29
+    assert chem["mem_per_cpu"] == 6611
+    assert chem["highmem"] is True
+    assert chem["time"] == (3, 45)
+    assert chem["tasks"] == 2
+    q6 = advice["Q6"]
+    assert q6["cpus_per_task"] == 12
+    assert q6["highmem"] is False
+    assert q6["time"] == (18, 0)                       # a timeout pushes walltime to 1.5x the limit
+    assert any("time limit" in n for n in q6["notes"])
+
+
+def test_mps_advice_from_telemetry(tmp_path):
+    rows = "time,cpu_seconds,rss_kb,read_bytes,write_bytes,gpu_util,gpu_mem_mb\n"
+    (tmp_path / "t_1_1.csv").write_text(
+        "# program=openmm cpus=20 gpus=1\n" + rows
+        + "0,0,1024,0,0,20.0,900\n3600,36000,1024000,0,0,20.0,900\n")
+    advice = advisor.recommendResources(telemetry_dir=str(tmp_path))
+    assert advice["openmm"]["mps"] == 4
+    assert advice["openmm"]["cpus_per_task"] == 12
+
+
+def test_advice_feeds_jobarrays_defaults(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    advice = {"Q6": {"cpus_per_task": 12, "mem_per_cpu": 1800, "highmem": False, "time": (2, 15), "mps": None}}
+    advisor.saveAdvice(advice, tmp_path / "advice.json")
+    sp = tmp_path / "run.sh"
+    mn5.jobArrays(jobs=["Qdyn6 relax.inp"], script_name=str(sp), job_name="q", partition="gp_bscls",
+                  program="Q6", advice=str(tmp_path / "advice.json"))
+    text = sp.read_text()
+    assert "#SBATCH --cpus-per-task 12\n" in text
+    assert "#SBATCH --mem-per-cpu 1800\n" in text
+    assert "#SBATCH --time=02:15:00\n" in text
+    # explicit arguments win over the advice
+    mn5.jobArrays(jobs=["Qdyn6 relax.inp"], script_name=str(sp), job_name="q", partition="gp_bscls",
+                  program="Q6", cpus_per_task=4, time=1, advice=advice)
+    text = sp.read_text()
+    assert "#SBATCH --cpus-per-task 4\n" in text
+    assert "#SBATCH --time=01:00:00\n" in text
+
+
+def test_advice_mps_on_gpu_presets(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sp = tmp_path / "run.sh"
+    mn5.jobArrays(jobs=[f"python3 run.py {i}" for i in range(4)], script_name=str(sp), job_name="o",
+                  partition="acc_bscls", gpus=1, program="openmm", advice={"openmm": {"mps": 2}})
+    text = sp.read_text()
+    assert "#SBATCH --array=1-2\n" in text
+    assert text.count("nvidia-cuda-mps-control -d") == 2
+
+
+def test_advisor_needs_input():
+    with pytest.raises(ValueError):
+        advisor.recommendResources()
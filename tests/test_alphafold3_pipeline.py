@@ -0,0 +1,50 @@
+"""Tests for the two-phase AlphaFold3 pipeline (mn5.setUpAlphaFold3Pipeline)."""
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import mn5
+
+
+def test_pipeline_splits_cpu_and_gpu_stages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    inputs = []
+    for i in range(5):
+        path = f"in_{i}.json"
+        (tmp_path / path).write_text(json.dumps({"name": f"Complex {i}!"}))
+        inputs.append(path)
+
+    submit = mn5.setUpAlphaFold3Pipeline(inputs, inference_batch=2, job_name="af3")
+    data = (tmp_path / "af3_data.sh").read_text()
+    gpu = (tmp_path / "af3_inference.sh").read_text()
+    for script in ("af3_data.sh", "af3_inference.sh", submit):
+        subprocess.run(["bash", "-n", script], check=True)
+
+    # CPU stage on GPP, grouped like the GPU batches so aftercorr pairs them
+    assert "#SBATCH --qos=gp_bscls" in data and "--gres" not in data
+    assert "#SBATCH --array=1-3\n" in data
+    assert data.count("--norun_inference") == 5
+    assert "#SBATCH --cpus-per-task 16" in data
+
+    # GPU stage: one AF3 process per batch over a directory of *_data.json
+    assert "#SBATCH --qos=acc_bscls" in gpu and "#SBATCH --array=1-3\n" in gpu
+    assert gpu.count("--input_dir=af3_output/batches/batch_") == 3
+    assert gpu.count("--norun_data_pipeline") == 3
+    assert os.path.abspath("af3_output/data/complex_0/complex_0_data.json") in gpu
+
+    assert "--dependency=aftercorr:${DATA_JOB}" in (tmp_path / submit).read_text()
+
+
+def test_pipeline_module_sets(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "in.json").write_text(json.dumps({"name": "x"}))
+    modules = ["git"]
+    mn5.setUpAlphaFold3Pipeline(["in.json"], job_name="af3", modules=modules)
+    assert modules == ["git"]
+    data = (tmp_path / "af3_data.sh").read_text()
+    gpu = (tmp_path / "af3_inference.sh").read_text()
+    # the GPP data stage does not load the ACC CUDA module; nothing is loaded twice
+    assert "cuda" not in data and "alphafold/3.0.0" in data
+    assert gpu.count("alphafold/3.0.0") == 1 and gpu.count("cuda/12.6") == 1
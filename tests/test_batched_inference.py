@@ -0,0 +1,82 @@
+"""Tests for batched GPU inference and weight staging (mn5.jobArrays(inference_batch=...))."""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import environment, mn5
+
+
+def test_alphafold3_batches_with_staged_weights(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    inputs = [f"in_{i}.json" for i in range(5)]
+    mn5.jobArrays(inputs, script_name="run.sh", job_name="af3", partition="acc_bscls",
+                  program="alphafold3", inference_batch=3, stage_weights=True)
+    text = (tmp_path / "run.sh").read_text()
+    subprocess.run(["bash", "-n", "run.sh"], check=True)
+    assert "#SBATCH --array=1-2\n" in text
+    assert text.count("--input_dir=predictions/batches/batch_") == 2
+    assert "ln -sf " + str(tmp_path / "in_4.json") + " predictions/batches/batch_2/" in text
+    # weights are staged after WEIGHTS is exported
+    assert text.index("export WEIGHTS=") < text.index("stage_weights WEIGHTS\n")
+
+
+def test_multi_input_forms(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    jobs = mn5.batchedInferenceJobs("ligandmpnn", ["a.pdb", "b.pdb", "c.pdb"], 2, "out",
+                                    flags={"model_type": "ligand_mpnn"})
+    assert jobs[0].startswith("python run.py --pdb_path_multi out/batches/batch_1.json --out_folder out")
+    assert json.load(open("out/batches/batch_1.json")) == {
+        str(tmp_path / "a.pdb"): "", str(tmp_path / "b.pdb"): ""}
+
+    jobs = mn5.batchedInferenceJobs("bioemu", ["MKTAYIAK", "msa/x.a3m"], 2, "out", flags={"num_samples": 10})
+    code = jobs[0].split("\n", 1)[1].rsplit("BIOEMU_BATCH", 1)[0]
+    compile(code, "bioemu_batch", "exec")
+    assert "('msa/x.a3m', 'out/x')" in code and "num_samples=10" in code
+
+    with pytest.raises(ValueError):
+        mn5.batchedInferenceJobs("RFDiffusion", ["a"], 2)
+
+
+def test_weights_copied_once_per_node(tmp_path):
+    weights = tmp_path / "weights"
+    weights.mkdir()
+    (weights / "model.bin").write_text("w")
+    script = tmp_path / "stage.sh"
+    script.write_text(environment.stagedWeightsBlock(["WEIGHTS", "UNSET_WEIGHTS"], str(tmp_path / "local"))
+                      + 'echo "$WEIGHTS"\n')
+    env = dict(os.environ, WEIGHTS=str(weights))
+    first = subprocess.run(["bash", str(script)], env=env, capture_output=True, text=True, check=True)
+    (weights / "model.bin").write_text("changed in place")  # same dir mtime: copy is reused
+    second = subprocess.run(["bash", str(script)], env=env, capture_output=True, text=True, check=True)
+    staged = first.stdout.strip()
+    assert staged == second.stdout.strip()
+    assert staged.startswith(str(tmp_path / "local" / "bsc_weights"))
+    assert open(os.path.join(staged, "model.bin")).read() == "w"
+
+
+def test_hub_cache_follows_staged_hf_home(tmp_path):
+    hf_home = tmp_path / "hf"
+    (hf_home / "hub").mkdir(parents=True)
+    script = tmp_path / "stage.sh"
+    script.write_text(environment.stagedWeightsBlock(["HF_HOME"], str(tmp_path / "local"))
+                      + 'echo "${HF_HUB_CACHE-unset}"\n')
+    env = {k: v for k, v in os.environ.items() if k not in ("HF_HOME", "HF_HUB_CACHE")}
+    unset = subprocess.run(["bash", str(script)], env=env, capture_output=True, text=True, check=True)
+    assert unset.stdout.strip() == "unset"
+    staged = subprocess.run(["bash", str(script)], env=dict(env, HF_HOME=str(hf_home)),
+                            capture_output=True, text=True, check=True)
+    assert staged.stdout.strip().startswith(str(tmp_path / "local" / "bsc_weights"))
+    assert staged.stdout.strip().endswith("/hub")
+
+
+def test_boltz2_staging_keeps_caller_exports(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    exports = ["FOO=1"]
+    mn5.jobArrays(["a.yaml"], script_name="run.sh", job_name="b", partition="acc_bscls", time=1,
+                  program="boltz2", inference_batch=1, stage_weights=True, exports=exports)
+    assert exports == ["FOO=1"]
+    assert "export BOLTZ_CACHE=${BOLTZ_CACHE:-$HOME/.boltz}" in (tmp_path / "run.sh").read_text()
@@ -0,0 +1,45 @@
+"""Smoke test for the generation benchmark harness (benchmarks/bench_generation.py)."""
+import importlib.util
+import os
+
+_BENCH = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "bench_generation.py")
+_spec = importlib.util.spec_from_file_location("bench_generation", _BENCH)
+bench_generation = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(bench_generation)
+
+
+def test_every_target_runs_at_small_size():
+    results = bench_generation.runBenchmarks(sizes=[5], repeat=1, verbose=False)
+    assert set(results) == {f"{t}@5" for t in bench_generation.TARGETS}
+    for r in results.values():
+        assert r["seconds"] >= 0
+        assert r["output_bytes"] > 0
+        assert r["peak_bytes"] is not None
+
+
+def test_compare_flags_regressions():
+    baseline = {"mn5.jobArrays@10": {"seconds": 1.0, "peak_bytes": 100, "output_bytes": 50}}
+    same = {"mn5.jobArrays@10": {"seconds": 1.1, "peak_bytes": 100, "output_bytes": 50}}
+    slower = {"mn5.jobArrays@10": {"seconds": 2.0, "peak_bytes": 100, "output_bytes": 51}}
+    assert bench_generation.compareResults(same, baseline) == []
+    assert len(bench_generation.compareResults(slower, baseline)) == 2
+
+
+def test_query_batching_benchmark_runs():
+    path = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "bench_query_batching.py")
+    spec = importlib.util.spec_from_file_location("bench_query_batching", path)
+    bench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+    results = bench.compareLayouts(bench.syntheticQueries(200), 4, verbose=False)
+    assert results["batched"]["tasks"] == 4
+    assert results["batched"]["core_hours"] < results["one_per_task"]["core_hours"]
+
+
+def test_job_payload_benchmark_runs():
+    path = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "bench_job_payload.py")
+    spec = importlib.util.spec_from_file_location("bench_job_payload", path)
+    bench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+    results = bench.compareFormats(20, jobs_per_frame=4, sample_tasks=2, verbose=False)
+    assert set(results) == {"inline", "payload", "dispatcher"}
+    assert all(r["bytes"] > 0 and r["task_startup_s"] > 0 for r in results.values())
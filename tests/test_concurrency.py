@@ -0,0 +1,55 @@
+"""Tests for bounded concurrent execution of grouped jobs (jobArrays(concurrency=...))."""
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import marenostrum, mn5, nord4
+
+GENERATORS = {
+    "mn5": lambda jobs, **kw: mn5.jobArrays(jobs, partition="gp_bscls", time=1, **kw),
+    "nord4": lambda jobs, **kw: nord4.jobArrays(jobs, **kw),
+    "marenostrum": lambda jobs, **kw: marenostrum.jobArrays(jobs, **kw),
+}
+
+
+@pytest.mark.parametrize("cluster", sorted(GENERATORS))
+def test_grouped_jobs_run_concurrently(tmp_path, monkeypatch, cluster):
+    monkeypatch.chdir(tmp_path)
+    jobs = [f"mkdir -p d{i} && cd d{i} && sleep 1 && touch done\n" for i in range(4)]
+    jobs[2] = "sleep 1; exit 3\n"
+    GENERATORS[cluster](jobs, script_name="run.sh", job_name="t", group_jobs_by=4, concurrency=4)
+    subprocess.run(["bash", "-n", "run.sh"], check=True)
+
+    start = time.time()
+    result = subprocess.run(["bash", "run.sh"], capture_output=True, text=True,
+                            env=dict(os.environ, SLURM_ARRAY_TASK_ID="1", SLURM_ARRAY_JOB_ID="9"))
+    assert time.time() - start < 3
+    assert all((tmp_path / f"d{i}" / "done").exists() for i in (0, 1, 3))
+    codes = dict(line.split() for line in (tmp_path / "t_1_9.exitcodes").read_text().splitlines())
+    assert codes == {"1": "0", "2": "0", "3": "3", "4": "0"}
+    assert "1 command(s) failed" in result.stderr
+    assert result.returncode != 0
+
+
+def test_failed_bundle_fails_its_task(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    mn5.jobArrays(["false", "true", "true", "true"], script_name="run.sh", job_name="t",
+                  partition="gp_bscls", time=1, group_jobs_by=2, concurrency=2)
+    codes = []
+    for task in ("1", "2"):
+        env = dict(os.environ, SLURM_ARRAY_TASK_ID=task, SLURM_ARRAY_JOB_ID="9")
+        codes.append(subprocess.run(["bash", "run.sh"], capture_output=True, env=env).returncode)
+    assert codes[0] != 0 and codes[1] == 0
+
+
+def test_concurrency_needs_group_jobs_by(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError):
+        nord4.jobArrays(["a"], script_name="run.sh", job_name="t", concurrency=2)
+    with pytest.raises(ValueError):
+        mn5.jobArrays(["a"], script_name="run.sh", job_name="t", partition="gp_bscls",
+                      time=1, group_jobs_by=2, concurrency=0)
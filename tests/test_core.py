@@ -0,0 +1,131 @@
+"""Tests for the shared generation engine and cluster profiles (core)."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import amd, core, cte_power, marenostrum, minotauro, mn5, nord3, nord4
+
+
+def test_helpers():
+    assert core.groupJobs(["a\n", "b", "c\n"], 2) == ["a\nb\n", "c\n"]
+    with pytest.raises(ValueError):
+        core.groupJobs(["a"], 1.5)
+    assert core.clampTime("mn5", "acc_debug", (3, 10)) == (2, 0)
+    assert core.clampTime("nord4", "bsc_ls", None) == (48, 0)
+    assert core.clampTime("nord3", "debug", 1) == (1, 0)
+    assert core.clampTime("mn5", "gp_bscls", (1, 90)) == (2, 30)
+    with pytest.raises(ValueError):
+        core.clampTime("mn5", "gp_bscls", "2h")
+    assert core.clampHours("minotauro", "debug", 30) == 1
+    assert core.arrayTasks(["x", "y\n"]) == (
+        "if [[ $SLURM_ARRAY_TASK_ID = 1 ]]; then\nx\nfi\n\n"
+        "if [[ $SLURM_ARRAY_TASK_ID = 2 ]]; then\ny\nfi\n\n"
+    )
+    templates = ["-n {cpus}", "-c {threads}", "--gres gpu:{gpus}", ("--mail-type=END", "mail")]
+    assert core.directives(templates, cpus=4, threads=None) == "#SBATCH -n 4\n"
+    # 0 is a value: only None, False and "" leave a line out
+    assert core.directives(templates, cpus=4, gpus=0, mail="") == "#SBATCH -n 4\n#SBATCH --gres gpu:0\n"
+    assert core.directives(templates, mail="me@bsc.es") == "#SBATCH --mail-type=END\n"
+    assert core.arraySpec(1, 10) == "1-10" and core.arraySpec(3, 12, {"licenses": 8}, {"licenses": 4}) == "3-12%2"
+    assert core.groupJobs(["a", "b", "c"], 2, concurrency=2)[1].startswith("BUNDLE_PIDS=()\nbundle_slot\n{ (\nc\n")
+    with pytest.raises(ValueError):
+        core.groupJobs(["a"], None, concurrency=2)
+
+
+def test_table_driven_clusters(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # minotauro's grouping used to fail on an undefined name
+    minotauro.jobArrays(["echo 1", "echo 2", "echo 3"], script_name="m.sh", job_name="m",
+                        group_jobs_by=2, program="alphafold", mail="me@bsc.es")
+    text = (tmp_path / "m.sh").read_text()
+    assert "#SBATCH --array=1-2\n" in text and "#SBATCH --cpus-per-task=16\n" in text
+    assert "#SBATCH --constraint=k80\n#SBATCH --output=m_%a_%A.out\n" in text
+    assert "#SBATCH --mail-type=END,FAIL\n" in text and "module purge\n" in text
+    assert "echo 1\necho 2\nfi\n" in text
+
+    modules = ["gcc"]
+    cte_power.jobArrays(["echo 1\n"], script_name="c.sh", job_name="c", program="gromacs",
+                        modules=modules, partition="debug", time=10)
+    text = (tmp_path / "c.sh").read_text()
+    assert "#SBATCH --time=2:00:00\n" in text and "module load cuda/10.2\n" in text
+    assert modules == ["gcc"]
+
+    minotauro.jobArrays(["echo 1"], script_name="g.sh", job_name="g", gpus=0)
+    assert "#SBATCH --gres gpu:0\n" in (tmp_path / "g.sh").read_text()
+
+    amd.jobArrays(["echo 1\n"], script_name="a.sh", job_name="a", program=None, cpus=8)
+    text = (tmp_path / "a.sh").read_text()
+    assert "#SBATCH -n 8\n" in text and "schrodinger" not in text
+    for script in ("m.sh", "c.sh", "a.sh"):
+        subprocess.run(["bash", "-n", script], check=True)
+
+
+def test_shared_features_on_every_cluster(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "scripts").mkdir()
+    jobs = ["echo one\n", "echo two\n", "echo three\n"]
+
+    def task(script, n):
+        env = dict(os.environ, SLURM_ARRAY_TASK_ID=str(n), SLURM_ARRAY_JOB_ID="7")
+        done = subprocess.run(["bash", script], env=env, capture_output=True, text=True)
+        return done.returncode, done.stdout
+
+    nord4.jobArrays(jobs, script_name="scripts/n4.sh", job_name="n4", job_payload=True, throttle=2)
+    assert "#SBATCH --array=1-3%2\n" in (tmp_path / "scripts/n4.sh").read_text()
+    assert (tmp_path / "scripts/n4_jobs.gz").exists()
+    assert task("scripts/n4.sh", 2) == (0, "two\n")
+
+    nord3.jobArrays(["echo {name}\n"], script_name="n3.sh", job_name="n3",
+                    parameter_table={"name": ["a", "b", "c"]}, jobs_range=(2, 3))
+    assert "#SBATCH --array=2-3\n" in (tmp_path / "n3.sh").read_text()
+    assert task("n3.sh", 3) == (0, "c\n")
+
+    nord3.jobArrays(jobs, script_name="g3.sh", job_name="g3", group_jobs_by=2, concurrency=2)
+    assert "#SBATCH --array=1-2\n" in (tmp_path / "g3.sh").read_text()
+    assert task("g3.sh", 1) == (0, "one\ntwo\n")
+
+    marenostrum.jobArrays(jobs, script_name="mn.sh", job_name="mn", telemetry=5)
+    cte_power.jobArrays(jobs, script_name="cp.sh", job_name="cp", telemetry=True, job_payload="gzip")
+    for script in ("mn.sh", "cp.sh"):
+        assert "telemetry" in (tmp_path / script).read_text()
+        subprocess.run(["bash", "-n", script], check=True)
+    assert (tmp_path / "cp_jobs.gz").exists()
+    with pytest.raises(ValueError):
+        minotauro.jobArrays(jobs, job_name="x", job_steps=2)
+
+    # The presets extend copies of the caller's lists
+    modules, exports = ["gcc"], ["A=1"]
+    nord4.jobArrays(jobs, script_name="o.sh", job_name="o", program="orca", modules=modules, exports=exports)
+    mn5.jobArrays(jobs, script_name="b.sh", job_name="b", partition="gp_debug", program="hmmer",
+                  modules=modules, exports=exports)
+    nord3.jobArrays(jobs, script_name="p.sh", job_name="p", program="pml", modules=modules)
+    assert modules == ["gcc"] and exports == ["A=1"]
+
+
+def test_job_batch(tmp_path, monkeypatch):
+    jobs = [f"cd /gpfs/scratch/run/sys_{i}/ && python run.py SCRIPT_PATH {i}\n" for i in range(6)]
+    jobs.append("echo no prefix\n")
+    batch = core.JobBatch(iter(jobs))
+    assert len(batch) == 7 and list(batch) == jobs and batch[-1] == jobs[-1]
+    assert batch._prefixes == ["cd /gpfs/scratch/run/", ""]
+    view = batch[2:4]
+    assert view._prefixes is batch._prefixes and list(view) == jobs[2:4]
+
+    replaced = [j.replace("SCRIPT_PATH", "/opt/s") for j in jobs]
+    rewritten = core.replaceInJobs(batch, "SCRIPT_PATH", "/opt/s")
+    assert rewritten is not batch and rewritten._bodies is batch._bodies
+    assert list(rewritten) == replaced and list(batch) == jobs and list(view) == jobs[2:4]
+    assert list(rewritten.rewrite(str.upper))[0] == replaced[0].upper() and list(rewritten) == replaced
+    assert core.replaceInJobs(jobs, "SCRIPT_PATH", "/opt/s") == replaced
+    assert "SCRIPT_PATH" in jobs[0]
+    assert core.groupJobs(rewritten, 4) == core.groupJobs(replaced, 4)
+
+    monkeypatch.chdir(tmp_path)
+    minotauro.jobArrays(replaced, script_name="list.sh", job_name="m")
+    minotauro.jobArrays(rewritten, script_name="batch.sh", job_name="m")
+    assert (tmp_path / "list.sh").read_text() == (tmp_path / "batch.sh").read_text()
+    mn5.jobArrays(batch, script_name="rfd.sh", job_name="r", partition="acc_bscls", program="RFDiffusion")
+    assert list(batch) == jobs
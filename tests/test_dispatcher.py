@@ -0,0 +1,59 @@
+"""Tests for the Python task dispatcher (mn5.jobArrays(dispatcher=...))."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import dispatcher, mn5, tables
+
+
+def _run_task(task, **env):
+    subprocess.run(["bash", "run.sh"], check=True, env=dict(os.environ, SLURM_ARRAY_TASK_ID=str(task), **env))
+
+
+def test_dispatched_tasks(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "setup.sh").write_text('export TOOL_HOME=/opt/tool\ngreet() { echo "hi $1"; }\n')
+    jobs = [f'greet {i} > out_{i}; echo "$TOOL_HOME $LABEL" >> out_{i}\n' for i in range(5)]
+    mn5.jobArrays(jobs, script_name="run.sh", job_name="t", partition="gp_bscls", time=1,
+                  sources=[str(tmp_path / "setup.sh")], exports=["LABEL=x"], env_snapshot=True,
+                  env_snapshot_dir=str(tmp_path / "snapshots"), dispatcher=sys.executable)
+    script = (tmp_path / "run.sh").read_text()
+    assert script.count("\n") < 15 and "greet" not in script
+    assert "export LABEL=x" in (tmp_path / "t_prelude.sh").read_text()
+    subprocess.run(["bash", "-n", "run.sh"], check=True)
+
+    for task in (1, 5, 3):
+        _run_task(task)
+        assert (tmp_path / f"out_{task - 1}").read_text() == f"hi {task - 1}\n/opt/tool x\n"
+    modes = [line.split("\t")[3] for line in (tmp_path / "t_dispatch.tsv").read_text().splitlines()]
+    assert modes == ["setup", "snapshot", "snapshot"]
+    assert len(os.listdir(tmp_path / "snapshots")) == 1
+
+
+def test_exit_code_and_exclusions(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert dispatcher.INDEX_WIDTH == tables.INDEX_WIDTH
+    mn5.jobArrays(["exit 3\n"], script_name="run.sh", job_name="t", partition="gp_bscls", time=1,
+                  dispatcher=sys.executable)
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        _run_task(1)
+    assert error.value.returncode == 3
+    with pytest.raises(ValueError):
+        mn5.jobArrays(["a", "b"], script_name="run.sh", job_name="t", partition="gp_bscls", time=1,
+                      group_jobs_by=2, concurrency=2, dispatcher=True)
+
+
+def test_dispatcher_files_next_to_script(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "scripts").mkdir()
+    mn5.jobArrays(["echo $LABEL > out\n"], script_name="scripts/run.sh", job_name="t", partition="gp_bscls",
+                  time=1, modules=["gcc"], exports=["LABEL=x"], dispatcher=sys.executable)
+    for name in ("t_jobs.gz", "t_dispatch.py", "t_env.sh", "t_prelude.sh"):
+        assert (tmp_path / "scripts" / name).exists() and not (tmp_path / name).exists()
+    (tmp_path / "scripts" / "t_env.sh").write_text("")
+    subprocess.run(["bash", "scripts/run.sh"], check=True, env=dict(os.environ, SLURM_ARRAY_TASK_ID="1"))
+    assert (tmp_path / "out").read_text() == "x\n"
+    assert (tmp_path / "scripts" / "t_dispatch.tsv").exists()
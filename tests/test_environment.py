@@ -0,0 +1,90 @@
+"""Tests for the environment snapshot cache and packed conda envs (mn5.jobArrays)."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import environment, mn5
+
+
+def test_snapshot_off_by_default_keeps_setup(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    mn5.jobArrays(jobs=["a"], script_name="run.sh", job_name="t", partition="gp_bscls",
+                  time=1, modules=["gcc"], conda_env="/envs/x")
+    text = (tmp_path / "run.sh").read_text()
+    assert "ENV_SNAPSHOT" not in text
+    assert "module load gcc\n\nsource activate /envs/x\n\n" in text
+
+
+def test_snapshot_key_tracks_setup():
+    a = environment.snapshotKey("module load gcc\n", "q6", "gp_bscls")
+    assert a == environment.snapshotKey("module load gcc\n", "q6", "gp_debug")
+    assert a != environment.snapshotKey("module load gcc/13\n", "q6", "gp_bscls")
+    assert a != environment.snapshotKey("module load gcc\n", "q6", "acc_bscls")
+    assert a.startswith("q6_gpp_") and a.endswith(".env")
+
+
+def test_snapshot_runs_setup_once(tmp_path, monkeypatch):
+    """The setup runs in the first task only; later tasks get the same environment."""
+    monkeypatch.chdir(tmp_path)
+    setup = tmp_path / "setup.sh"
+    setup.write_text(
+        f"echo ran >> {tmp_path}/setup_runs\n"
+        "export TOOL_HOME='/opt/tool dir'\n"
+        "export PATH=/opt/tool/bin:$PATH\n"
+        "unset DROP_ME\n"
+        "tool_run() { echo \"tool $1\"; }\n"
+    )
+    mn5.jobArrays(jobs=['echo "$TOOL_HOME|${DROP_ME-unset}|${PATH%%:*}|$(tool_run x)" > out_1',
+                        'echo "$TOOL_HOME|${DROP_ME-unset}|${PATH%%:*}|$(tool_run x)" > out_2'],
+                  script_name="run.sh", job_name="t", partition="gp_bscls", time=1,
+                  sources=[str(setup)], env_snapshot=True, env_snapshot_dir=str(tmp_path / "snap"))
+    subprocess.run(["bash", "-n", "run.sh"], check=True)
+
+    env = dict(os.environ, DROP_ME="1", SLURM_ARRAY_TASK_ID="1")
+    subprocess.run(["bash", "run.sh"], check=True, env=env)
+    env["SLURM_ARRAY_TASK_ID"] = "2"
+    subprocess.run(["bash", "run.sh"], check=True, env=env)
+
+    assert (tmp_path / "setup_runs").read_text() == "ran\n"
+    expected = "/opt/tool dir|unset|/opt/tool/bin|tool x\n"
+    assert (tmp_path / "out_1").read_text() == expected
+    assert (tmp_path / "out_2").read_text() == expected
+    snapshot = os.listdir(tmp_path / "snap")
+    assert len(snapshot) == 1
+    assert "SLURM_ARRAY_TASK_ID" not in (tmp_path / "snap" / snapshot[0]).read_text()
+
+
+def test_packed_env_extracted_once(tmp_path, monkeypatch):
+    """A packed env is extracted (and conda-unpack run) once, then reused."""
+    monkeypatch.chdir(tmp_path)
+    env = tmp_path / "envs" / "tool"
+    (env / "bin").mkdir(parents=True)
+    (env / "bin" / "activate").write_text('export PATH="$(dirname "${BASH_SOURCE[0]}"):$PATH"\n')
+    (env / "bin" / "deactivate").write_text("true\n")
+    (env / "bin" / "conda-unpack").write_text(f"#!/bin/bash\necho unpacked >> {tmp_path}/unpacks\n")
+    (env / "bin" / "conda-unpack").chmod(0o755)
+    subprocess.run(["tar", "-czf", str(tmp_path / "envs" / "tool.tar.gz"), "-C", str(env), "."], check=True)
+
+    mn5.jobArrays(jobs=["command -v conda-unpack > out_1", "command -v conda-unpack > out_2"],
+                  script_name="run.sh", job_name="t", partition="gp_bscls", time=1,
+                  conda_env=str(env), conda_pack=True, conda_pack_dir=str(tmp_path / "local"))
+    text = (tmp_path / "run.sh").read_text()
+    assert "source activate" not in text.split("else")[0]
+    subprocess.run(["bash", "-n", "run.sh"], check=True)
+
+    for task in ("1", "2"):
+        subprocess.run(["bash", "run.sh"], check=True, env=dict(os.environ, SLURM_ARRAY_TASK_ID=task))
+    assert (tmp_path / "unpacks").read_text() == "unpacked\n"
+    for out in ("out_1", "out_2"):
+        assert (tmp_path / out).read_text().startswith(str(tmp_path / "local" / "bsc_envs" / "tool_"))
+
+
+def test_pack_command_and_archive():
+    assert environment.packedArchive("/envs/tool/") == "/envs/tool.tar.gz"
+    assert environment.packedArchive("name", "/a/b.squashfs") == "/a/b.squashfs"
+    assert "mksquashfs" in environment.packCommand("/envs/tool", "/a/tool.squashfs")
+    with pytest.raises(ValueError):
+        environment.packedArchive("RFDiffusion")
@@ -0,0 +1,109 @@
+"""Tests for the GROMACS mdrun decomposition planner (gromacs, mn5 program="gromacs")."""
+import os
+import struct
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import gromacs, mn5
+
+
+def _xdr_string(text):
+    data = text.encode()
+    return struct.pack(">ii", len(data) + 1, len(data)) + data + b"\0" * (-len(data) % 4)
+
+
+def _write_gro(path, natoms, box):
+    lines = ["test", str(natoms)]
+    lines += [f"{1:5d}SOL     OW{i % 99999:5d}   0.000   0.000   0.000" for i in range(natoms)]
+    lines.append(" ".join(f"{b:.5f}" for b in box))
+    path.write_text("\n".join(lines) + "\n")
+
+
+def test_system_size_from_gro_pdb_and_tpr(tmp_path):
+    _write_gro(tmp_path / "conf.gro", 3, (5.0, 6.0, 7.0))
+    assert gromacs.readSystemSize(str(tmp_path / "conf.gro")) == (3, [5.0, 6.0, 7.0])
+
+    (tmp_path / "conf.pdb").write_text("CRYST1   50.000   60.000   70.000  90.00  90.00  90.00\n"
+                                       "ATOM      1  N   ALA A   1\nHETATM    2  O   HOH W   2\n")
+    assert gromacs.readSystemSize(str(tmp_path / "conf.pdb")) == (2, [5.0, 6.0, 7.0])
+
+    body = struct.pack(">9f", 8, 0, 0, 0, 9, 0, 0, 0, 10) + b"\0" * 12
+    header = (_xdr_string("VERSION 2023.3") + struct.pack(">iii", 4, 129, 28) + _xdr_string("release")
+              + struct.pack(">iiif6i", 123456, 2, 0, 0.0, 1, 1, 1, 0, 0, 1) + struct.pack(">q", len(body)))
+    (tmp_path / "topol.tpr").write_bytes(header + body)
+    assert gromacs.readSystemSize(str(tmp_path / "topol.tpr")) == (123456, [8.0, 9.0, 10.0])
+
+    (tmp_path / "bad.tpr").write_bytes(b"\0" * 16)
+    with pytest.raises(ValueError):
+        gromacs.readSystemSize(str(tmp_path / "bad.tpr"))
+
+
+def test_plans_follow_system_size():
+    large = gromacs.planMdrun(400000, [15.0, 15.0, 15.0], gpus=4, cores=80)[0]
+    assert (large["ranks"], large["npme"], large["ntomp"], large["gpu_ids"]) == (4, 1, 20, [0, 1, 2, 3])
+
+    small = gromacs.planMdrun(30000, [6.0, 6.0, 6.0], gpus=4, cores=80)[0]
+    assert (small["ranks"], small["npme"], small["gpu_ids"]) == (1, 0, [0]) and small["warnings"]
+
+    packed = gromacs.planMdrun(30000, None, gpus=1, cores=20, simulations=4)
+    assert [p["pinoffset"] for p in packed] == [0, 5, 10, 15]
+    assert all(p["gpu_ids"] == [0] and p["ntomp"] == 5 for p in packed)
+
+    # CPU: the 4.2 nm box has 27 cells, so 112 cores run 28 ranks (7 PME) x 4 threads.
+    cpu = gromacs.planMdrun(60000, [4.2, 4.2, 4.2], cores=112)[0]
+    assert (cpu["ranks"], cpu["npme"], cpu["ntomp"], cpu["gpu_ids"]) == (28, 7, 4, None)
+
+    # Unknown size: few ranks, many threads, and a warning instead of 112 ranks.
+    unknown = gromacs.planMdrun(cores=112)[0]
+    assert (unknown["ranks"], unknown["npme"], unknown["ntomp"]) == (4, 0, 28) and unknown["warnings"]
+    assert gromacs.planMdrun(cores=8, simulations=8)[0]["warnings"] == []
+
+
+def test_mdrun_commands_rewritten(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_gro(tmp_path / "conf.gro", 20000, (6.0, 6.0, 6.0))
+    jobs = [f"cd r{i}; $GMXBIN mdrun -deffnm prod -nb gpu\n" for i in range(4)]
+    mn5.jobArrays(jobs, script_name="run.sh", job_name="md", partition="acc_bscls", gpus=4,
+                  program="gromacs", group_jobs_by=4, concurrency=4, gromacs_structures="conf.gro")
+    subprocess.run(["bash", "-n", "run.sh"], check=True)
+    text = (tmp_path / "run.sh").read_text()
+    for i in range(4):
+        assert (f"cd r{i}; mpirun -np 1 --oversubscribe --bind-to none -report-bindings gmx_mpi mdrun "
+                f"-ntomp 20 -pme gpu -bonded gpu -gpu_id {i} -pin on -pinoffset {20 * i} -pinstride 1"
+                " -deffnm prod -nb gpu") in text
+
+    assert gromacs.mdrunCommand("gmx mdrun -v", gromacs.planMdrun(gpus=1, cores=8)[0]).startswith(
+        "gmx mdrun -ntmpi 1 -ntomp 8 -nb gpu")
+
+
+def test_replicas_grouped_into_multidir_ensembles(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_gro(tmp_path / "conf.gro", 30000, (7.0, 7.0, 7.0))
+    replicas = []
+    for i in range(6):
+        (tmp_path / f"rep{i}.tpr").write_bytes(b"")
+        replicas.append(f"rep{i}.tpr")
+    mn5.jobArrays(replicas, script_name="run.sh", job_name="ens", partition="acc_bscls", gpus=4,
+                  program="gromacs", gromacs_multidir=True, gromacs_structures="conf.gro",
+                  gromacs_mdrun_args="-deffnm prod -maxh 47")
+    subprocess.run(["bash", "-n", "run.sh"], check=True)
+    text = (tmp_path / "run.sh").read_text()
+    assert "#SBATCH --array=1-2\n" in text
+    assert ("mpirun -np 4 --oversubscribe --bind-to none -report-bindings gmx_mpi mdrun -multidir "
+            "replicas/rep0 replicas/rep1 replicas/rep2 replicas/rep3 -deffnm prod -maxh 47 -ntomp 20 "
+            "-nb gpu -pme gpu -bonded gpu -gpu_id 0,1,2,3 -pin on\n") in text
+    assert "-multidir replicas/rep4 replicas/rep5 -deffnm prod -maxh 47 -ntomp 40" in text
+    assert os.readlink("replicas/rep5/prod.tpr") == str(tmp_path / "rep5.tpr")
+
+    # the collection lines copy the log and record ns/day
+    (tmp_path / "replicas" / "rep0" / "prod.log").write_text("Performance:      123.4      0.2\n")
+    collect = [l for l in text.splitlines() if l.startswith("cp -f replicas/rep0/")][0]
+    subprocess.run(["bash", "-c", "mkdir -p replica_logs; " + collect], check=True)
+    assert (tmp_path / "replica_logs" / "performance.tsv").read_text() == "replicas_rep0\t123.4\n"
+
+    with pytest.raises(ValueError):
+        mn5.jobArrays(replicas, script_name="run.sh", job_name="ens", partition="acc_bscls",
+                      program="gromacs", gromacs_multidir=2, group_jobs_by=2)
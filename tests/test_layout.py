@@ -0,0 +1,137 @@
+"""Tests for the NUMA-aware packed layout generator (bsc_calculations.layout)."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import layout, mn5
+
+
+def test_gpp_jobs_stay_inside_one_numa_domain():
+    """8 jobs on a 112-core GPP node: 14 cores each, 4 per socket, none straddling."""
+    slots = layout.packedLayout("mn5_gpp", jobs_per_node=8)
+    assert [s["numa"] for s in slots] == [0, 1, 0, 1, 0, 1, 0, 1]
+    assert slots[0]["cpu_list"] == "0-13"
+    assert slots[1]["cpu_list"] == "56-69"
+    for s in slots:
+        assert len({c // 56 for c in s["cpus"]}) == 1
+    used = [c for s in slots for c in s["cpus"]]
+    assert len(used) == len(set(used)) == 112
+
+
+def test_acc_gpus_come_from_the_local_domain():
+    slots = layout.packedLayout("mn5_acc", jobs_per_node=4)
+    assert [s["cuda_visible_devices"] for s in slots] == ["0", "2", "1", "3"]
+    for s in slots:
+        gpu = int(s["cuda_visible_devices"])
+        assert layout.NODE_SHAPES["mn5_acc"]["gpu_numa"][gpu] == s["numa"]
+    assert layout.bindingExports(slots[1]) == [
+        "OMP_NUM_THREADS=20", "OMP_PLACES={40}:20:1", "OMP_PROC_BIND=close", "CUDA_VISIBLE_DEVICES=2",
+    ]
+
+
+def test_multi_rank_masks():
+    """2 jobs x 4 ranks x 7 threads on nord4: one cpu-bind mask per rank."""
+    slot = layout.packedLayout("nord4", jobs_per_node=2, ranks_per_job=4, threads_per_rank=7)[0]
+    assert slot["ranks"][0] == list(range(0, 7))
+    assert slot["cpu_bind"].startswith("mask_cpu:0x7f,0x3f80,")
+    assert len(slot["omp_places"]) == 4
+
+
+def test_oversubscription_is_rejected():
+    with pytest.raises(ValueError):
+        layout.packedLayout("mn5_gpp", jobs_per_node=4, ranks_per_job=8, threads_per_rank=4)
+    with pytest.raises(ValueError):
+        layout.packedLayout("mn5_gpp", jobs_per_node=0)
+    with pytest.raises(ValueError):
+        layout.packedLayout("unknown", jobs_per_node=1)
+
+
+def test_mps_cpu_bind(tmp_path, monkeypatch):
+    """cpu_bind=True pins every MPS-packed process subshell to its own core slice."""
+    monkeypatch.chdir(tmp_path)
+    sp = tmp_path / "run.sh"
+    mn5.jobArrays(jobs=[f"cd w{i} && python3 run.py" for i in range(4)], script_name=str(sp),
+                  job_name="mps", partition="acc_bscls", gpus=1, time=1, mps=4, cpu_bind=True)
+    text = sp.read_text()
+    assert text.count("ALLOC_CPUS=()") == 1
+    for k in range(4):
+        assert f'taskset -pc "$(slot_cpus {k} ' in text
+    assert "export OMP_PLACES=cores OMP_PROC_BIND=close" in text
+    subprocess.run(["bash", "-n", str(sp)], check=True)
+    with pytest.raises(ValueError):
+        mn5.jobArrays(jobs=["a"], script_name=str(sp), job_name="j", partition="acc_bscls",
+                      gpus=1, time=1, cpu_bind=True)
+
+
+def test_slot_cpus_slices_the_affinity_list():
+    script = layout.allocationCpusBlock() + 'ALLOC_CPUS=(4 5 6 7 12 13 14 15)\nslot_cpus 1 4\n'
+    out = subprocess.run(["bash", "-c", script], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "12,13,14,15"
+
+
+def _fake_slurm(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "scontrol").write_text("#!/bin/bash\nprintf 'node1\\nnode2\\n'\n")
+    (bin_dir / "srun").write_text(
+        "#!/bin/bash\n"
+        'for a; do case $a in --nodelist=*|--cpu-bind=*) echo "$a";; --*) ;; *) break;; esac; done\n'
+        'echo "OMP_PLACES=$OMP_PLACES CUDA=${CUDA_VISIBLE_DEVICES:-none}"\n'
+        "while [[ $1 == --* ]]; do shift; done\n"
+        'exec "$@"\n'
+    )
+    for tool in ("scontrol", "srun"):
+        (bin_dir / tool).chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("SLURM_JOB_ID", "7")
+
+
+def test_job_steps_bound_to_node_slots(tmp_path, monkeypatch):
+    """job_steps + cpu_bind on 2 GPP nodes: 4 slots of 28 cores per node, one mask per rank."""
+    monkeypatch.chdir(tmp_path)
+    _fake_slurm(tmp_path, monkeypatch)
+    sp = tmp_path / "run.sh"
+    jobs = [f"sleep 0.3; SRUN_STEP echo step{i}" for i in range(10)]
+    mn5.jobArrays(jobs=jobs, script_name=str(sp), job_name="bound", partition="gp_bscls", ntasks=8,
+                  nodes=2, cpus_per_task=28, time=1, job_steps=1, cpu_bind=True)
+    text = sp.read_text()
+    slots = layout.packedLayout("mn5_gpp", jobs_per_node=4, ranks_per_job=1, threads_per_rank=28)
+    assert "SLOTS_PER_NODE=4\n" in text and "MAX_STEPS=$(( SLOTS_PER_NODE * 2 ))" in text
+    assert "SLOT_RANK_MASKS=(" + " ".join(s["cpu_bind"] for s in slots) + ")" in text
+    assert "--overlap" in text and "--exclusive" not in text
+    subprocess.run(["bash", str(sp)], check=True)
+
+    masks, hosts = {s["cpu_bind"] for s in slots}, []
+    for i in range(10):
+        log = (tmp_path / f"bound_step{i + 1:02d}_7.out").read_text().split("\n")
+        assert log[0].startswith("--nodelist=node") and log[1][len("--cpu-bind="):] in masks
+        hosts.append(log[0])
+        assert log[-2] == f"step{i}"
+    # the first 8 steps fill both nodes, the last 2 reuse freed slots
+    assert sorted(hosts[:8]) == ["--nodelist=node1"] * 4 + ["--nodelist=node2"] * 4
+
+    with pytest.raises(ValueError):                       # not whole nodes
+        mn5.jobArrays(jobs=jobs, script_name=str(sp), job_name="bound", partition="gp_bscls", ntasks=4,
+                      nodes=2, cpus_per_task=28, time=1, job_steps=1, cpu_bind=True)
+
+
+def test_mps_whole_node_slots(tmp_path, monkeypatch):
+    """mps=2 on a whole ACC node (gpus=4): 8 processes, each on a NUMA-local slot and GPU."""
+    monkeypatch.chdir(tmp_path)
+    sp = tmp_path / "run.sh"
+    mn5.jobArrays(jobs=[f"python3 run.py {i}" for i in range(8)], script_name=str(sp), job_name="mps",
+                  partition="acc_bscls", gpus=4, time=1, mps=2, cpu_bind=True)
+    text = sp.read_text()
+    shape = layout.NODE_SHAPES["mn5_acc"]
+    for slot in layout.packedLayout("mn5_acc", jobs_per_node=8):
+        assert f"taskset -pc {slot['cpu_list']} $BASHPID" in text
+        assert shape["gpu_numa"][int(slot["cuda_visible_devices"])] == slot["numa"]
+    assert text.count("CUDA_VISIBLE_DEVICES=") == 8
+    assert "taskset -pc 0-9 $BASHPID > /dev/null; export OMP_NUM_THREADS=10 OMP_PLACES={0}:10:1" in text
+    subprocess.run(["bash", "-n", str(sp)], check=True)
+    with pytest.raises(ValueError):                       # several GPUs without a whole-node layout
+        mn5.jobArrays(jobs=["a"], script_name=str(sp), job_name="j", partition="acc_bscls", gpus=4,
+                      time=1, mps=2)
@@ -0,0 +1,41 @@
+"""Tests for the licence-token aware launcher (licenses, nord4/amd license_tokens)."""
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import amd, licenses, nord4
+
+
+def test_license_run_queues_on_tokens(tmp_path):
+    server = licenses.writeFakeLicenseServer(str(tmp_path / "lic.sh"), total=4)
+    job = f"bash {server} checkout 2 || exit 9\nsleep 2\nbash {server} checkin 2\n"
+    script = tmp_path / "run.sh"
+    script.write_text(
+        "#!/bin/bash\n"
+        + licenses.licenseBlock(f"bash {server} free", poll=1, settle=1,
+                                lock_file=str(tmp_path / "lock"), log_file=str(tmp_path / "usage.tsv"))
+        + "".join("( " + licenses.licenseCommand(job, 2).rstrip("\n") + " ) &\n" for _ in range(3))
+        + "wait\n"
+    )
+    subprocess.run(["bash", str(script)], check=True, timeout=30)
+    report = licenses.licenseReport(str(tmp_path / "usage.tsv"))
+    # two commands fit the 4 tokens, the third waits for a checkin instead of failing
+    assert report["commands"] == 3 and report["failed"] == 0
+    assert report["peak_tokens"] == 4 and report["wait_max_s"] >= 1
+    assert (tmp_path / "lic.sh.state").read_text() == "4\n"
+
+
+def test_generators_wrap_the_jobs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    jobs = ["glidex -i 'a b.in'\n", "glide c.in\n"]
+    nord4.jobArrays(jobs, script_name="n.sh", job_name="g", program="schrodinger", license_tokens=8,
+                    license_counter="echo 100")
+    amd.jobArrays(jobs, script_name="a.sh", job_name="g", license_tokens=8)
+    for name in ("n.sh", "a.sh"):
+        text = (tmp_path / name).read_text()
+        assert "license_run() {" in text
+        assert "license_run 8 'glidex -i '\"'\"'a b.in'\"'\"''\n" in text
+        subprocess.run(["bash", "-n", name], check=True)
+    assert "license_free() { echo 100; }" in (tmp_path / "n.sh").read_text()
+    assert "licadmin STAT" in (tmp_path / "a.sh").read_text()
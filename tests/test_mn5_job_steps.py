@@ -0,0 +1,94 @@
+"""Tests for mn5.jobArrays(job_steps=...): srun job-step packing in one allocation."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import mn5
+
+
+def _read_script(script_path):
+    with open(script_path) as fh:
+        return fh.read()
+
+
+def test_job_steps_single_allocation(tmp_path, monkeypatch):
+    """job_steps=8 writes ONE job (no array) whose body launches each job as an
+    exclusive 8-rank srun step under a wait -n slot scheduler."""
+    monkeypatch.chdir(tmp_path)
+    sp = tmp_path / "run.sh"
+    jobs = [f"cd run_{i} && SRUN_STEP cp2k.psmp -i md.inp -o md.out" for i in range(6)]
+    mn5.jobArrays(jobs=jobs, script_name=str(sp), job_name="steps", partition="gp_bscls",
+                  ntasks=224, nodes=2, cpus_per_task=1, time=12, program="cp2k", job_steps=8)
+    text = _read_script(sp)
+    assert "--array" not in text
+    assert "#SBATCH --nodes=2\n" in text
+    assert "#SBATCH --ntasks 224\n" in text
+    assert "#SBATCH --output=steps_%j.out" in text
+    assert "MAX_STEPS=$(( SLURM_NTASKS / 8 ))" in text
+    assert "wait -n" in text
+    assert text.count("step_slot\n(") == 6
+    assert text.count("srun --exclusive --nodes=1 --ntasks=8 --cpus-per-task=1") == 6
+    assert "SRUN_STEP" not in text
+    assert "SLURM_ARRAY_TASK_ID" not in text
+    subprocess.run(["bash", "-n", str(sp)], check=True)
+
+
+def test_job_steps_self_launching_orca(tmp_path, monkeypatch):
+    """Commands without SRUN_STEP (ORCA spawns its own mpirun) run in a one-task step
+    owning job_steps cores, with oversubscription allowed for the nested mpirun."""
+    monkeypatch.chdir(tmp_path)
+    sp = tmp_path / "run.sh"
+    jobs = ["cd qmmm_1 && ${ORCA_BIN} system.inp > system.out",
+            "cd qmmm_2 && ${ORCA_BIN} system.inp > system.out"]
+    mn5.jobArrays(jobs=jobs, script_name=str(sp), job_name="orca", partition="gp_bscls",
+                  ntasks=16, cpus_per_task=1, time=12, program="orca", job_steps=8)
+    text = _read_script(sp)
+    assert "srun --exclusive --nodes=1 --ntasks=1 --cpus-per-task=$(( 8 * 1 ))" in text
+    assert "OMPI_MCA_rmaps_base_oversubscribe=1" in text
+    assert "bash -c 'cd qmmm_1 && ${ORCA_BIN} system.inp > system.out'" in text
+    subprocess.run(["bash", "-n", str(sp)], check=True)
+
+
+def test_job_steps_guards(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sp = tmp_path / "run.sh"
+    kwargs = dict(jobs=["a", "b"], script_name=str(sp), job_name="j", partition="gp_bscls", time=1)
+    for bad in (0, -2, 1.5, True):
+        with pytest.raises(ValueError):
+            mn5.jobArrays(ntasks=8, job_steps=bad, **kwargs)
+    with pytest.raises(ValueError):                       # ntasks not a multiple of the step size
+        mn5.jobArrays(ntasks=12, job_steps=8, **kwargs)
+    with pytest.raises(ValueError):                       # exclusive with sequential grouping
+        mn5.jobArrays(ntasks=16, job_steps=8, group_jobs_by=2, **kwargs)
+
+
+def test_job_steps_exit_code_and_program_rewrites(tmp_path, monkeypatch):
+    """A failed step makes the script exit non-zero; preset job rewrites still apply."""
+    monkeypatch.chdir(tmp_path)
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "srun").write_text('#!/bin/bash\nwhile [[ $1 == --* ]]; do shift; done\nexec "$@"\n')
+    (bin_dir / "srun").chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("SLURM_NTASKS", "2")
+    monkeypatch.setenv("SLURM_JOB_ID", "1")
+    sp = tmp_path / "run.sh"
+    kwargs = dict(script_name=str(sp), job_name="steps", partition="gp_bscls", ntasks=2,
+                  time=1, job_steps=1)
+    mn5.jobArrays(jobs=["SRUN_STEP true", "SRUN_STEP false", "SRUN_STEP true"], **kwargs)
+    run = subprocess.run(["bash", str(sp)], capture_output=True, text=True)
+    assert run.returncode == 1
+    assert "1 job step(s) failed" in run.stderr
+
+    mn5.jobArrays(jobs=["SRUN_STEP true"] * 3, **kwargs)
+    assert subprocess.run(["bash", str(sp)]).returncode == 0
+
+    mn5.jobArrays(jobs=["python SCRIPT_PATH/run_inference.py"], program="RFDiffusion",
+                  script_name=str(sp), job_name="rfd", partition="acc_bscls", gpus=1,
+                  ntasks=1, time=1, job_steps=1)
+    text = _read_script(sp)
+    assert "SCRIPT_PATH" not in text
+    assert "/gpfs/projects/bsc72/RFdiffusion/scripts/run_inference.py" in text
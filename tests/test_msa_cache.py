@@ -0,0 +1,83 @@
+"""Tests for the content-addressed MSA cache (msa_cache)."""
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import mn5, msa_cache
+
+
+def test_dedup_search_and_rewrite(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = str(tmp_path / "cache")
+    seqs = {"a": "MKTAYIAK", "b": "mkta yiak", "c": "GSHMLE", "d": "MKTAYIAK"}
+    jobs, paths = msa_cache.setUpMSACache(seqs, cache, "/dbs/colabfold", chunk_size=1)
+    # "b" normalizes to "a": two unique MSAs, one search job each
+    assert len(jobs) == 2
+    assert paths["MKTAYIAK"] == paths["mkta yiak"]
+
+    # fake colabfold_search: one <query number>.a3m per query, not named after the header
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "colabfold_search").write_text(
+        "#!/bin/bash\nmkdir -p $3\n"
+        "awk '/^>/ {f=\"'$3'/\" n++ \".a3m\"; print \">101\" > f; next} "
+        "{print > f; print \">hit\\nMKTAYIAKQ\" > f}' $1\n"
+    )
+    (bin_dir / "colabfold_search").chmod(0o755)
+    env = dict(os.environ, PATH=f"{bin_dir}:{os.environ['PATH']}", SLURM_JOB_ID="1", SLURM_CPUS_PER_TASK="2")
+    for job in jobs:
+        subprocess.run(["bash", "-c", job], check=True, env=env)
+    assert all(os.path.exists(p) for p in paths.values())
+    assert sorted(os.listdir(cache)) == sorted({os.path.basename(p)[:2] for p in paths.values()})
+
+    # cached now: nothing left to search
+    assert msa_cache.setUpMSACache(seqs, cache, "/dbs/colabfold")[0] == []
+
+    jobs = msa_cache.useCachedMSAs(["python -m bioemu.sample --sequence MKTAYIAK --num_samples 10"], paths)
+    assert jobs == [f"python -m bioemu.sample --sequence {paths['MKTAYIAK']} --num_samples 10"]
+    # only the --sequence value is rewritten, not paths that contain the sequence
+    job = "python -m bioemu.sample --sequence=MKTAYIAK --output_dir out/MKTAYIAK"
+    assert msa_cache.useCachedMSAs([job], paths) == [
+        f"python -m bioemu.sample --sequence={paths['MKTAYIAK']} --output_dir out/MKTAYIAK"
+    ]
+
+
+def test_key_depends_on_database():
+    assert msa_cache.msaKey("MKT") != msa_cache.msaKey("MKT", database="uniref30_2403")
+
+
+def test_alphafold3_inputs_read_the_cache(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    path = msa_cache.cachedMSA("cache", "MKTAYIAK")
+    os.makedirs(os.path.dirname(path))
+    open(path, "w").write(">101\nMKTAYIAK\n>hit\nMKTAYIAQ\n")
+    (tmp_path / "x.json").write_text(json.dumps({"name": "x", "sequences": [
+        {"protein": {"id": "A", "sequence": "MKTAYIAK", "templates": [{"mmcif": "x"}]}},
+        {"protein": {"id": "B", "sequence": "GSHMLE"}},
+        {"ligand": {"id": "L", "ccdCodes": ["ATP"]}},
+    ]}))
+    new, = msa_cache.alphafold3UseCachedMSAs(["x.json"], "cache")
+    chain_a, chain_b = (entry["protein"] for entry in json.load(open(new))["sequences"][:2])
+    assert chain_a["unpairedMsa"] == open(path).read()
+    assert chain_a["pairedMsa"] == "" and chain_a["templates"] == []
+    assert chain_b == {"id": "B", "sequence": "GSHMLE"}
+    assert "1 protein chain(s) have no cached MSA" in capsys.readouterr().out
+
+
+def test_bioemu_preset_reads_the_cache(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    cache = str(tmp_path / "cache")
+    path = msa_cache.cachedMSA(cache, "MKTAYIAK")
+    os.makedirs(os.path.dirname(path))
+    open(path, "w").write(">101\nMKTAYIAK\n")
+    kwargs = dict(script_name="run.sh", job_name="b", partition="acc_bscls", program="bioemu", msa_cache=cache)
+    mn5.jobArrays(["python -m bioemu.sample --sequence MKTAYIAK --num_samples 10",
+                   "python -m bioemu.sample --sequence GSHMLE --num_samples 10"], **kwargs)
+    text = open("run.sh").read()
+    assert f"--sequence {path} --num_samples" in text and "--sequence GSHMLE" in text
+    assert "1 sequence(s) have no cached MSA" in capsys.readouterr().out
+
+    mn5.jobArrays(["MKTAYIAK", "GSHMLE"], inference_batch=2, **kwargs)
+    assert repr(path) in open("run.sh").read()
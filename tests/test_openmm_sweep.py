@@ -0,0 +1,47 @@
+"""Tests for openmm parameter sweeps and parameter-table driven job arrays."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import mn5
+
+
+def test_sweep_product_zip_and_dedup():
+    cmds = list(mn5.openmmSweep("s.prmtop", "s.rst7", temperature=[300, 310, 300], seed=range(2)))
+    assert len(cmds) == 4
+    assert cmds[0] == "python openmm_simulation.py s.prmtop s.rst7 100 --temperature 300 --seed 0"
+
+    zipped = list(mn5.openmmSweep(["a.prmtop", "b.prmtop"], ["a.rst7", "b.rst7"],
+                                  work_dir=["a", "b"], mode="zip"))
+    assert zipped == [
+        "cd a && python openmm_simulation.py a.prmtop a.rst7 100",
+        "cd b && python openmm_simulation.py b.prmtop b.rst7 100",
+    ]
+    with pytest.raises(ValueError):
+        list(mn5.openmmSweep(["a", "b"], ["a"], mode="zip"))
+
+
+def test_sweep_table_drives_array(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "sim.py").write_text("import sys\nprint(' '.join(sys.argv[1:]))\n")
+    template = mn5.openmmSweepTable("sweep.tsv", "s.prmtop", "s.rst7",
+                                    simulation_script="sim.py", temperature=[300, 310], seed=[1, 2, 3])
+    assert template == "python sim.py s.prmtop s.rst7 100 --temperature {temperature} --seed {seed}"
+    assert (tmp_path / "sweep.tsv").read_text().splitlines()[:2] == ["temperature\tseed", "300\t1"]
+
+    template = template.replace("python", sys.executable)
+    mn5.jobArrays([template + " > out_$SLURM_ARRAY_TASK_ID"], script_name="run.sh", job_name="t",
+                  partition="gp_bscls", time=1, parameter_table="sweep.tsv")
+    text = (tmp_path / "run.sh").read_text()
+    assert "#SBATCH --array=1-6\n" in text
+    assert "$SLURM_ARRAY_TASK_ID = " not in text
+
+    subprocess.run(["bash", "run.sh"], check=True, env=dict(os.environ, SLURM_ARRAY_TASK_ID="5"))
+    assert (tmp_path / "out_5").read_text() == "s.prmtop s.rst7 100 --temperature 310 --seed 2\n"
+
+    with pytest.raises(ValueError):
+        mn5.jobArrays(["run {missing}"], script_name="run.sh", job_name="t",
+                      partition="gp_bscls", time=1, parameter_table="sweep.tsv")
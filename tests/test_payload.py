@@ -0,0 +1,62 @@
+"""Tests for compressed job payloads (mn5.jobArrays(job_payload=...))."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import core, mn5, payload, tables
+
+
+def _run_task(task):
+    subprocess.run(["bash", "run.sh"], check=True, env=dict(os.environ, SLURM_ARRAY_TASK_ID=str(task)))
+
+
+def test_payload_frames_and_index(tmp_path):
+    jobs = [f"echo {i}\n" for i in range(10)]
+    assert payload.writeJobPayload(jobs, str(tmp_path / "p.gz"), jobs_per_frame=4) == 10
+    # size, three frame offsets, end
+    assert (tmp_path / "p.gz.idx").stat().st_size == 5 * tables.INDEX_WIDTH
+    for task in (1, 4, 5, 10):
+        assert payload.readJobPayload(str(tmp_path / "p.gz"), task, jobs_per_frame=4) == jobs[task - 1]
+    with pytest.raises(ValueError):
+        payload.writeJobPayload(["a\0b"], str(tmp_path / "q.gz"))
+    with pytest.raises(ValueError):
+        payload.writeJobPayload(jobs, str(tmp_path / "q.gz"), codec="lz4")
+
+
+def test_array_tasks_run_their_own_job(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    jobs = core.JobBatch(f"cd dir_{i}\necho 'job {i}' > ../out_$SLURM_ARRAY_TASK_ID\ncd ..\n" for i in range(7))
+    for i in range(7):
+        (tmp_path / f"dir_{i}").mkdir()
+    mn5.jobArrays(jobs, script_name="run.sh", job_name="t", partition="gp_bscls", time=1,
+                  job_payload=True, payload_jobs_per_frame=3)
+    text = (tmp_path / "run.sh").read_text()
+    assert "#SBATCH --array=1-7\n" in text and "job 3" not in text
+    subprocess.run(["bash", "-n", "run.sh"], check=True)
+    for task in (1, 3, 4, 7):
+        _run_task(task)
+        assert (tmp_path / f"out_{task}").read_text() == f"job {task - 1}\n"
+
+    with open(tmp_path / "t_jobs.gz", "ab") as pf:
+        pf.write(b"x")
+    with pytest.raises(subprocess.CalledProcessError):
+        _run_task(2)
+
+
+def test_payload_next_to_script(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "scripts").mkdir()
+    mn5.jobArrays(["echo a > out_a\n"], script_name="scripts/run.sh", job_name="t", partition="gp_bscls",
+                  time=1, job_payload=True)
+    assert (tmp_path / "scripts" / "t_jobs.gz").exists() and not (tmp_path / "t_jobs.gz").exists()
+    subprocess.run(["bash", "scripts/run.sh"], check=True, env=dict(os.environ, SLURM_ARRAY_TASK_ID="1"))
+    assert (tmp_path / "out_a").read_text() == "a\n"
+    with pytest.raises(ValueError):
+        mn5.jobArrays(["a", "b"], script_name="run.sh", job_name="t", partition="gp_bscls", time=1,
+                      ntasks=8, job_steps=8, job_payload=True)
+    with pytest.raises(ValueError):
+        mn5.jobArrays(["echo {x}"], script_name="run.sh", job_name="t", partition="gp_bscls", time=1,
+                      parameter_table=[{"x": 1}], job_payload=True)
@@ -0,0 +1,62 @@
+"""Tests for MPI-rank-aware PELE packing (setUpPELEForNord4 / setUpPELEForMarenostrum(pack=True))."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import mn5, nord4, packing
+
+
+def _pele_jobs(tmp_path, cpus):
+    jobs = []
+    for i, n in enumerate(cpus):
+        folder = tmp_path / "pele" / f"sys{i}"
+        folder.mkdir(parents=True)
+        (folder / "input.yaml").write_text(f"system: sys.pdb\ncpus: {n}\nseed: 1\n")
+        jobs.append(f"cd pele/sys{i}\npython -m pele_platform.main input.yaml\ncd ../..\n")
+    return jobs
+
+
+def test_pele_cpus_and_node_packing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    jobs = _pele_jobs(tmp_path, [48, 30, 64, 20])
+    assert [packing.peleCpus(j) for j in jobs] == [48, 30, 64, 20]
+    assert packing.peleCpus("mpirun -np 12 PELE conf.json") == 12
+    assert packing.peleCpus("echo nothing", default=96) == 96
+    assert packing.packNodes([48, 30, 64, 20], 96) == [[2, 1], [0, 3]]
+    with pytest.raises(ValueError):
+        packing.packNodes([128], 112)
+
+
+@pytest.mark.parametrize("cluster", ["mn5", "nord4"])
+def test_pele_runs_packed_as_steps(tmp_path, monkeypatch, cluster):
+    monkeypatch.chdir(tmp_path)
+    jobs = _pele_jobs(tmp_path, [48, 30, 64, 20])
+    if cluster == "mn5":
+        mn5.setUpPELEForMarenostrum(jobs, pack=True, time=4)
+        nodes_line, ntasks_line = "#SBATCH --nodes=2\n", "#SBATCH --ntasks 224\n"
+        plan = ((64, 0), (48, 0), (30, 1), (20, 1))
+    else:
+        nord4.setUpPELEForNord4(jobs, pack=True, time=4)
+        nodes_line, ntasks_line = "#SBATCH --nodes=2\n", "#SBATCH --ntasks 192\n"
+        plan = ((64, 0), (30, 0), (48, 1), (20, 1))
+    assert open("pele_slurm.sh").read().count("sbatch") == 1
+    text = (tmp_path / "pele_slurm_scripts" / "pele_slurm_packed.sh").read_text()
+    subprocess.run(["bash", "-n", "pele_slurm_scripts/pele_slurm_packed.sh"], check=True)
+    assert nodes_line in text and ntasks_line in text
+    # every run is pinned to its node in the packNodes plan
+    for n, node in plan:
+        assert (f"--nodelist=${{STEP_HOSTS[{node}]}} --ntasks=1 "
+                f"--cpus-per-task=$(( {n} * ${{SLURM_CPUS_PER_TASK:-1}} ))") in text
+    assert 'STEP_HOSTS=($(scontrol show hostnames "$SLURM_JOB_NODELIST"))' in text
+    assert "pele_platform.main input.yaml" in text
+
+    # a second campaign gets its own packed script
+    if cluster == "mn5":
+        mn5.setUpPELEForMarenostrum(jobs[:2], general_script="second.sh", pack=True, time=4)
+    else:
+        nord4.setUpPELEForNord4(jobs[:2], general_script="second.sh", pack=True, time=4)
+    assert (tmp_path / "pele_slurm_scripts" / "second_packed.sh").exists()
+    assert (tmp_path / "pele_slurm_scripts" / "pele_slurm_packed.sh").read_text() == text
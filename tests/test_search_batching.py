@@ -0,0 +1,43 @@
+"""Tests for BLAST/HMMER query batching (search_batching)."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import search_batching
+
+
+def test_chunks_are_balanced_and_deduplicated(tmp_path):
+    queries = {f"q{i}": "A" * (10 * (i % 7 + 1)) + "C" * i for i in range(40)}
+    queries["dup"] = queries["q3"]
+    chunks, members = search_batching.batchQueries(queries, n_chunks=4, chunk_dir=str(tmp_path))
+    assert members["q3"] == ["q3", "dup"]
+    loads = [sum(len(s) for _, s in search_batching.readFasta(c)) for c in chunks]
+    assert len(chunks) == 4 and max(loads) - min(loads) <= max(len(s) for s in queries.values())
+    names = [n for c in chunks for n, _ in search_batching.readFasta(c)]
+    assert sorted(names) == sorted(set(queries) - {"dup"})
+
+    jobs = search_batching.searchJobs(chunks)
+    assert jobs[0].startswith(f"blastp -query {chunks[0]} -db $TREMBL_DB -outfmt 6")
+    with pytest.raises(ValueError):
+        search_batching.searchJobs(chunks, tool="hmmer")
+
+
+def test_results_split_back_per_query(tmp_path):
+    members = {"a": ["a", "a_copy"], "b": ["b"]}
+    blast = tmp_path / "chunk_1.tsv"
+    blast.write_text("a\tsp|X\t99.0\nb\tsp|Y\t50.0\na\tsp|Z\t40.0\n")
+    out = search_batching.splitResults([str(blast)], members, str(tmp_path / "out"))
+    assert open(os.path.join(out, "a.tsv")).read() == "a\tsp|X\t99.0\na\tsp|Z\t40.0\n"
+    assert open(os.path.join(out, "a_copy.tsv")).read() == "a_copy\tsp|X\t99.0\na_copy\tsp|Z\t40.0\n"
+    assert open(os.path.join(out, "b.tsv")).read() == "b\tsp|Y\t50.0\n"
+
+    hmmer = tmp_path / "chunk_2.tsv"
+    hmmer.write_text("# header\ntr|T1  -  b  -  1e-10  50.0\n")
+    out = search_batching.splitResults([str(hmmer)], members, str(tmp_path / "hmm"), tool="hmmer")
+    assert open(os.path.join(out, "b.tsv")).read().startswith("tr|T1")
+    assert open(os.path.join(out, "a.tsv")).read() == ""
+    members = {"b": ["b", "b2"]}
+    out = search_batching.splitResults([str(hmmer)], members, str(tmp_path / "hmm2"), tool="hmmer")
+    assert open(os.path.join(out, "b2.tsv")).read() == "tr|T1  -  b2  -  1e-10  50.0\n"
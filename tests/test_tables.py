@@ -0,0 +1,76 @@
+"""Tests for parameter-table driven job arrays (mn5.jobArrays(parameter_table=...))."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import mn5, tables
+
+
+def _run_task(task):
+    subprocess.run(["bash", "run.sh"], check=True, env=dict(os.environ, SLURM_ARRAY_TASK_ID=str(task)))
+
+
+def test_csv_table_rows_and_empty_fields(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "params.csv").write_text('name,args,seed\nA,"-x 1, -y",7\nB,,8\n\nC,-z,9\n')
+    mn5.jobArrays(['echo "{name}|{args}|{seed}" > out_$SLURM_ARRAY_TASK_ID'], script_name="run.sh",
+                  job_name="t", partition="gp_bscls", time=1, parameter_table="params.csv")
+    assert "#SBATCH --array=1-3\n" in (tmp_path / "run.sh").read_text()
+    assert (tmp_path / "params.tsv.idx").stat().st_size == 4 * tables.INDEX_WIDTH
+    for task in (1, 2, 3):
+        _run_task(task)
+    assert (tmp_path / "out_1").read_text() == "A|-x 1, -y|7\n"
+    assert (tmp_path / "out_2").read_text() == "B||8\n"
+    assert (tmp_path / "out_3").read_text() == "C|-z|9\n"
+
+
+def test_in_memory_table_script_size_is_constant(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sizes = []
+    for n in (10, 1000):
+        mn5.jobArrays(["echo {0} {1} > out_$SLURM_ARRAY_TASK_ID"], script_name="run.sh", job_name="t",
+                      partition="gp_bscls", time=1, parameter_table=[[i, i * i] for i in range(n)])
+        text = (tmp_path / "run.sh").read_text()
+        sizes.append(len(text.replace(f"--array=1-{n}", "")))
+    assert sizes[0] == sizes[1]
+    _run_task(1000)
+    assert (tmp_path / "out_1000").read_text() == "999 998001\n"
+
+
+def test_edited_table_falls_back_to_scan(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    mn5.jobArrays(["echo {a} > out"], script_name="run.sh", job_name="t", partition="gp_bscls",
+                  time=1, parameter_table={"a": ["x", "y"]})
+    (tmp_path / "t_parameters.tsv").write_text("a\nlonger_x\nlonger_y\n")
+    _run_task(2)
+    assert (tmp_path / "out").read_text() == "longer_y\n"
+
+
+def test_shell_expansions_and_quoted_values(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a b.txt").write_text("")
+    (tmp_path / "c.txt").write_text("")
+    # ${...} is left to the shell; values with spaces or globs stay one word
+    mn5.jobArrays(['printf "%s\\n" {name} ${SLURM_ARRAY_TASK_ID} "{name}" \'{name}\' > out'],
+                  script_name="run.sh", job_name="t", partition="gp_bscls", time=1,
+                  parameter_table={"name": ["a b.txt", "*.txt"]})
+    _run_task(1)
+    assert (tmp_path / "out").read_text() == "a b.txt\n1\na b.txt\na b.txt\n"
+    _run_task(2)
+    assert (tmp_path / "out").read_text() == "*.txt\n2\n*.txt\n*.txt\n"
+
+
+def test_table_is_written_next_to_the_script(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "scripts").mkdir()
+    mn5.jobArrays(["echo {a}"], script_name="scripts/run.sh", job_name="t", partition="gp_bscls",
+                  time=1, parameter_table={"a": ["x", "y"]})
+    assert (tmp_path / "scripts" / "t_parameters.tsv").exists()
+    assert not (tmp_path / "t_parameters.tsv").exists()
+    with pytest.raises(ValueError):
+        mn5.jobArrays(["echo {a}"], script_name="run.sh", partition="gp_bscls", time=1,
+                      parameter_table={"a": ["x"]})
+    assert not (tmp_path / "None_parameters.tsv").exists()
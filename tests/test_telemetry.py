@@ -0,0 +1,83 @@
+"""Tests for opt-in per-task telemetry (mn5.jobArrays(telemetry=...) + aggregator)."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import mn5, telemetry
+
+
+def test_telemetry_block_emitted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sp = tmp_path / "run.sh"
+    mn5.jobArrays(jobs=["python3 run.py"], script_name=str(sp), job_name="t",
+                  partition="acc_bscls", gpus=1, time=1, program="openmm", telemetry=10)
+    text = sp.read_text()
+    assert "# program=openmm" in text
+    assert "nvidia-smi --query-gpu=utilization.gpu,memory.used" in text
+    assert "sleep 10; done ) &" in text
+    assert "trap 'kill $TELEMETRY_PID" in text
+    # sampler starts before the per-task dispatch
+    assert text.index("TELEMETRY_PID=$!") < text.index("if [[ $SLURM_ARRAY_TASK_ID = 1 ]]")
+    subprocess.run(["bash", "-n", str(sp)], check=True)
+
+
+def test_telemetry_off_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sp = tmp_path / "run.sh"
+    mn5.jobArrays(jobs=["a"], script_name=str(sp), job_name="t", partition="gp_bscls", time=1)
+    assert "TELEMETRY" not in sp.read_text()
+    for bad in (0, -5, "10", 2.5):
+        with pytest.raises(ValueError):
+            mn5.jobArrays(jobs=["a"], script_name=str(sp), job_name="t", partition="gp_bscls",
+                          time=1, telemetry=bad)
+
+
+def test_sampler_runs_and_aggregates(tmp_path):
+    """Run the sampler for a short busy task and aggregate the CSV it writes."""
+    script = tmp_path / "task.sh"
+    script.write_text(
+        telemetry.samplerBlock(str(tmp_path / "tdir"), 1, "hmmer")
+        + "end=$((SECONDS + 2)); while [ $SECONDS -lt $end ]; do :; done\n"
+    )
+    env = dict(os.environ, SLURM_JOB_NAME="t", SLURM_ARRAY_TASK_ID="1", SLURM_ARRAY_JOB_ID="5",
+               SLURM_CPUS_ON_NODE="1", SLURM_MEM_PER_CPU="1000")
+    subprocess.run(["bash", str(script)], check=True, env=env, cwd=tmp_path)
+    metadata, samples = telemetry.readTelemetry(tmp_path / "tdir" / "t_1_5.csv")
+    assert metadata["program"] == "hmmer"
+    assert len(samples) >= 2
+    summary = telemetry.summarizeTelemetry(str(tmp_path / "tdir"))
+    assert summary["hmmer"]["tasks"] == 1
+    assert 0 < summary["hmmer"]["cpu_efficiency"]["mean"] <= 1.5
+    assert "hmmer" in telemetry.telemetryReport(summary)
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_sampler_does_not_block_packed_jobs(tmp_path, monkeypatch, concurrency):
+    """The background sampler must not take a bundle slot nor hold the final wait."""
+    monkeypatch.chdir(tmp_path)
+    mn5.jobArrays(["echo a > a.txt\n", "echo b > b.txt\n"], script_name="t.sh", job_name="t",
+                  partition="gp_bscls", time=1, telemetry=1, concurrency=concurrency, group_jobs_by=2)
+    env = dict(os.environ, SLURM_JOB_NAME="t", SLURM_ARRAY_TASK_ID="1", SLURM_ARRAY_JOB_ID="5")
+    result = subprocess.run(["timeout", "20", "bash", "t.sh"], env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert (tmp_path / "a.txt").exists() and (tmp_path / "b.txt").exists()
+
+
+def test_summary_per_program(tmp_path):
+    rows = "time,cpu_seconds,rss_kb,read_bytes,write_bytes,gpu_util,gpu_mem_mb\n"
+    (tmp_path / "a_1_1.csv").write_text(
+        "# program=openmm cpus=20 mem_per_cpu_mb=2000 gpus=1\n" + rows
+        + "0,0,1024,0,0,40.0,1000\n100,500,2048000,0,2000000000,60.0,3000\n")
+    (tmp_path / "b_1_1.csv").write_text(
+        "# program=blast cpus=4 mem_per_node_mb=8000\n" + rows
+        + "0,0,1024,0,0,,\n100,400,4096000,1000000000,0,,\n")
+    summary = telemetry.summarizeTelemetry(str(tmp_path))
+    assert summary["openmm"]["cpu_efficiency"]["mean"] == pytest.approx(0.25)
+    assert summary["openmm"]["gpu_util"]["mean"] == pytest.approx(50.0)
+    assert summary["openmm"]["peak_gpu_mem_mb"]["max"] == 3000
+    assert summary["blast"]["cpu_efficiency"]["mean"] == pytest.approx(1.0)
+    assert summary["blast"]["mem_efficiency"]["mean"] == pytest.approx(0.5)
+    assert "gpu_util" not in summary["blast"]
@@ -0,0 +1,59 @@
+"""Tests for budget-driven array throttles (throttle and the jobArrays throttle argument)."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import amd, mn5, nord4, throttle
+
+
+def test_array_throttle():
+    assert throttle.arrayThrottle(None, 10) is None
+    assert throttle.arrayThrottle(4, 10) == 4
+    assert throttle.arrayThrottle(12, 10) is None
+    assert throttle.arrayThrottle({"licenses": 40, "io_streams": 16}, 100, {"licenses": 8}) == 5
+    assert throttle.arraySuffix({"io_streams": 16}, 100) == "%16"
+    with pytest.raises(ValueError):
+        throttle.arrayThrottle({"licenses": 4}, 10, {"licenses": 8})
+    with pytest.raises(ValueError):
+        throttle.arrayThrottle(0, 10)
+
+
+def test_generators_write_the_limit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    jobs = [f"echo {i}\n" for i in range(30)]
+    mn5.jobArrays(jobs, script_name="mn5.sh", job_name="h", partition="gp_bscls", time=1,
+                  program="hmmer", throttle={"io_streams": 16})
+    nord4.jobArrays(jobs, script_name="nord4.sh", job_name="s", throttle={"licenses": 40},
+                    throttle_demands={"licenses": 4})
+    amd.jobArrays(jobs, script_name="amd.sh", job_name="s", throttle=5)
+    assert "#SBATCH --array=1-30%16\n" in (tmp_path / "mn5.sh").read_text()
+    assert "#SBATCH --array=1-30%10\n" in (tmp_path / "nord4.sh").read_text()
+    assert "#SBATCH --array=1-30%5\n" in (tmp_path / "amd.sh").read_text()
+
+
+def test_monitor_updates_the_throttle(tmp_path):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "squeue").write_text(
+        "#!/bin/bash\n"
+        'if [[ \"$*\" == *RUNNING* ]]; then echo 1_1; echo 1_2; exit; fi\n'
+        'n=$(cat "$STATE" 2>/dev/null || echo 0); echo $(( n + 1 )) > "$STATE"\n'
+        "(( n < 2 )) && echo 1\n"
+        "exit 0\n"
+    )
+    (bin_dir / "scontrol").write_text('#!/bin/bash\necho "$*" >> "$LOG"\n')
+    for tool in ("squeue", "scontrol"):
+        (bin_dir / tool).chmod(0o755)
+    (tmp_path / "free").write_text("9\n")
+
+    monitor = throttle.writeThrottleMonitor(str(tmp_path / "monitor.sh"), f"cat {tmp_path / 'free'}",
+                                            demand=4, interval=0, max_throttle=50)
+    env = dict(os.environ, PATH=str(bin_dir) + os.pathsep + os.environ["PATH"],
+               STATE=str(tmp_path / "state"), LOG=str(tmp_path / "log"))
+    subprocess.run(["bash", monitor, "1"], check=True, env=env, capture_output=True, timeout=10)
+    # 2 running + 9 // 4 free, set once (unchanged on the second pass)
+    assert (tmp_path / "log").read_text() == "update JobId=1 ArrayTaskThrottle=4\n"
+    assert "GLIDE_MAIN:" in throttle.flexlmProbe("GLIDE_MAIN")
@@ -0,0 +1,123 @@
+"""Tests for multi-stage dependency workflows (workflow.Workflow)."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from bsc_calculations import mn5, workflow
+
+
+def _fake_sbatch(tmp_path):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    sbatch = bin_dir / "sbatch"
+    sbatch.write_text(
+        "#!/bin/bash\n"
+        'echo "$*" >> "$SBATCH_LOG"\n'
+        'n=$(wc -l < "$SBATCH_LOG")\n'
+        "echo $(( 100 + n ))\n"
+    )
+    sbatch.chmod(0o755)
+    return str(bin_dir)
+
+
+def test_workflow_dependencies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    common = dict(partition="gp_bscls", time=1)
+    wf = workflow.Workflow()
+    wf.addStage("prep", mn5.jobArrays, ["echo a", "echo b", "echo c"], script_name="prep.sh",
+                job_name="prep", **common)
+    wf.addStage("md", mn5.jobArrays, ["echo 1", "echo 2", "echo 3"], script_name="md.sh",
+                job_name="md", after="prep", **common)
+    wf.addStage("merge", mn5.singleJob, "echo merge", script_name="merge.sh", job_name="merge",
+                after=["prep", "md"], **common)
+    assert [p[2][:1] for p in wf.plan()] == [
+        [], ["--dependency=aftercorr:${PREP_JOB}"], ["--dependency=afterok:${PREP_JOB},afterok:${MD_JOB}"]
+    ]
+
+    submit = wf.writeSubmitScript("submit.sh")
+    subprocess.run(["bash", "-n", submit], check=True)
+    log = tmp_path / "sbatch.log"
+    env = dict(os.environ, PATH=_fake_sbatch(tmp_path) + os.pathsep + os.environ["PATH"], SBATCH_LOG=str(log))
+    subprocess.run(["bash", submit], check=True, env=env, capture_output=True)
+    assert log.read_text().splitlines() == [
+        "--parsable prep.sh",
+        "--parsable --dependency=aftercorr:101 --kill-on-invalid-dep=yes md.sh",
+        "--parsable --dependency=afterok:101,afterok:102 --kill-on-invalid-dep=yes merge.sh",
+    ]
+
+
+def test_workflow_validation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    common = dict(partition="gp_bscls", time=1)
+    wf = workflow.Workflow()
+    wf.addStage("a", mn5.jobArrays, ["echo 1", "echo 2"], script_name="a.sh", job_name="a", **common)
+    with pytest.raises(ValueError):
+        wf.addStage("b", mn5.jobArrays, ["echo 1"], script_name="b.sh", job_name="b", after="a", **common)
+    wf.addStage("b", "b.sh", after="a", per_task=False)
+    assert wf.plan()[1][2][0] == "--dependency=afterok:${A_JOB}"
+    with pytest.raises(ValueError):
+        wf.addStage("c", "b.sh", after="missing")
+    with pytest.raises(ValueError):
+        wf.addStage("A", "a.sh")
+
+
+def test_critical_path_schedule(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    common = dict(partition="gp_bscls", cpus_per_task=10)
+    (tmp_path / "sacct.txt").write_text(
+        "JobID|JobName|State|Elapsed|Timelimit|AllocCPUS|TotalCPU|MaxRSS|ReqMem\n"
+        "1_1|long|COMPLETED|04:00:00|10:00:00|10|1:00:00|1000K|2000Mc\n"
+        "1_2|long|COMPLETED|04:00:00|10:00:00|10|1:00:00|1000K|2000Mc\n"
+        "1_3|long|FAILED|00:01:00|10:00:00|10|1:00:00|1000K|2000Mc\n"
+    )
+    wf = workflow.Workflow()
+    wf.addStage("prep", mn5.jobArrays, ["echo 1"], script_name="prep.sh", job_name="prep", time=1, **common)
+    # history: 4 h/task, 4 tasks on 20 cores -> 2 waves -> 8 h
+    wf.addStage("long", mn5.jobArrays, ["echo 1"] * 4, script_name="long.sh", job_name="long", time=10,
+                after="prep", per_task=False, **common)
+    # cost: 0.5 h/task, 8 tasks -> 2 h alone, 6 h of slack
+    wf.addStage("short", mn5.jobArrays, ["echo 1"] * 8, script_name="short.sh", job_name="short", time=10,
+                after="prep", per_task=False, cost=0.5, **common)
+    wf.addStage("merge", mn5.singleJob, "echo merge", script_name="merge.sh", job_name="merge", time=2,
+                after=["long", "short"], **common)
+
+    schedule = wf.schedule(quota_cores=20, history="sacct.txt")
+    assert schedule["makespan_h"] == 1 + 8 + 2
+    assert schedule["long"]["source"] == "history" and schedule["prep"]["source"] == "walltime"
+    assert [n for n in ("prep", "long", "merge") if schedule[n]["critical"]] == ["prep", "long", "merge"]
+    assert schedule["short"]["slack_h"] == 6 and schedule["short"]["nice"] == 600
+    # 8 h window / 0.5 h per task = 16 waves: one task at a time suffices
+    assert schedule["short"]["throttle"] == 1
+    assert schedule["long"]["order"] < schedule["short"]["order"]
+
+    wf.writeSubmitScript("submit.sh", schedule=schedule)
+    text = (tmp_path / "submit.sh").read_text()
+    assert "--nice=600 --array=1-8%1 short.sh" in text
+    assert text.index("long.sh") < text.index("short.sh")
+
+
+def test_schedule_keeps_script_throttle(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    common = dict(partition="gp_bscls", cpus_per_task=10, time=10)
+    wf = workflow.Workflow()
+    # licence budget: at most 4 of the 100 tasks at once -> 25 waves of 0.1 h
+    wf.addStage("lic", mn5.jobArrays, ["echo 1"] * 100, script_name="lic.sh", job_name="lic",
+                throttle={"licenses": 4}, cost=0.1, **common)
+    wf.addStage("other", mn5.singleJob, "echo 2", script_name="other.sh", job_name="other",
+                cost=2.0, **common)
+    assert workflow.arrayLimit("lic.sh") == 4 and workflow.arrayRange("lic.sh") == (1, 100)
+
+    schedule = wf.schedule(quota_cores=1000)
+    assert schedule["lic"]["duration_h"] == pytest.approx(2.5)
+    assert schedule["lic"]["critical"] and not schedule["other"]["critical"]
+    assert schedule["lic"]["throttle"] is None
+    wf.writeSubmitScript("submit.sh", schedule=schedule)
+    assert "--array" not in (tmp_path / "submit.sh").read_text()
+
+    # with slack the schedule may lower the script's throttle, never raise it
+    wf.stages["other"]["cost"] = 5.0
+    schedule = wf.schedule(quota_cores=1000)
+    assert schedule["lic"]["throttle"] == 2